@@ -7,33 +7,164 @@ Created on Tue Jun  3 14:46:13 2025
 import streamlit as st
 import pandas as pd
 import re
-import io
-import zipfile
+from functools import partial
+from operator import itemgetter
+
+from data_cleaning.cache import content_hash, export_cache, export_key, frame_key, ingest_cache
+from data_cleaning.energy_box import EXCEL_COLUMNS, build_excel_frame, load_energy_box
+from data_cleaning.dtypes import bytes_saved, compact_frame, format_saved
+from data_cleaning.excel import EXCEL_MAX_ROWS, EXPORT_MIME, export_formats, export_frame, sheet_count, too_big_for_excel
+from data_cleaning.mappings import header_signature, mapping_store
+from data_cleaning.occupancy import WEEK_DAYS, compile_calendar
+from data_cleaning.opinum import (
+    SHARD_ROWS,
+    build_long_opinum,
+    build_opinum_zip,
+    long_opinum_names,
+    opinum_dates,
+    opinum_id_table,
+    read_opinum_entry,
+    zip_files,
+)
+from data_cleaning.profiling import StageRecorder, stage
+from data_cleaning.store import frame_store
+from data_cleaning.streaming import (
+    CHUNK_ROWS,
+    energy_box_columns,
+    stream_delta,
+    stream_energy_box_excel,
+    stream_energy_box_opinum,
+)
+from data_cleaning.watermark import delta_summary, describe_delta, distinct_watermarks, watermark_store
 
 st.title("Energy Box Data Cleaning")
 st.write("This page is designed to help you manage and analyze data from the Energy Box.")
 st.write("You can upload a CSV file downloaded from the Energy Box, select the data you want to import into Opinum, and download the cleaned data in the correct format.")
 st.write("You can also download an Excel file to be used for the Electricity analysis template.")
 
+# Per-stage timings of this run, shown in the sidebar "Performance" panel
+perf = StageRecorder("Energy Box").activate(st.session_state)
+perf_panel = st.sidebar.expander("Performance")
+perf.memory = perf_panel.checkbox("Track memory peaks (slower)", key="perf_memory")
+
+
+# Download payloads are built by these functions only when a button is
+# clicked, once per file content and export settings (see export_cache).
+def excel_export(df_cleaned, calendar, excel_format):
+    """
+    (file bytes, cells kept as text per column, bytes saved by compact dtypes)
+    of the Excel template export.
+    """
+    df_excel, unparsed_counts = build_excel_frame(df_cleaned, calendar)
+    df_excel = compact_frame(df_excel)
+    return export_frame(df_excel, excel_format), unparsed_counts, bytes_saved(df_excel)
+
+
+def streamed_excel_export(uploaded_file, calendar):
+    data, unparsed_counts = stream_energy_box_excel(uploaded_file, calendar)
+    return data, unparsed_counts, None
+
+
+def opinum_zip(df_cleaned, dates, dates_key, entries, masks=None):
+    """
+    Bytes of the ZIP of every column's Opinum file. dates are the parsed
+    dates of an incremental export, else the formatted dates cached under
+    dates_key are used.
+    """
+    if dates is None:
+        dates = opinum_dates(df_cleaned["date"], ingest_cache, dates_key)
+    return build_opinum_zip(
+        dates,
+        [(entry_name, df_cleaned[col], source_id, variable_id) for col, entry_name, source_id, variable_id in entries],
+        masks=masks
+    ).getvalue()
+
+
+def streamed_opinum_zip(uploaded_file, entries, watermarks):
+    """
+    (ZIP written to disk, rows written per entry, last timestamp written per
+    entry); single entries are read back from the file.
+    """
+    return stream_energy_box_opinum(uploaded_file, entries, watermarks=watermarks)
+
+
+def spilled_zip(payload):
+    return payload[0].getvalue()
+
+
+def zip_entry(payload, entry_name, select=None):
+    return read_opinum_entry(payload if select is None else select(payload), entry_name)
+
+
+def long_opinum_export(df_cleaned, dates, dates_key, id_table, file_name, masks=None):
+    """
+    Bytes of the long-format Opinum file, or of the ZIP of its parts when
+    it is split.
+    """
+    if dates is None:
+        dates = opinum_dates(df_cleaned["date"], ingest_cache, dates_key)
+    files = build_long_opinum(dates, df_cleaned, id_table, masks)
+    if len(files) == 1:
+        return files[0]
+    return zip_files(list(zip(long_opinum_names(file_name, len(files)), files))).getvalue()
+
+
+def mark_exported(exports):
+    """
+    Download callback of incremental mode: move each (source_id, variable_id)
+    watermark to the last timestamp of the rows just downloaded.
+    """
+    for source_id, variable_id, last in exports:
+        watermark_store.advance(source_id, variable_id, last)
+
+
+def forget_profile(page, layout, keys):
+    """
+    Delete the saved profile of a layout and clear its fields, so they are
+    not saved again right away.
+    """
+    mapping_store.forget(page, layout)
+    for key in keys:
+        st.session_state.pop(key, None)
+
+
 # Load the CSV
 used_in_opinum = st.checkbox("The data will be used in Opinum")
 used_in_excel = st.checkbox("The data will be used in excel")
 
 uploaded_file = st.file_uploader("Choose a file")
+streaming = st.checkbox(
+    "Streaming mode for very large files",
+    help=f"Process the file in chunks of {CHUNK_ROWS:,} rows instead of loading it all at once."
+)
+incremental = st.checkbox(
+    "Incremental mode for rolling exports",
+    help="Only export the rows after the last timestamp downloaded for each Source ID / Variable ID, "
+         "so files overlapping an earlier export do not duplicate it in Opinum."
+)
 
 if uploaded_file is not None:
-    # Can be used wherever a "file-like" object is accepted:
-    dataframe = pd.read_csv(uploaded_file,skiprows=[0])
-    df = dataframe
-
-    # Clean the DataFrame
-    df_cleaned = df.drop(columns=['No.'])
-    df_cleaned = df_cleaned.iloc[:, :-1]
-    df_cleaned = df_cleaned.rename(columns={"Time Stamp": "date"})
-    # Remove '(float)' from all column names
-    df_cleaned.columns = df_cleaned.columns.str.replace('(float)', '', regex=False).str.strip()
+    if streaming:
+        # Only the header is read here; the data is processed chunk by chunk on export
+        df_cleaned = None
+        all_columns = energy_box_columns(uploaded_file)
+    else:
+        # Parsed once per file content, then reused across reruns and server restarts
+        with stage("get_or_parse") as record:
+            df_cleaned = ingest_cache.get_or_parse(uploaded_file, load_energy_box, store=frame_store)
+            record.rows = len(df_cleaned)
+        all_columns = list(df_cleaned.columns)
+        st.sidebar.caption(ingest_cache.summary())
+        st.sidebar.caption(frame_store.summary())
+    file_hash = content_hash(uploaded_file)
+    st.sidebar.caption(export_cache.summary())
+
+    # IDs and options saved for this header are filled in before their widgets are drawn
+    layout = header_signature(all_columns)
+    if mapping_store.restore(st.session_state, "energy_box", layout, reset=("opinum_columns",), columns=all_columns):
+        st.toast("Source and Variable IDs filled in from the profile saved for this file layout")
     
-    file_name = st.text_input("Enter the base name for the files (optionnal)")
+    file_name = st.text_input("Enter the base name for the files (optionnal)", key="base_name")
     if not file_name:
         file_name = "EnergyBox"
 
@@ -41,14 +172,13 @@ if uploaded_file is not None:
     if used_in_excel:
         st.markdown("#### Download file for Excel")
         st.markdown("###### Specify Occupancy Profile for a Typical Week")
-        week_days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
         occupancy_profiles = []
 
         add_profile = True
         profile_idx = 0
         used_days = set()
         while add_profile:
-            available_days = [d for d in week_days if d not in used_days]
+            available_days = [d for d in WEEK_DAYS if d not in used_days]
             if not available_days:
                 break
             selected_days = st.multiselect(
@@ -80,16 +210,6 @@ if uploaded_file is not None:
             if add_profile:
                 profile_idx += 1
 
-        # --- Compute 'occupied' column for Excel export ---
-        def is_occupied(row, profiles):
-            weekday = row['date'].strftime("%A")
-            time = row['date'].time()
-            for prof in profiles:
-                if weekday in prof['days']:
-                    if prof['open'] <= time <= prof['close']:
-                        return True
-            return False
-
         st.markdown("###### Specify On-Peak Hours")
         if st.checkbox("The peak-time is different from 7:00 to 22:00"):
             on_peak_start = st.time_input("On-peak start time", value=pd.to_datetime("07:00").time(), key="on_peak_start")
@@ -100,121 +220,82 @@ if uploaded_file is not None:
 
         weekends_on_peak = st.checkbox("Weekends are considered on-peak", key="weekends_on_peak", value=False)
 
-        excel_buffer = io.BytesIO()
-        # Use the full df (not just selected columns)
-        df_excel = df_cleaned.copy()
-        df_excel = df_excel.rename(columns={"Time Stamp": "date"})
-        df_excel.columns = df_excel.columns.str.replace('(float)', '', regex=False).str.strip()
-        df_excel['date'] = pd.to_datetime(df_excel['date'], errors='coerce')
-        df_excel['is_weekend'] = df_excel['date'].dt.weekday >= 5
-
-        if weekends_on_peak:
-            df_excel['on_peak'] = df_excel['date'].dt.time.between(on_peak_start, on_peak_end) # type: ignore
+        # --- Compute 'occupied', 'on_peak' and 'is_weekend' columns for Excel export ---
+        calendar = compile_calendar(occupancy_profiles, on_peak_start, on_peak_end, weekends_on_peak)
+        excel_format = "xlsx"
+        if streaming:
+            build_excel = partial(streamed_excel_export, uploaded_file, calendar)
         else:
-            df_excel['on_peak'] = (~df_excel['is_weekend']) & df_excel['date'].dt.time.between(on_peak_start, on_peak_end) # type: ignore
-
-        df_excel['occupied'] = df_excel.apply(lambda row: is_occupied(row, occupancy_profiles), axis=1)
-        # Insert 'occupied' after 'date'
-        cols = list(df_excel.columns)
-        if 'occupied' in cols:
-            cols.insert(cols.index('date') + 1, cols.pop(cols.index('occupied')))
-            df_excel = df_excel[cols]
-
-        # --- Normalize columns that contain units in their cells and map them to desired names ---
-        import math
-
-        def extract_numeric(val):
-            """Extract first numeric token from a cell like '235.115 V' or '-1,281 kW' and return float."""
-            if pd.isna(val):
-                return val
-            # leave pure strings like 'L' (load type) untouched
-            s = str(val).strip()
-            # look for a number pattern (support comma or dot decimals)
-            m = re.search(r'[-+]?\d+[\d\.,]*', s)
-            if not m:
-                return s
-            num = m.group(0).replace(',', '.')  # normalize decimal comma to dot
-            try:
-                return float(num)
-            except Exception:
-                return s
-
-        # desired output order (keep as before)
-        desired_order = [
-            "date", "occupied", "on_peak", "Frequency  [Hz]", "I A  [A]", "I B  [A]", "I C  [A]", "I N  [A]", "I Average  [A]",
-            "Pwr Factor A", "Pwr Factor B", "Pwr Factor C", "Pwr Factor Total",
-            "VA A  [kVA]", "VA B  [kVA]", "VA C  [kVA]", "VA Total  [kVA]",
-            "Volts AN  [V]", "Volts BN  [V]", "Volts CN  [V]", "Volts LN Average  [V]",
-            "Volts AB  [V]", "Volts BC  [V]", "Volts CA  [V]", "Volts LL Average  [V]",
-            "Watt A  [kW]", "Watt B  [kW]", "Watt C  [kW]", "Watt Total  [kW]"
-        ]
+            # The template has a fixed set of columns, one row per row of the file
+            if too_big_for_excel(len(df_cleaned), len(EXCEL_COLUMNS)):
+                st.warning(
+                    f"{len(df_cleaned):,} rows x {len(EXCEL_COLUMNS)} columns is too big to work with comfortably in Excel. "
+                    "You can download it as CSV or Parquet instead."
+                )
+                excel_format = st.radio("Download format", export_formats(), index=1, horizontal=True, key="excel_format")
+            if excel_format == "xlsx" and sheet_count(len(df_cleaned)) > 1:
+                st.caption(f"Split over {sheet_count(len(df_cleaned))} sheets (Excel's limit is {EXCEL_MAX_ROWS:,} rows per sheet)")
+            build_excel = partial(excel_export, df_cleaned, calendar, excel_format)
+        excel_key = export_key(
+            file_hash, "energy_box_excel", streaming, occupancy_profiles, on_peak_start, on_peak_end,
+            weekends_on_peak, excel_format
+        )
+        # Notes on the workbook once it has been built for a download
+        built = export_cache.built(excel_key)
+        if built is not None:
+            _, unparsed_counts, saved_bytes = built
+            if unparsed_counts:
+                st.caption("Cells kept as text (no numeric value): " + ", ".join(f"{col}: {n}" for col, n in unparsed_counts.items()))
+            if saved_bytes is not None:
+                perf_panel.caption(format_saved("Excel frame", saved_bytes))
 
-        # Build a mapping from a normalized name (without unit brackets) to actual df column
-        def normalize_name(name):
-            # remove bracketed unit part and collapse spaces + lowercase
-            name_no_unit = re.sub(r"\s*\[.*?\]", "", name).strip()
-            name_no_unit = re.sub(r"\s+", " ", name_no_unit)
-            return name_no_unit.lower()
-
-        existing_map = {normalize_name(c): c for c in df_excel.columns}
-
-        # For each desired column, try to fill from matching existing column (ignoring unit suffix),
-        # and convert values to numeric when appropriate.
-        for desired in desired_order:
-            norm = normalize_name(desired)
-            if desired in df_excel.columns:
-                # exact match exists, try to convert values
-                if df_excel[desired].dtype == object:
-                    df_excel[desired] = df_excel[desired].apply(extract_numeric)
-            elif norm in existing_map:
-                src_col = existing_map[norm]
-                # create the desired-named column from source column
-                # convert numeric-like strings to numbers
-                new_series = df_excel[src_col].apply(extract_numeric)
-                df_excel[desired] = new_series
-            else:
-                # column missing: create empty column
-                df_excel[desired] = ""
-
-        final_cols = desired_order  # Only use desired_order, no extras
-
-        # Reorder the DataFrame to match the desired order
-        df_excel = df_excel[final_cols]
-
-        df_excel.to_excel(excel_buffer, index=False)
-        excel_buffer.seek(0)
         st.download_button(
             label="Download file for Excel",
-            data=excel_buffer,
-            file_name=f"{file_name}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            data=export_cache.deferred(excel_key, build_excel, select=itemgetter(0)),
+            file_name=f"{file_name}.{excel_format}",
+            mime=EXPORT_MIME[excel_format],
             key="download_excel"
         )
 
     st.markdown('--------------------------------------')
     # Let user select columns (except 'date')
-    available_columns = [col for col in df_cleaned.columns if col != "date"]
+    available_columns = [col for col in all_columns if col != "date"]
     selected_columns = st.multiselect(
         "Select the data you want to import into Opinum",
-        options=available_columns
+        options=available_columns,
+        key="opinum_columns"
     )
 
+    long_format = st.radio(
+        "Opinum file layout",
+        ["One file per variable", "One file with all variables"],
+        horizontal=True,
+        disabled=streaming,
+        key="opinum_layout",
+        help="One file with all variables writes a single long-format Opinum file (one row per timestamp "
+             "and variable). Not available in streaming mode."
+    ) == "One file with all variables" and not streaming
+
     # Always include 'date' column
     columns_to_show = ["date"] + selected_columns
-    df_cleaned = df_cleaned[columns_to_show]
+    if df_cleaned is not None:
+        df_cleaned = df_cleaned[columns_to_show]
 
 
 
     previous_source_id = None
+    opinum_entries = []
+    download_slots = []
     for idx, col in enumerate(selected_columns):
         # Remove unit in brackets from variable name
         col_no_unit = re.sub(r"\s*\[.*?\]", "", col).strip()
         st.markdown(f"#### Settings for `{col_no_unit}`")
         if idx > 0:
+            # Checked by default, unless a saved profile says otherwise
+            st.session_state.setdefault(f"same_prev_{col}", True)
             same_as_prev = st.checkbox(
                 f"Source ID for '{col}' same as previous ('{selected_columns[idx-1]}')",
-                key=f"same_prev_{col}",
-                value=True 
+                key=f"same_prev_{col}"
             )
         else:
             same_as_prev = False
@@ -229,75 +310,131 @@ if uploaded_file is not None:
 
         previous_source_id = source_id  # Update for next iteration
 
-        df_out = pd.DataFrame({
-            "date": df_cleaned["date"],
-            "value": df_cleaned[col],
-            "source_id": source_id,
-            "variable_id": variable_id
-        })
-
-        output = df_out.to_csv(index=False)
-        st.download_button(
+        opinum_entries.append((col, f"OpisenseStandardDataFile_{file_name}_{col}.csv", source_id, variable_id))
+        # The download button is filled in once every column has been serialized
+        download_slots.append(st.container())
+
+    # Each selected column is serialized once, straight into its ZIP entry, on
+    # the first click of any Opinum button; the per-column downloads read their
+    # entry back from the same ZIP.
+    all_ids_set = all(source_id and variable_id for _, _, source_id, variable_id in opinum_entries)
+    # Complete mappings are saved for the next file with the same header
+    profile_keys = ["base_name", "opinum_columns", "opinum_layout"] + [
+        f"{prefix}_{col}" for col in selected_columns for prefix in ("src", "var", "same_prev")
+    ]
+    if selected_columns and all_ids_set:
+        if mapping_store.remember(st.session_state, "energy_box", layout, all_columns, profile_keys):
+            st.caption("IDs saved for this file layout: they are filled in again when a file like this is uploaded.")
+    # Incremental mode: last exported timestamp of each column's source/variable pair
+    watermarks = None
+    if incremental:
+        watermarks = [
+            watermark_store.get(source_id, variable_id) if source_id and variable_id else None
+            for _, _, source_id, variable_id in opinum_entries
+        ]
+    opinum_key = export_key(file_hash, "energy_box_opinum", streaming, long_format, file_name, opinum_entries, watermarks)
+    select_zip, select_entry = None, None
+    if streaming:
+        build_zip = partial(streamed_opinum_zip, uploaded_file, opinum_entries, watermarks)
+        select_zip, select_entry = spilled_zip, itemgetter(0)
+        if incremental:
+            # The files are only written on download: the deltas come from a pass
+            # over the date column, once per file and set of watermarks
+            distinct, which = distinct_watermarks(watermarks)
+            delta_key = export_key(file_hash, "energy_box_delta", streaming, distinct)
+            rows, last = export_cache.get_or_build(delta_key, partial(stream_delta, uploaded_file, distinct))
+            written_rows = [rows[j] for j in which]
+            written_last = [last[j] for j in which]
+    else:
+        # The dates are formatted once per file and shared by every variable and rerun
+        export_dates, masks = None, None
+        dates_key = frame_key(uploaded_file, "opinum_dates")
+        if incremental:
+            # Only the rows past the earliest watermark are parsed and formatted,
+            # once per file and set of watermarks whatever the IDs and names
+            distinct, which = distinct_watermarks(watermarks)
+            delta_key = export_key(file_hash, "energy_box_delta", streaming, distinct)
+            export_dates, masks, rows, last = export_cache.get_or_build(
+                delta_key, partial(delta_summary, df_cleaned["date"], distinct)
+            )
+            masks = [masks[j] for j in which]
+            written_rows = [rows[j] for j in which]
+            written_last = [last[j] for j in which]
+        if long_format:
+            # Every variable in one long file (split when very long), IDs from the mapping table
+            id_table = opinum_id_table((col, source_id, variable_id) for col, _, source_id, variable_id in opinum_entries)
+            build_zip = partial(long_opinum_export, df_cleaned, export_dates, dates_key, id_table, file_name, masks)
+            # Same split as build_long_opinum: SHARD_ROWS rows of all variables per file
+            long_shards = len(df_cleaned) > SHARD_ROWS // max(1, len(opinum_entries))
+        else:
+            build_zip = partial(opinum_zip, df_cleaned, export_dates, dates_key, opinum_entries, masks)
+    exports = []
+    for i, (slot, (col, entry_name, source_id, variable_id)) in enumerate(zip(download_slots, opinum_entries)):
+        has_rows = True
+        if incremental:
+            slot.caption(describe_delta(watermarks[i], written_rows[i]))
+            has_rows = written_rows[i] > 0
+            exports.append((source_id, variable_id, written_last[i]))
+        if long_format:
+            continue
+        slot.download_button(
             label=f"Download CSV for '{col}'",
             icon = ":material/download:",
-            data=output,
-            file_name=f"OpisenseStandardDataFile_{file_name}_{col}.csv",
+            data=export_cache.deferred(
+                opinum_key, build_zip,
+                partial(zip_entry, entry_name=entry_name, select=select_entry)
+            ),
+            file_name=entry_name,
             mime="text/csv",
             key=f"download_{col}",
-            disabled=not (source_id and variable_id)
+            disabled=not (source_id and variable_id and has_rows),
+            on_click=mark_exported if incremental else "rerun",
+            args=(exports[-1:],) if incremental else None
         )
     st.markdown('--------------------------------------')
     # Download all files for Opinum as ZIP
-    if used_in_opinum and selected_columns:
-        # Check if all source_id and variable_id are set
-        all_ids_set = True
-        previous_source_id = None
-        for idx, col in enumerate(selected_columns):
-            if idx > 0:
-                same_as_prev = st.session_state.get(f"same_prev_{col}", False)
-            else:
-                same_as_prev = False
-            if same_as_prev and previous_source_id is not None:
-                source_id = previous_source_id
-            else:
-                source_id = st.session_state.get(f"src_{col}", "")
-            variable_id = st.session_state.get(f"var_{col}", "")
-            if not source_id or not variable_id:
-                all_ids_set = False
-            previous_source_id = source_id
-
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, "w") as zip_file:
-            previous_source_id = None
-            for idx, col in enumerate(selected_columns):
-                col_no_unit = re.sub(r"\s*\[.*?\]", "", col).strip()
-                if idx > 0:
-                    same_as_prev = st.session_state.get(f"same_prev_{col}", False)
-                else:
-                    same_as_prev = False
-                if same_as_prev and previous_source_id is not None:
-                    source_id = previous_source_id
-                else:
-                    source_id = st.session_state.get(f"src_{col}", "")
-                variable_id = st.session_state.get(f"var_{col}", "")
-                previous_source_id = source_id
-                df_out = pd.DataFrame({
-                    "date": df_cleaned["date"],
-                    "value": df_cleaned[col],
-                    "source_id": source_id,
-                    "variable_id": variable_id
-                })
-                csv_bytes = df_out.to_csv(index=False).encode("utf-8")
-                zip_file.writestr(f"OpisenseStandardDataFile_{file_name}_{col}.csv", csv_bytes)
-        zip_buffer.seek(0)
+    if used_in_opinum and selected_columns and long_format:
+        with st.expander("Column-to-ID mapping"):
+            st.dataframe(id_table, hide_index=True)
+        long_name = long_opinum_names(file_name, 1)[0]
+        if long_shards:
+            st.caption(f"Split over several files of at most {SHARD_ROWS:,} rows, downloaded as a ZIP")
+            long_name = f"{file_name}_Opinum.zip"
+        st.download_button(
+            label="Download all variables in one file for Opinum",
+            data=export_cache.deferred(opinum_key, build_zip),
+            file_name=long_name,
+            mime="text/csv" if long_name.endswith(".csv") else "application/zip",
+            key="download_long_opinum",
+            disabled=not all_ids_set,
+            on_click=mark_exported if incremental else "rerun",
+            args=(exports,) if incremental else None
+        )
+        if not all_ids_set:
+            st.warning("Fill in all Source ID and Variable ID fields to download the files.")
+    elif used_in_opinum and selected_columns:
         st.download_button(
             label="Download all files for Opinum (ZIP)",
-            data=zip_buffer,
+            data=export_cache.deferred(opinum_key, build_zip, select_zip),
             file_name=f"{file_name}_Opinum.zip",
             mime="application/zip",
             key="download_all_opinum",
-            disabled=not all_ids_set
+            disabled=not all_ids_set,
+            on_click=mark_exported if incremental else "rerun",
+            args=(exports,) if incremental else None
         )
         if not all_ids_set:
             st.warning("Fill in all Source ID and Variable ID fields to download the files.")
+    with st.expander("Saved ID profiles"):
+        st.dataframe(mapping_store.frame("energy_box"), hide_index=True)
+        st.button(
+            "Forget and clear the IDs of this file layout", key="forget_profile",
+            on_click=forget_profile, args=("energy_box", layout, profile_keys)
+        )
+    if incremental:
+        with st.expander("Export watermarks"):
+            st.dataframe(watermark_store.frame(), hide_index=True)
 
+perf_panel.dataframe(perf.frame(), hide_index=True)
+if perf.log_path:
+    perf_panel.caption(f"Also appended to {perf.log_path}")
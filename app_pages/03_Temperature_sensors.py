@@ -5,12 +5,38 @@ Created on Tue Jun  3 14:46:13 2025
 @author: BrunoFantoli
 """
 import streamlit as st
-import pandas as pd
-import io
+import time
+from functools import partial
+from operator import itemgetter
+
+from data_cleaning.cache import content_hash, export_cache, export_key, ingest_cache
+from data_cleaning.dtypes import bytes_saved, compact_frame, format_saved, opinum_frame, widen_frame
+from data_cleaning.excel import EXCEL_MAX_ROWS, EXPORT_MIME, export_formats, export_frame, sheet_count, too_big_for_excel
+from data_cleaning.ingest import DEFAULT_WORKERS, ingest_files
+from data_cleaning.merge import DUPLICATE_POLICIES, merge_sensor_series
+from data_cleaning.profiling import StageRecorder, stage
+from data_cleaning.store import frame_store
+from data_cleaning.temperature import read_sensor_file, read_sensor_opinum
+
+
+def opinum_export(df_cleaned, source_id, variable_id):
+    """
+    (CSV bytes, bytes saved by compact dtypes) of the sensor's Opinum file,
+    built when the download button is clicked.
+    """
+    # IDs as one-category columns, readings as float32 when they print back the same
+    frame = opinum_frame(df_cleaned.iloc[:, 0], df_cleaned.iloc[:, 1], source_id, variable_id)
+    return widen_frame(frame).to_csv(index=False).encode("utf-8"), bytes_saved(frame)
 
 
 st.title("Temperature Sensors Data Cleaning")
 st.write("This page is designed to help you clean and prepare your temperature sensor data for an upload in Opinum or for an analysis in excel.")
+
+# Per-stage timings of this run, shown in the sidebar "Performance" panel
+perf = StageRecorder("Temperature Sensors").activate(st.session_state)
+perf_panel = st.sidebar.expander("Performance")
+perf.memory = perf_panel.checkbox("Track memory peaks (slower)", key="perf_memory")
+
 # Load the CSV
 
 
@@ -23,40 +49,21 @@ if st.selectbox("Where do you want to use the data ?",("Opinum", "Excel"))=="Opi
     file_name = st.text_input("Enter the name of the data")
 
     if uploaded_file is not None:
-        file_name_lower = uploaded_file.name.lower()
-        if file_name_lower.endswith('.csv'):
-            # CSV-specific logic
-            uploaded_file.seek(0)
-            dataframe = pd.read_csv(uploaded_file, header=None, names=["Time", "Temp/°C"], skiprows=1, parse_dates=["Time"], infer_datetime_format=True) # type: ignore
-            df = dataframe
-            # Can be used wherever a "file-like" object is accepted:
-            uploaded_file.seek(0)  # Reset the file pointer to the beginning of the file
-            dataframe = pd.read_csv(uploaded_file, header=None, names=["Time", "Temp/°C"], skiprows=1, parse_dates=["Time"], infer_datetime_format=True) # type: ignore
-            df = dataframe
-
-            # Force non-parsable dates to NaT (Not a Time)
-            df["Time"] = pd.to_datetime(df["Time"], errors='coerce')
-
-            # Drop rows where parsing failed
-            df_cleaned = df.dropna(subset=["Time"])
-
-        elif file_name_lower.endswith('.txt'):
-            # TXT-specific logic
-            uploaded_file.seek(0)
-            dataframe = pd.read_csv(uploaded_file, delimiter=",", encoding="latin1", index_col=0) # type: ignore
-            df_cleaned = dataframe.reset_index()[["Time", "Celsius(°C)"]]
-            
-
-        df_cleaned["source_id"] = source_id # type: ignore
-        df_cleaned["variable_id"] = variable_id # type: ignore
-        df_cleaned.columns = ["date", "value","source_id", "variable_id"] # type: ignore
-        
-        # Save the cleaned file (optional)
-        output = df_cleaned.to_csv(index=False) # type: ignore
-        
+        try:
+            df_cleaned = read_sensor_opinum(uploaded_file)
+        except ValueError as exc:
+            st.warning(str(exc))
+            st.stop()
+
+        # Written on the first click only, once per file content and IDs
+        output_key = export_key(content_hash(uploaded_file), "temperature_opinum", source_id, variable_id)
+        built = export_cache.built(output_key)
+        if built is not None:
+            perf_panel.caption(format_saved("Opinum frame", built[1]))
+
         st.download_button(
             label="Download",
-            data=output,  # Convert DataFrame to CSV string
+            data=export_cache.deferred(output_key, partial(opinum_export, df_cleaned, source_id, variable_id), itemgetter(0)),
             file_name="OpisenseStandardDataFile_"+file_name+".csv",
             mime="text/csv",
             disabled=not (source_id and variable_id)
@@ -67,65 +74,74 @@ if st.selectbox("Where do you want to use the data ?",("Opinum", "Excel"))=="Opi
 else:
     uploaded_files = st.file_uploader("Choose one or more files", accept_multiple_files=True)
     round_time = st.checkbox("Round timestamps to nearest 15 minutes before merging", value=True)
+    duplicate_policy = st.selectbox(
+        "Combine readings that share a timestamp using",
+        DUPLICATE_POLICIES,
+        help="Applied per sensor when several readings fall on the same (rounded) timestamp."
+    )
 
+    workers = st.sidebar.number_input("Parallel workers for file parsing", min_value=1, max_value=32, value=DEFAULT_WORKERS)
+
+    sensors = []
     merged_df = None
 
     if uploaded_files:
-        for uploaded_file in uploaded_files:
-            file_name = uploaded_file.name
-            file_name_lower = file_name.lower()
-            if file_name_lower.endswith('.csv'):
-                uploaded_file.seek(0)
-                df = pd.read_csv(uploaded_file)
-            elif file_name_lower.endswith('.txt'):
-                uploaded_file.seek(0)
-                df = pd.read_csv(uploaded_file, delimiter=",", encoding="latin1")
-            else:
-                st.warning(f"Unsupported file type: {uploaded_file.name}")
-                continue
-
-            # Try to find the date/time and temperature columns
-            possible_time_cols = [col for col in df.columns if "time" in col.lower() or "date" in col.lower()]
-            possible_temp_cols = [col for col in df.columns if "temp" in col.lower() or "celsius" in col.lower() or "°c" in col.lower()]
-            if not possible_time_cols or not possible_temp_cols:
-                st.warning(f"Could not find time or temperature columns in {file_name}")
-                continue
-
-            time_col = possible_time_cols[0]
-            temp_col = possible_temp_cols[0]
-
-            # Prepare the DataFrame for merging
-            df = df[[time_col, temp_col]].copy()
-            df[time_col] = pd.to_datetime(df[time_col], errors='coerce')
-            df = df.dropna(subset=[time_col])
-
-            # Round to nearest 15 minutes if checkbox is checked
-            if round_time:
-                df[time_col] = df[time_col].dt.round('15min')
-
-            # Remove file extension from the column name
-            col_name = file_name.rsplit('.', 1)[0]
-            df = df.rename(columns={temp_col: col_name, time_col: "DateTime"})
-
-            if merged_df is None:
-                merged_df = df
-            else:
-                merged_df = pd.merge(merged_df, df, on="DateTime", how="outer")
+        # The merged sensors are kept on disk, keyed by every file's name and content
+        merged_key = (
+            tuple((f.name, content_hash(f)) for f in uploaded_files),
+            "merge_sensor_series",
+            repr((round_time, duplicate_policy))
+        )
+        merged_df = frame_store.get(merged_key)
+        if merged_df is not None:
+            st.caption(f"Loaded {len(merged_df)} merged timestamps from the on-disk store")
+        else:
+            start = time.perf_counter()
+            with stage("ingest_files") as record:
+                results = ingest_files(uploaded_files, read_sensor_file, round_time, duplicate_policy, workers=workers, cache=ingest_cache)
+                record.rows = sum(len(result.frame) for result in results if result.frame is not None)
+            for result in results:
+                if result.error:
+                    st.warning(result.error)
+                else:
+                    sensors.append(result.frame)
+            parse_seconds = time.perf_counter() - start
+
+            if sensors:
+                merged_df, merge_seconds = merge_sensor_series(sensors)
+                merged_df = compact_frame(merged_df)
+                frame_store.put(merged_key, merged_df)
+                st.caption(
+                    f"Parsed {len(sensors)} sensor files in {parse_seconds:.2f} s, "
+                    f"merged {len(merged_df)} timestamps in {merge_seconds:.2f} s"
+                )
+        st.sidebar.caption(frame_store.summary())
 
         if merged_df is not None:
-            merged_df = merged_df.sort_values("DateTime")
-            merged_df.reset_index(drop=True, inplace=True)
+            perf_panel.caption(format_saved("Merged frame", bytes_saved(merged_df)))
             #st.write("Merged Data", merged_df)   # Debugging line
 
-            # Output as XLSX
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                merged_df.to_excel(writer, index=False, sheet_name='MergedData')
-            output.seek(0)
+            # Output as XLSX, streamed row by row; CSV/Parquet offered for very large merges
+            export_format = "xlsx"
+            if too_big_for_excel(*merged_df.shape):
+                st.warning(
+                    f"{len(merged_df):,} rows x {merged_df.shape[1]} columns is too big to work with comfortably in Excel. "
+                    "You can download it as CSV or Parquet instead."
+                )
+                export_format = st.radio("Download format", export_formats(), index=1, horizontal=True)
+            if export_format == "xlsx" and sheet_count(len(merged_df)) > 1:
+                st.caption(f"Split over {sheet_count(len(merged_df))} sheets (Excel's limit is {EXCEL_MAX_ROWS:,} rows per sheet)")
+            # Written on the first click only, once per set of files and settings
+            output_key = export_key(merged_key, "merged_temperature", export_format)
+            st.sidebar.caption(export_cache.summary())
 
             st.download_button(
-                label="Download Merged Data as XLSX",
-                data=output,
-                file_name="Merged_Temperature_Data.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
\ No newline at end of file
+                label=f"Download Merged Data as {export_format.upper()}",
+                data=export_cache.deferred(output_key, partial(export_frame, merged_df, export_format, sheet_name='MergedData')),
+                file_name=f"Merged_Temperature_Data.{export_format}",
+                mime=EXPORT_MIME[export_format]
+            )
+
+perf_panel.dataframe(perf.frame(), hide_index=True)
+if perf.log_path:
+    perf_panel.caption(f"Also appended to {perf.log_path}")
@@ -1,9 +1,24 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-import io
 import logging
-from datetime import datetime, timedelta
+from functools import partial
+from zoneinfo import available_timezones
+
+from data_cleaning.cache import content_hash, export_cache, export_key, ingest_cache
+from data_cleaning.consumption import (
+    clean_consumption,
+    detect_consumption_column,
+    load_standardized,
+    load_standardized_chunked,
+    merge_standardized,
+    sniff_delimiter,
+)
+from data_cleaning.dtypes import bytes_saved, compact_frame, format_saved
+from data_cleaning.excel import EXCEL_MAX_ROWS, EXPORT_MIME, export_formats, export_frame, sheet_count, too_big_for_excel
+from data_cleaning.excel_reader import describe_read, is_excel, list_sheets
+from data_cleaning.ingest import DEFAULT_WORKERS, ingest_files
+from data_cleaning.profiling import StageRecorder, stage
+from data_cleaning.schema import probe_file
+from data_cleaning.store import PIPELINE_VERSION, frame_store
 
 # Set up logging
 logging.basicConfig(level=logging.WARNING)
@@ -13,230 +28,62 @@ st.write("This page is designed to help you manage and analyze consumption data
 st.write("You can upload a the file received from the client and it will be processed and cleaned for excel use.")
 st.write("THIS PAGE IS STILL BEING DEVELOPED.")
 
+# Per-stage timings of this run, shown in the sidebar "Performance" panel
+perf = StageRecorder("Consumption Data").activate(st.session_state)
+perf_panel = st.sidebar.expander("Performance")
+perf.memory = perf_panel.checkbox("Track memory peaks (slower)", key="perf_memory")
 
-def load_file(uploaded_file):
-    """
-    Load a CSV or XLSX file into a DataFrame.
-    Auto-detects file type and tries to guess delimiter for CSV.
-    """
-    file_name = uploaded_file.name
-    if file_name.lower().endswith('.csv'):
-        # Try to detect delimiter
-        import csv
-        first_bytes = uploaded_file.read(2048).decode('utf-8')
-        uploaded_file.seek(0)
-        sniffer = csv.Sniffer()
-        try:
-            dialect = sniffer.sniff(first_bytes)
-            delimiter = dialect.delimiter
-        except Exception:
-            delimiter = ';'  # fallback for European CSVs
-        df = pd.read_csv(uploaded_file, delimiter=delimiter)
-    elif file_name.lower().endswith(('.xls', '.xlsx')):
-        df = pd.read_excel(uploaded_file)
-    else:
-        st.warning(f"Unsupported file type: {file_name}")
-        return None
-    df['source_file'] = file_name
-    return df
-
-def detect_datetime_column(df):
-    """
-    Try to find the column containing date/time information.
-    """
-    for col in df.columns:
-        if any(x in col.lower() for x in ['date', 'time', 'timestamp']):
-            return col
-    # Fallback: try first column
-    return df.columns[0]
 
-def standardize_dates(df, datetime_col):
+def standardize(results, consumption_cols, freq, impute_strategy, tz, register_max):
     """
-    Standardize date/time column to pandas datetime.
-    Handles common formats, Excel serial dates, UNIX timestamps.
-    Tries dayfirst=True for European-style dates.
+    (merged frame with compact dtypes, bytes they save, warnings, cumulative
+    meter notes) of the parsed files, built once per files and settings
+    (see export_cache). Each note is (file, column, summary, segment table
+    or None when there is a single segment without spikes).
     """
-    # Try direct conversion (default: monthfirst)
-    df['timestamp'] = pd.to_datetime(df[datetime_col], errors='coerce')
-    
-    # If many NaT, try dayfirst=True
-    if df['timestamp'].isna().sum() > len(df) // 2:
-        df['timestamp'] = pd.to_datetime(df[datetime_col], errors='coerce', dayfirst=True)
-
-    # Try Excel serial dates if still mostly NaT
-    if df['timestamp'].isna().sum() > len(df) // 2:
-        try:
-            df['timestamp'] = pd.to_datetime(df[datetime_col], unit='D', origin='1899-12-30', errors='coerce')
-        except Exception:
-            pass
-
-    # Try UNIX timestamps if still mostly NaT
-    if df['timestamp'].isna().sum() > len(df) // 2:
+    cleaned_dfs = []
+    warnings = []
+    register_notes = []
+    for result in results:
+        if result.error:
+            continue
+        registers = {}
         try:
-            df['timestamp'] = pd.to_datetime(df[datetime_col], unit='s', errors='coerce')
-        except Exception:
-            pass
-
-    return df
-
-def detect_consumption_column(df):
-    """
-    Try to find the column containing consumption values.
-    Only select columns with numeric-like data.
-    """
-    for col in df.columns:
-        if any(x in col.lower() for x in ['consumption', 'kwh', 'energy', 'value', 'usage']):
-            # Check if column is numeric-like
-            sample = df[col].astype(str).str.replace(',', '.', regex=False)
-            numeric_sample = pd.to_numeric(sample, errors='coerce')
-            if numeric_sample.notna().sum() > 0:
-                return col
-    # Fallback: try second column if it's numeric
-    if len(df.columns) > 1:
-        sample = df[df.columns[1]].astype(str).str.replace(',', '.', regex=False)
-        numeric_sample = pd.to_numeric(sample, errors='coerce')
-        if numeric_sample.notna().sum() > 0:
-            return df.columns[1]
-    return None
-
-def infer_frequency(timestamps):
-    """
-    Infer the most common frequency in the timestamp series.
-    """
-    diffs = timestamps.sort_values().diff().dropna()
-    if diffs.empty:
-        return None
-    freq = diffs.mode()[0]
-    # Map timedelta to pandas offset string
-    if freq <= timedelta(minutes=1):
-        return 'T'
-    elif freq <= timedelta(minutes=15):
-        return '15T'
-    elif freq <= timedelta(hours=1):
-        return 'H'
-    elif freq <= timedelta(days=1):
-        return 'D'
-    else:
-        return None
-
-def handle_missing_data(df, freq, consumption_col, impute_strategy='auto'):
-    """
-    Handle missing data:
-    - If cumulative, distribute the difference over missing intervals.
-    - If interval, set missing to NaN or zero.
-    - impute_strategy: 'auto', 'distribute', 'zero', 'nan'
-    """
-    df = df.sort_values('timestamp')
-    df = df.groupby('timestamp', as_index=False).first()
-    idx = pd.date_range(df['timestamp'].min(), df['timestamp'].max(), freq=freq)
-    df = df.set_index('timestamp').reindex(idx)
-    df['timestamp'] = df.index
-
-    # Standardize decimal separator and convert to float safely
-    df[consumption_col] = (
-        df[consumption_col]
-        .astype(str)
-        .str.strip()  # Remove leading/trailing whitespace
-        .replace({'': np.nan, ' ': np.nan})  # Treat empty and space as NaN
-        .str.replace(',', '.', regex=False)
-    )
-    df[consumption_col] = pd.to_numeric(df[consumption_col], errors='coerce')
-
-    consumption = df[consumption_col]
-
-    # Detect cumulative: monotonic increasing, large jumps
-    is_cumulative = consumption.dropna().is_monotonic_increasing
+            cleaned_dfs.extend(clean_consumption(
+                result.frame, consumption_cols, freq, impute_strategy, tz, register_max, registers
+            ))
+        except ValueError as exc:
+            warnings.append(f"{result.name}: {exc}")
+        register_notes.extend(
+            (result.name, col, register.summary(),
+             register.segments if len(register.segments) > 1 or register.spikes else None)
+            for col, register in registers.items()
+        )
+    if not cleaned_dfs:
+        return None, 0, warnings, register_notes
+    # source_file as a categorical, short decimals as float32
+    merged = compact_frame(merge_standardized(cleaned_dfs))
+    return merged, bytes_saved(merged), warnings, register_notes
 
-    # Choose imputation strategy
-    if impute_strategy == 'auto':
-        strategy = 'distribute' if is_cumulative else 'nan'
-    else:
-        strategy = impute_strategy
-
-    if strategy == 'distribute' and is_cumulative:
-        df['consumption_kWh'] = distribute_cumulative(df, consumption_col)
-    elif strategy == 'zero':
-        df['consumption_kWh'] = consumption.fillna(0)
-    else:  # 'nan'
-        df['consumption_kWh'] = consumption
-
-    # Flag missing/irregular data
-    df['missing_flag'] = df['consumption_kWh'].isna() | df['consumption_kWh'].le(0)
-    return df
-
-def distribute_cumulative(df, consumption_col):
-    """
-    For cumulative data, fill missing values by distributing the difference
-    between previous and next valid readings equally across all missing intervals.
-    """
-    consumption = df[consumption_col].copy()
-    result = np.zeros(len(consumption))
-    i = 0
-    while i < len(consumption):
-        if pd.isna(consumption.iloc[i]):
-            # Find previous valid value
-            prev_idx = i - 1
-            while prev_idx >= 0 and pd.isna(consumption.iloc[prev_idx]):
-                prev_idx -= 1
-            prev_val = consumption.iloc[prev_idx] if prev_idx >= 0 else 0
-
-            # Find next valid value
-            next_idx = i
-            while next_idx < len(consumption) and pd.isna(consumption.iloc[next_idx]):
-                next_idx += 1
-            if next_idx < len(consumption):
-                next_val = consumption.iloc[next_idx]
-                n_missing = next_idx - prev_idx
-                if n_missing > 0:
-                    interval = (next_val - prev_val) / n_missing
-                    for j in range(prev_idx + 1, next_idx + 1):
-                        result[j] = interval
-                i = next_idx + 1
-            else:
-                # No next valid value, fill remaining with NaN
-                for j in range(prev_idx + 1, len(consumption)):
-                    result[j] = np.nan
-                break
-        else:
-            if i > 0:
-                result[i] = consumption.iloc[i] - consumption.iloc[i - 1]
-            else:
-                result[i] = consumption.iloc[i]
-            i += 1
-    return result
-
-def clean_and_merge(files, freq):
-    """
-    Load, clean, and merge multiple files into a standardized DataFrame.
-    """
-    dfs = []
-    for uploaded_file in files:
-        df = load_file(uploaded_file)
-        if df is None:
-            continue
-        datetime_col = detect_datetime_column(df)
-        df = standardize_dates(df, datetime_col)
-        consumption_col = detect_consumption_column(df)
-        if consumption_col is None:
-            st.warning(f"Could not detect consumption column in {uploaded_file.name}")
-            continue
-        # Infer frequency if not provided
-        inferred_freq = infer_frequency(df['timestamp'].dropna())
-        use_freq = freq if freq else inferred_freq if inferred_freq else 'H'
-        df = handle_missing_data(df, use_freq, consumption_col)
-        dfs.append(df[['timestamp', 'consumption_kWh', 'source_file', 'missing_flag']])
-    if dfs:
-        merged = pd.concat(dfs, ignore_index=True)
-        merged = merged.sort_values('timestamp').reset_index(drop=True)
-        return merged
-    else:
-        return pd.DataFrame(columns=['timestamp', 'consumption_kWh', 'source_file', 'missing_flag'])
 
 # --- Streamlit UI ---
 uploaded_files = st.file_uploader("Upload CSV/XLSX files", accept_multiple_files=True)
-freq_options = {'15 min': '15T', 'Hourly': 'H', 'Daily': 'D'}
-freq_label = st.selectbox("Aggregation frequency", list(freq_options.keys()), index=1)
+freq_options = {'As recorded': None, '15 min': '15min', 'Hourly': 'h', 'Daily': 'D', 'Monthly': 'MS'}
+freq_label = st.selectbox(
+    "Aggregation frequency",
+    list(freq_options.keys()),
+    index=2,
+    help="Consumption is summed per period (cumulative meter readings are differenced first). "
+         "Periods shorter than the file's own interval split each reading evenly."
+)
 freq = freq_options[freq_label]
+timezone = st.selectbox(
+    "Timezone of the timestamps",
+    ["None"] + sorted(available_timezones()),
+    help="Read the timestamps as local time in this timezone, so daily and monthly periods follow "
+         "the local calendar across daylight saving time changes."
+)
+tz = None if timezone == "None" else timezone
 
 impute_strategy = st.selectbox(
     "Missing data handling strategy",
@@ -250,9 +97,49 @@ impute_map = {
     "nan (leave missing as NaN)": "nan"
 }
 
+register_max = st.number_input(
+    "Register rollover value",
+    min_value=1.0, value=None, step=1.0, format="%g", placeholder="Detect (next power of ten)",
+    help="Value at which cumulative meter registers wrap back to zero, e.g. 100000 for a 5-digit register. "
+         "Other drops in the readings are treated as meter resets."
+)
+
+streaming = st.checkbox(
+    "Chunked reading for very large CSV files",
+    help="Read CSV files in chunks and convert each chunk to compact numeric columns before reading the next one. "
+         "This lowers the memory peak while parsing; the whole file is still held once it is read."
+)
+workers = st.sidebar.number_input("Parallel workers for file parsing", min_value=1, max_value=32, value=DEFAULT_WORKERS)
+
 if uploaded_files:
-    # Load first file to get columns for selection
-    df_preview = load_file(uploaded_files[0])
+    # Workbooks are read from their largest visible sheet unless one is picked
+    sheet_names = []
+    for uploaded_file in uploaded_files:
+        if is_excel(uploaded_file.name):
+            try:
+                sheets = list_sheets(uploaded_file)
+            except Exception:
+                # Reported with the file's other errors when it is parsed
+                continue
+            if len(sheets) > 1:
+                sheet_names.extend(name for name, _ in sheets if name not in sheet_names)
+    sheet_name = None
+    if sheet_names:
+        sheet_label = st.selectbox(
+            "Sheet to read from Excel files with several sheets",
+            ["Largest sheet of each file"] + sheet_names
+        )
+        sheet_name = None if sheet_label == "Largest sheet of each file" else sheet_label
+
+    # Only the head of the first file is read to fill the column selection,
+    # split the way load_file will split it
+    first_file = uploaded_files[0]
+    try:
+        delimiter = sniff_delimiter(first_file) if first_file.name.lower().endswith('.csv') else None
+        df_preview = probe_file(first_file, delimiter=delimiter, header_row=0, sheet_name=sheet_name).sample
+    except ValueError as exc:
+        st.warning(str(exc))
+        df_preview = None
     if df_preview is not None:
         st.write("Preview of uploaded file:", df_preview.head())
         detected_col = detect_consumption_column(df_preview)
@@ -270,34 +157,68 @@ if uploaded_files:
     else:
         consumption_cols = []
 
-    cleaned_dfs = []
-    for uploaded_file in uploaded_files:
-        df = load_file(uploaded_file)
-        if df is None:
+    with stage("ingest_files") as record:
+        results = ingest_files(uploaded_files, load_standardized_chunked if streaming else load_standardized, sheet_name, workers=workers, cache=ingest_cache, store=frame_store)
+        record.rows = sum(len(result.frame) for result in results if result.frame is not None)
+    for result in results:
+        if result.error:
+            st.warning(result.error)
             continue
-        datetime_col = detect_datetime_column(df)
-        df = standardize_dates(df, datetime_col)
-        # Use user-selected columns if available, else auto-detect
-        for consumption_col in consumption_cols if consumption_cols else [detect_consumption_column(df)]:
-            if consumption_col is None:
-                st.warning(f"Could not detect consumption column in {uploaded_file.name}")
-                continue
-            inferred_freq = infer_frequency(df['timestamp'].dropna())
-            use_freq = freq if freq else inferred_freq if inferred_freq else 'H'
-            df_clean = handle_missing_data(df, use_freq, consumption_col, impute_map[impute_strategy])
-            cleaned_dfs.append(df_clean[['timestamp', 'consumption_kWh', 'source_file', 'missing_flag']])
-
-    if cleaned_dfs:
-        merged = pd.concat(cleaned_dfs, ignore_index=True)
-        merged = merged.sort_values('timestamp').reset_index(drop=True)
+        df = result.frame
+        read_note = describe_read(df)
+        st.caption(
+            f"{result.name}: dates parsed using {df.attrs.get('timestamp_strategy')}"
+            + (f" ({read_note})" if read_note else "")
+        )
+
+    # Resampled, merged and compacted once per set of files and settings, not on every rerun;
+    # user-selected columns if any, else auto-detected
+    inputs = tuple((f.name, content_hash(f)) for f in uploaded_files)
+    standardized_key = export_key(
+        inputs, "standardized_frame", PIPELINE_VERSION, sheet_name, streaming, consumption_cols, freq,
+        impute_strategy, tz, register_max
+    )
+    merged, saved_bytes, warnings, register_notes = export_cache.get_or_build(standardized_key, partial(
+        standardize, results, consumption_cols, freq, impute_map[impute_strategy], tz, register_max
+    ))
+    for warning in warnings:
+        st.warning(warning)
+    st.sidebar.caption(ingest_cache.summary())
+    st.sidebar.caption(frame_store.summary())
+    st.sidebar.caption(export_cache.summary())
+
+    # Rollovers, resets and spikes found in the cumulative columns of each file
+    if register_notes:
+        with st.expander("Cumulative meter diagnostics"):
+            for name, col, summary, segments in register_notes:
+                st.caption(f"{name}, {col}: {summary}")
+                if segments is not None:
+                    st.dataframe(segments, hide_index=True)
+
+    if merged is not None:
+        perf_panel.caption(format_saved("Standardized dataset", saved_bytes))
         st.write("Preview of standardized dataset:", merged.head())
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            merged.to_excel(writer, index=False, sheet_name='Standardized')
-        output.seek(0)
+        export_format = "xlsx"
+        if too_big_for_excel(*merged.shape):
+            st.warning(
+                f"{len(merged):,} rows x {merged.shape[1]} columns is too big to work with comfortably in Excel. "
+                "You can download it as CSV or Parquet instead."
+            )
+            export_format = st.radio("Download format", export_formats(), index=1, horizontal=True)
+        if export_format == "xlsx" and sheet_count(len(merged)) > 1:
+            st.caption(f"Split over {sheet_count(len(merged))} sheets (Excel's limit is {EXCEL_MAX_ROWS:,} rows per sheet)")
+        # Written on the first click only, once per set of files and settings
+        output_key = export_key(
+            inputs, "standardized",
+            sheet_name, streaming, consumption_cols, freq, impute_strategy, tz, register_max, export_format
+        )
         st.download_button(
-            label="Download standardized dataset (Excel)",
-            data=output,
-            file_name="Standardized_Energy_Data.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
\ No newline at end of file
+            label="Download standardized dataset (Excel)" if export_format == "xlsx" else f"Download standardized dataset ({export_format.upper()})",
+            data=export_cache.deferred(output_key, partial(export_frame, merged, export_format, sheet_name='Standardized')),
+            file_name=f"Standardized_Energy_Data.{export_format}",
+            mime=EXPORT_MIME[export_format]
+        )
+
+perf_panel.dataframe(perf.frame(), hide_index=True)
+if perf.log_path:
+    perf_panel.caption(f"Also appended to {perf.log_path}")
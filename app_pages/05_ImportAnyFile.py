@@ -1,61 +1,263 @@
+import io
+
 import streamlit as st
-import pandas as pd
+
+from data_cleaning.cache import content_hash, export_cache, export_key, frame_key, ingest_cache
+from data_cleaning.dates import parse_timestamps
+from data_cleaning.excel_reader import describe_read, is_excel, list_sheets, pick_sheet
+from data_cleaning.ingest import read_table
+from data_cleaning.mappings import header_signature, mapping_store
+from data_cleaning.opinum import (
+    build_long_opinum,
+    format_kept,
+    long_opinum_names,
+    opinum_dates,
+    opinum_id_table,
+    write_opinum_csv,
+)
+from data_cleaning.profiling import StageRecorder
+from data_cleaning.schema import probe_file
+from data_cleaning.watermark import delta_summary, describe_delta, parse_delta, watermark_store
+
+
+def opinum_csv(uploaded_file, probe, usecols, date_col, var, source_id, variable_id, incremental=False, watermark=None):
+    """
+    Deferred download data: the usecols columns of the file are parsed in full
+    (once per file content, see ingest_cache) only when a download button is
+    clicked. The formatted date column is cached too and shared by every variable.
+    In incremental mode only the rows after the watermark of the
+    source/variable pair are written; the watermark moves past them in the
+    click callback (see mark_exported). Files are kept in export_cache and
+    written once per file content, settings and watermark.
+    """
+    def build():
+        df = ingest_cache.get_or_parse(
+            uploaded_file, read_table, probe.delimiter, probe.header_row, probe.sheet_name, usecols
+        )
+        values = df[var].to_numpy()
+        if incremental:
+            stamps, (mask,) = parse_delta(df[date_col], [watermark])
+            dates, values = format_kept(stamps, [mask])[mask], values[mask]
+        else:
+            # Format for Opinum: YYYY-MM-DD HH:MM:SS
+            dates = opinum_dates(
+                df[date_col], ingest_cache,
+                frame_key(uploaded_file, "opinum_dates", probe.delimiter, probe.header_row, probe.sheet_name, date_col)
+            ).to_numpy()
+        # Opinum format: Date, Value, Source ID, Variable ID
+        output = io.BytesIO()
+        write_opinum_csv(output, dates, values, source_id, variable_id)
+        return output.getvalue()
+    key = export_key(
+        content_hash(uploaded_file), "any_file_opinum", probe.delimiter, probe.header_row, probe.sheet_name,
+        usecols, date_col, var, source_id, variable_id, incremental, watermark
+    )
+    return export_cache.deferred(key, build)
+
+
+def long_opinum_csv(uploaded_file, probe, usecols, date_col, id_table, watermarks=None):
+    """
+    Deferred download data of the long-format file with every variable of
+    id_table (see opinum_csv for the parsing and incremental mode).
+    watermarks: in incremental mode, the watermark of each row of id_table.
+    """
+    def build():
+        df = ingest_cache.get_or_parse(
+            uploaded_file, read_table, probe.delimiter, probe.header_row, probe.sheet_name, usecols
+        )
+        masks = None
+        if watermarks is not None:
+            dates, masks = parse_delta(df[date_col], watermarks)
+        else:
+            dates = opinum_dates(
+                df[date_col], ingest_cache,
+                frame_key(uploaded_file, "opinum_dates", probe.delimiter, probe.header_row, probe.sheet_name, date_col)
+            )
+        (data,) = build_long_opinum(dates, df, id_table, masks, shard_rows=None)
+        return data
+    key = export_key(
+        content_hash(uploaded_file), "any_file_long_opinum", probe.delimiter, probe.header_row, probe.sheet_name,
+        usecols, date_col, id_table.to_numpy().tolist(), watermarks
+    )
+    return export_cache.deferred(key, build)
+
+
+def date_delta(uploaded_file, file_hash, probe, date_col, watermark):
+    """
+    (rows, last timestamp) of the incremental export after a watermark, from
+    the date column alone, so captions and buttons are right before anything
+    is downloaded. Cached per file content and watermark, whatever the IDs.
+    """
+    def build():
+        df = ingest_cache.get_or_parse(
+            uploaded_file, read_table, probe.delimiter, probe.header_row, probe.sheet_name, (date_col,)
+        )
+        _, _, (rows,), (last,) = delta_summary(df[date_col], [watermark])
+        return rows, last
+    key = export_key(
+        file_hash, "any_file_delta", probe.delimiter, probe.header_row, probe.sheet_name, date_col, watermark
+    )
+    return export_cache.get_or_build(key, build)
+
+
+def mark_exported(exports):
+    """
+    Download callback of incremental mode: move each (source_id, variable_id)
+    watermark to the last timestamp of the rows just downloaded.
+    """
+    for source_id, variable_id, last in exports:
+        watermark_store.advance(source_id, variable_id, last)
+
+
+def forget_profile(page, layout, keys):
+    """
+    Delete the saved profile of a layout and clear its fields, so they are
+    not saved again right away.
+    """
+    mapping_store.forget(page, layout)
+    for key in keys:
+        st.session_state.pop(key, None)
+
 
 st.title("General File Import for Opinum Upload")
 st.write("This page allows you to upload any data file (CSV, Excel) and convert selected variables into the Opinum standard format for easy upload.")
 st.write("Please ensure your data includes a date/time column and the variables you wish to upload in different columns.")
 
+# Per-stage timings of this run, shown in the sidebar "Performance" panel
+perf = StageRecorder("Import Any File").activate(st.session_state)
+perf_panel = st.sidebar.expander("Performance")
+perf.memory = perf_panel.checkbox("Track memory peaks (slower)", key="perf_memory")
+
 uploaded_file = st.file_uploader("Upload your data file (CSV, Excel, etc.)", type=["csv", "xlsx", "xls"]) 
+incremental = st.checkbox(
+    "Incremental mode for rolling exports",
+    help="Only export the rows after the last timestamp downloaded for each Source ID / Variable ID, "
+         "so files overlapping an earlier export do not duplicate it in Opinum."
+)
 
-df = None
+probe = None
 if uploaded_file:
-    if uploaded_file.name.endswith('.csv'):
-        df = pd.read_csv(uploaded_file)
-    elif uploaded_file.name.endswith(('.xlsx', '.xls')):
-        df = pd.read_excel(uploaded_file)
-    else:
-        st.error("Unsupported file type.")
-
-if df is not None:
+    # Only the head of the file is read to fill the column pickers
+    try:
+        sheet_name = None
+        if is_excel(uploaded_file.name):
+            sheets = list_sheets(uploaded_file)
+            if len(sheets) > 1:
+                names = [name for name, _ in sheets]
+                sheet_name = st.selectbox("Sheet to import:", names, index=names.index(pick_sheet(sheets)), key="sheet")
+        probe = probe_file(uploaded_file, sheet_name=sheet_name)
+        if probe.sheet_name is not None:
+            st.caption(describe_read(probe.sample))
+    except ValueError as exc:
+        st.error(str(exc))
+    st.sidebar.caption(ingest_cache.summary())
+    st.sidebar.caption(export_cache.summary())
+
+
+if probe is not None:
     #st.write("Preview of uploaded data:")
-    #st.dataframe(df.head())
-    columns = list(df.columns)
+    #st.dataframe(probe.sample.head())
+    columns = probe.columns
+    # IDs and options saved for this header are filled in before their widgets are drawn
+    layout = header_signature(columns)
+    if mapping_store.restore(st.session_state, "any_file", layout, reset=("variables", "date_col"), columns=columns):
+        st.toast("Source and Variable IDs filled in from the profile saved for this file layout")
     variable_columns = st.multiselect(
         "Select variables to upload (including date/time column):",
-        columns
+        columns,
+        key="variables"
     )
     if variable_columns:
         #st.write("You selected:", variable_columns)
+        if st.session_state.get("date_col") not in columns:
+            st.session_state["date_col"] = probe.date_column if probe.date_column in columns else columns[0]
         date_col = st.selectbox("Select the date/time column:", columns, key="date_col")
+        # The whole column is parsed once with this strategy when a file is downloaded
+        _, date_strategy = parse_timestamps(probe.sample[date_col])
+        st.caption(f"Dates parsed using: {date_strategy}")
+        # Only the date column and the selected variables are read from the file
+        usecols = tuple(dict.fromkeys([date_col, *variable_columns]))
+        long_format = st.radio(
+            "Opinum file layout",
+            ["One file per variable", "One file with all variables"],
+            horizontal=True,
+            key="opinum_layout",
+            help="One file with all variables writes a single long-format Opinum file "
+                 "(one row per timestamp and variable)."
+        ) == "One file with all variables"
+        id_entries = []
+        # Incremental mode: watermark and rows of each variable, (source_id, variable_id, last timestamp) to advance
+        watermarks, delta_rows, exports = [], [], []
+        file_hash = content_hash(uploaded_file) if incremental else None
         for var in variable_columns:
             if var == date_col:
                 continue
             st.subheader(f"Settings for variable: {var}")
             source_id = st.text_input(f"Source ID for {var}", key=f"source_{var}")
             variable_id = st.text_input(f"Variable ID for {var}", key=f"varid_{var}")
+            id_entries.append((var, source_id, variable_id))
+            has_rows, watermark = True, None
+            if incremental and source_id and variable_id:
+                watermark = watermark_store.get(source_id, variable_id)
+                rows, last = date_delta(uploaded_file, file_hash, probe, date_col, watermark)
+                st.caption(describe_delta(watermark, rows))
+                has_rows = rows > 0
+                delta_rows.append(rows)
+                exports.append((source_id, variable_id, last))
+            watermarks.append(watermark)
+            if long_format:
+                continue
             file_name = st.text_input(f"Optional file name for {var}", key=f"fname_{var}")
-            # Prepare Opinum format: Date, Value, Source ID, Variable ID
-            # Parse date column with explicit format
-            parsed_dates = pd.to_datetime(df[date_col], errors='coerce')
-            # Format for Opinum: YYYY-MM-DD HH:MM:SS
-            formatted_dates = parsed_dates.dt.strftime('%Y-%m-%d %H:%M:%S')
-            out_df = pd.DataFrame({
-                "date": formatted_dates,
-                "value": df[var],
-                "source_id": source_id,
-                "variable_id": variable_id
-            })
             # File naming as in EnergyBox: OpisenseStandardDataFile_<name>.csv
             out_file_name = f"OpisenseStandardDataFile_{file_name if file_name else var}.csv"
-            csv_data = out_df.to_csv(index=False)
             st.download_button(
                 label=f"Download CSV for '{var}'",
-                data=csv_data,
+                data=opinum_csv(
+                    uploaded_file, probe, usecols, date_col, var, source_id, variable_id, incremental, watermark
+                ),
                 file_name=out_file_name,
                 mime="text/csv",
                 key=f"download_{var}",
-                disabled=not (source_id and variable_id)
+                disabled=not (source_id and variable_id and has_rows),
+                on_click=mark_exported if incremental else "rerun",
+                args=(exports[-1:],) if incremental else None
+            )
+        if long_format and id_entries:
+            # IDs of every variable, attached to its rows in the long file
+            id_table = opinum_id_table(id_entries)
+            st.subheader("All variables in one file")
+            st.dataframe(id_table, hide_index=True)
+            long_name = st.text_input("Optional file name", key="fname_long") or "AllVariables"
+            all_ids_set = all(source_id and variable_id for _, source_id, variable_id in id_entries)
+            # Disabled when no variable has rows past its watermark
+            has_rows = not incremental or not all_ids_set or any(delta_rows)
+            st.download_button(
+                label="Download CSV with all variables",
+                data=long_opinum_csv(uploaded_file, probe, usecols, date_col, id_table, watermarks if incremental else None),
+                file_name=long_opinum_names(long_name, 1)[0],
+                mime="text/csv",
+                key="download_long",
+                disabled=not (all_ids_set and has_rows),
+                on_click=mark_exported if incremental else "rerun",
+                args=(exports,) if incremental else None
+            )
+        # Complete mappings are saved for the next file with the same header
+        profile_keys = ["variables", "date_col", "opinum_layout", "fname_long"] + [
+            f"{prefix}_{var}" for var, _, _ in id_entries for prefix in ("source", "varid", "fname")
+        ]
+        if id_entries and all(source_id and variable_id for _, source_id, variable_id in id_entries):
+            if mapping_store.remember(st.session_state, "any_file", layout, columns, profile_keys):
+                st.caption("IDs saved for this file layout: they are filled in again when a file like this is uploaded.")
+        with st.expander("Saved ID profiles"):
+            st.dataframe(mapping_store.frame("any_file"), hide_index=True)
+            st.button(
+                "Forget and clear the IDs of this file layout", key="forget_profile",
+                on_click=forget_profile, args=("any_file", layout, profile_keys)
             )
 
 else:
     st.info("Please upload a file to begin.")
+
+perf_panel.dataframe(perf.frame(), hide_index=True)
+if perf.log_path:
+    perf_panel.caption(f"Also appended to {perf.log_path}")
@@ -0,0 +1,3 @@
+"""
+Shared cleaning helpers used by the Streamlit pages in app_pages/.
+"""
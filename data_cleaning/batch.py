@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Headless batch processing of a directory or glob of input files, without Streamlit.
+
+    python -m data_cleaning.batch energy_box "drop/*.csv" --config ids.json --output out
+
+The config file is JSON with one entry per pipeline, holding the settings the
+page would otherwise ask for, e.g.
+
+    {
+      "energy_box": {
+        "columns": {"Watt Total  [kW]": {"source_id": "123", "variable_id": "456"}},
+        "excel": {"occupancy": [{"days": ["Monday"], "open": "08:00", "close": "18:00"}]},
+        "files": {"site_b": {"columns": {"Watt Total  [kW]": {"source_id": "789", "variable_id": "456"}}}}
+      }
+    }
+
+Entries of "files" (keyed by input file name without extension) override the
+pipeline settings for that file; see data_cleaning.pipelines for every key.
+Outputs are named after the input files, so inputs with the same name in
+different directories are named after their path instead (site_a/data.csv
+becomes site_a_data.csv, also in "files"). A "file_name" shared by several
+inputs is rejected before anything is written.
+Files are processed in a process pool and a throughput line is printed as
+each one finishes. Incremental runs ("incremental": true) process the files
+one at a time in name order instead, so each rolling export only adds the
+rows after the previous one.
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from data_cleaning.ingest import DEFAULT_WORKERS, NamedBytesIO
+from data_cleaning.pipelines import EXTENSIONS, PIPELINES, RUNNERS, PipelineResult, file_settings, file_stem, write_merged
+
+
+def expand_inputs(inputs, extensions):
+    """
+    Input paths from files, directories (files with a matching extension)
+    and glob patterns, sorted and without duplicates.
+    """
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(
+                os.path.join(item, name) for name in os.listdir(item)
+                if name.lower().endswith(extensions)
+            )
+        elif os.path.isfile(item):
+            paths.append(item)
+        else:
+            paths.extend(path for path in glob.glob(item, recursive=True) if os.path.isfile(path))
+    return sorted(set(paths))
+
+
+def input_names(paths):
+    """
+    Name of each input file, from which its outputs are named: its base
+    name, or its path below the inputs' common directory (separators
+    replaced by "_") when another input has the same name without extension.
+    Names still alike get a counter.
+    """
+    names = [os.path.basename(path) for path in paths]
+    stems = [file_stem(name) for name in names]
+    clashing = [i for i, stem in enumerate(stems) if stems.count(stem) > 1]
+    if clashing:
+        root = os.path.commonpath([os.path.abspath(paths[i]) for i in clashing])
+        for i in clashing:
+            names[i] = os.path.relpath(os.path.abspath(paths[i]), root).replace(os.sep, "_")
+    seen = {}
+    for i, name in enumerate(names):
+        stem, extension = os.path.splitext(name)
+        seen[stem] = seen.get(stem, 0) + 1
+        if seen[stem] > 1:
+            names[i] = f"{stem}_{seen[stem]}{extension}"
+    return names
+
+
+def output_names(pipeline, name, settings):
+    """
+    The names the outputs of one input are built from: its "file_name" (or
+    its name) and, for Import Any File, the "file_name" of each column.
+    Consumption files only go to the merged workbook.
+    """
+    if pipeline == "consumption":
+        return []
+    settings = file_settings(settings, name)
+    names = [settings.get("file_name") or file_stem(name)]
+    if pipeline == "any_file" and not settings.get("long"):
+        names.extend(
+            column["file_name"] for column in settings.get("columns", {}).values() if column.get("file_name")
+        )
+    return names
+
+
+def check_output_names(pipeline, names, settings):
+    """
+    Raise ValueError when the outputs of several inputs would have the same
+    name, as they would overwrite each other.
+    """
+    owners = {}
+    for name in names:
+        for output in set(output_names(pipeline, name, settings)):
+            owners.setdefault(output, []).append(name)
+    clashes = [f"'{output}' ({', '.join(inputs)})" for output, inputs in owners.items() if len(inputs) > 1]
+    if clashes:
+        raise ValueError(
+            f"Several input files would write outputs named {'; '.join(clashes)}. "
+            "Set \"file_name\" per file under \"files\" instead."
+        )
+
+
+def run_file(pipeline, path, output_dir, settings, name=None):
+    """
+    Run one pipeline on one file and return (PipelineResult, file size in bytes, seconds).
+    name: the input name its outputs are named from (see input_names), by
+    default its base name. Errors are returned in the result instead of
+    stopping the batch.
+    """
+    start = time.perf_counter()
+    name = name or os.path.basename(path)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as exc:
+        return PipelineResult(name, error=f"Could not read {name}: {exc}"), 0, time.perf_counter() - start
+    try:
+        result = RUNNERS[pipeline](NamedBytesIO(data, name), output_dir, settings)
+    except ValueError as exc:
+        result = PipelineResult(name, error=str(exc))
+    except Exception as exc:
+        result = PipelineResult(name, error=f"Could not process {name}: {type(exc).__name__}: {exc}")
+    return result, len(data), time.perf_counter() - start
+
+
+def report(result, nbytes, seconds):
+    if result.error:
+        return f"{result.name}: FAILED - {result.error}"
+    megabytes = nbytes / 1024 ** 2
+    seconds = max(seconds, 1e-9)
+    return (
+        f"{result.name}: {result.rows:,} rows, {megabytes:.1f} MB in {seconds:.2f} s "
+        f"({result.rows / seconds:,.0f} rows/s, {megabytes / seconds:.1f} MB/s), "
+        f"{len(result.outputs)} files written"
+    )
+
+
+def run_batch(pipeline, paths, output_dir, settings, workers=DEFAULT_WORKERS, log=print):
+    """
+    Process every path, printing a throughput line per file, then write the
+    merged workbook of the pipelines that have one. Returns the results in
+    input order. Raises ValueError, before any file is processed, when the
+    outputs of several files would have the same name.
+    """
+    names = input_names(paths)
+    check_output_names(pipeline, names, settings)
+    os.makedirs(output_dir, exist_ok=True)
+    results = [None] * len(paths)
+    if workers <= 1 or len(paths) <= 1:
+        for i, (path, name) in enumerate(zip(paths, names)):
+            results[i], nbytes, seconds = run_file(pipeline, path, output_dir, settings, name)
+            log(report(results[i], nbytes, seconds))
+    else:
+        # spawn: same start method on every platform, no state inherited from the parent
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(paths)), mp_context=context) as executor:
+            futures = {
+                executor.submit(run_file, pipeline, path, output_dir, settings, name): i
+                for i, (path, name) in enumerate(zip(paths, names))
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                results[i], nbytes, seconds = future.result()
+                log(report(results[i], nbytes, seconds))
+
+    for path in write_merged(pipeline, [r for r in results if not r.error], output_dir):
+        log(f"Merged output: {path}")
+    return results
+
+
+def load_config(path):
+    if path is None:
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m data_cleaning.batch",
+        description="Run a cleaning pipeline on many files and write the Opinum CSVs / Excel files."
+    )
+    parser.add_argument("pipeline", choices=PIPELINES)
+    parser.add_argument("inputs", nargs="+", help="input files, directories or glob patterns")
+    parser.add_argument("-c", "--config", help="JSON file with the source/variable ID mappings and settings")
+    parser.add_argument("-o", "--output", default="output", help="output directory (default: output)")
+    parser.add_argument("-w", "--workers", type=int, default=DEFAULT_WORKERS, help="parallel worker processes")
+    args = parser.parse_args(argv)
+
+    settings = load_config(args.config).get(args.pipeline, {})
+    paths = expand_inputs(args.inputs, EXTENSIONS[args.pipeline])
+    if not paths:
+        parser.error("no input files found")
+
+    # Watermarks must move export by export, oldest first
+    workers = 1 if settings.get("incremental") else args.workers
+    start = time.perf_counter()
+    try:
+        results = run_batch(args.pipeline, paths, args.output, settings, workers)
+    except ValueError as exc:
+        parser.error(str(exc))
+    failed = sum(1 for result in results if result.error)
+    rows = sum(result.rows for result in results)
+    seconds = time.perf_counter() - start
+    print(
+        f"Processed {len(results) - failed}/{len(results)} files, {rows:,} rows in {seconds:.2f} s "
+        f"({rows / max(seconds, 1e-9):,.0f} rows/s)"
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+In-process caches of parsed uploads and generated downloads.
+
+Streamlit reruns every page from the top on each widget interaction, so
+without a cache an uploaded file is parsed again on every keystroke.
+Frames are keyed by a hash of the file content, the parsing step and its
+options, and evicted least-recently-used first once the byte budget is full.
+
+Download payloads (workbooks, Opinum CSVs and ZIPs) are not built while the
+page is drawn: the pages pass ExportCache.deferred callables to
+st.download_button, which Streamlit only calls when the button is clicked.
+The result is kept under the hash of the inputs and the export settings, so
+each distinct export is serialized once.
+"""
+import hashlib
+import io
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from data_cleaning.profiling import record_deferred
+
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2
+DEFAULT_EXPORT_BYTES = 256 * 1024 ** 2
+
+
+def content_hash(uploaded_file):
+    """
+    Return the SHA-1 hex digest of an uploaded file (or any file-like object).
+    """
+    if hasattr(uploaded_file, "getvalue"):
+        data = uploaded_file.getvalue()
+    else:
+        uploaded_file.seek(0)
+        data = uploaded_file.read()
+        uploaded_file.seek(0)
+    return hashlib.sha1(data).hexdigest()
+
+
+def frame_key(uploaded_file, stage, *options):
+    """
+    Key of a parsed frame: file content hash, parsing step and its options.
+    """
+    return (content_hash(uploaded_file), stage, repr(options))
+
+
+def export_key(inputs, stage, *settings):
+    """
+    Key of a generated download: content hash(es) of its inputs, the export
+    step and its settings.
+    """
+    return (inputs, stage, repr(settings))
+
+
+def payload_nbytes(value):
+    """
+    Approximate size of a download payload: bytes, text, buffers and
+    frames, or tuples/lists/dicts of them. Files spilled to disk count by
+    their size, so the budget also bounds the temporary files kept.
+    """
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if hasattr(value, "memory_usage"):
+        return frame_nbytes(value)
+    if isinstance(value, os.PathLike):
+        return os.path.getsize(value)
+    if isinstance(value, io.BytesIO):
+        with value.getbuffer() as buffer:
+            return buffer.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(payload_nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sum(payload_nbytes(item) for item in value.values())
+    return sys.getsizeof(value)
+
+
+def frame_nbytes(frame):
+    """
+    Approximate memory footprint of a DataFrame or Series, including object columns.
+    """
+    usage = frame.memory_usage(deep=True, index=True)
+    if hasattr(usage, "sum"):
+        usage = usage.sum()
+    return int(usage)
+
+
+class IngestCache:
+    """
+    LRU cache of parsed/cleaned DataFrames with a byte budget.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, uploaded_file, stage, *options):
+        return frame_key(uploaded_file, stage, *options)
+
+    def get(self, key):
+        """
+        Return a copy of the cached frame for key, or None (counted as a miss).
+        A copy is returned so callers can add or overwrite columns without
+        touching the cached frame.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                frame, _ = self._entries[key]
+                return self._copy(frame)
+            self.misses += 1
+        return None
+
+    def get_or_parse(self, uploaded_file, parse, *options, stage=None, store=None):
+        """
+        Return parse(uploaded_file, *options), reusing an earlier result for the
+        same file content, stage and options. When store (a FrameStore) is
+        given, it is checked before parsing and receives new results.
+        """
+        key = self.key(uploaded_file, stage or parse.__name__, *options)
+        frame = self.get(key)
+        if frame is not None:
+            return frame
+        if store is not None:
+            frame = store.get(key)
+            if frame is not None:
+                self.put(key, frame)
+                return frame.copy()
+
+        if hasattr(uploaded_file, "seek"):
+            uploaded_file.seek(0)
+        frame = parse(uploaded_file, *options)
+        if frame is None:
+            return None
+        self.put(key, frame)
+        if store is not None:
+            store.put(key, frame)
+        return frame.copy()
+
+    def put(self, key, frame):
+        """
+        Store a frame, evicting the least recently used entries to stay within budget.
+        Frames larger than the whole budget are not cached.
+        """
+        nbytes = self._nbytes(frame)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            while self._entries and self.current_bytes + nbytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_bytes
+            self._entries[key] = (frame, nbytes)
+            self.current_bytes += nbytes
+
+    def _nbytes(self, frame):
+        return frame_nbytes(frame)
+
+    def _copy(self, frame):
+        return frame.copy()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def summary(self):
+        return (
+            f"Ingestion cache: {self.hits} hits, {self.misses} misses, "
+            f"{len(self._entries)} frames, {self.current_bytes / 1024 ** 2:.1f} / "
+            f"{self.max_bytes / 1024 ** 2:.0f} MB"
+        )
+
+
+class ExportCache(IngestCache):
+    """
+    LRU cache of generated download payloads with a byte budget. Payloads
+    are returned as stored: they are not modified once built.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_EXPORT_BYTES):
+        super().__init__(max_bytes)
+
+    def _nbytes(self, payload):
+        return payload_nbytes(payload)
+
+    def _copy(self, payload):
+        return payload
+
+    def built(self, key):
+        """
+        The payload of key if it was built already, else None (not counted
+        in the hits and misses).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        return None if entry is None else entry[0]
+
+    def get_or_build(self, key, build):
+        """
+        Return build(), reusing an earlier result for the same key.
+        """
+        payload = self.get(key)
+        if payload is None:
+            payload = build()
+            self.put(key, payload)
+        return payload
+
+    def deferred(self, key, build, select=None):
+        """
+        Callable for st.download_button's data: builds the payload of key on
+        the first click only, and returns select(payload) when given (one
+        entry of a ZIP, the bytes of a (bytes, notes) pair). Its stages are
+        recorded into the download stages of the page's recorder.
+        """
+        def data():
+            payload = self.get_or_build(key, build)
+            return payload if select is None else select(payload)
+        return record_deferred(data, key[1])
+
+    def summary(self):
+        return (
+            f"Export cache: {self.hits} hits, {self.misses} misses, "
+            f"{len(self._entries)} files, {self.current_bytes / 1024 ** 2:.1f} / "
+            f"{self.max_bytes / 1024 ** 2:.0f} MB"
+        )
+
+
+# Shared by all pages; modules are imported once per Streamlit server process
+ingest_cache = IngestCache()
+export_cache = ExportCache()
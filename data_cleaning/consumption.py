@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""
+Loading and cleaning helpers for meter data used by the Consumption Data page.
+"""
+import csv
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+from data_cleaning.dates import parse_timestamps
+from data_cleaning.excel_reader import read_workbook
+from data_cleaning.ingest import read_csv
+from data_cleaning.profiling import timed
+from data_cleaning.registers import analyze_register
+
+CHUNK_ROWS = 200_000
+# Rows looked at to tell whether a column holds numbers
+DETECT_ROWS = 1000
+STANDARD_COLUMNS = ['timestamp', 'consumption_kWh', 'source_file', 'missing_flag']
+
+
+def sniff_delimiter(uploaded_file):
+    """
+    Guess the delimiter of a CSV file from its first bytes.
+    """
+    first_bytes = uploaded_file.read(2048).decode('utf-8')
+    uploaded_file.seek(0)
+    sniffer = csv.Sniffer()
+    try:
+        dialect = sniffer.sniff(first_bytes)
+        return dialect.delimiter
+    except Exception:
+        return ';'  # fallback for European CSVs
+
+
+@timed()
+def load_file(uploaded_file, sheet_name=None):
+    """
+    Load a CSV or XLSX file into a DataFrame.
+    Auto-detects file type and tries to guess delimiter for CSV.
+    Excel files are read from sheet_name, else their largest visible sheet
+    (see data_cleaning.excel_reader).
+    Raises ValueError for unsupported file types.
+    """
+    file_name = uploaded_file.name
+    if file_name.lower().endswith('.csv'):
+        df = read_csv(uploaded_file, delimiter=sniff_delimiter(uploaded_file))
+    elif file_name.lower().endswith(('.xls', '.xlsx')):
+        df = read_workbook(uploaded_file, sheet_name)
+    else:
+        raise ValueError(f"Unsupported file type: {file_name}")
+    df['source_file'] = file_name
+    return df
+
+
+def detect_datetime_column(df):
+    """
+    Try to find the column containing date/time information.
+    """
+    for col in df.columns:
+        if any(x in col.lower() for x in ['date', 'time', 'timestamp']):
+            return col
+    # Fallback: try first column
+    return df.columns[0]
+
+
+def standardize_dates(df, datetime_col):
+    """
+    Standardize date/time column to pandas datetime.
+    Handles common formats, Excel serial dates, UNIX timestamps.
+    The column is parsed once with a format inferred from a sample (see
+    data_cleaning.dates); the strategy used is kept in df.attrs['timestamp_strategy'].
+    """
+    df['timestamp'], df.attrs['timestamp_strategy'] = parse_timestamps(df[datetime_col])
+    return df
+
+
+def load_standardized(uploaded_file, sheet_name=None):
+    """
+    Load a file and add its standardized 'timestamp' column.
+    """
+    df = load_file(uploaded_file, sheet_name)
+    datetime_col = detect_datetime_column(df)
+    return standardize_dates(df, datetime_col)
+
+
+def to_numeric_columns(df, exclude=()):
+    """
+    Convert object columns whose non-empty cells all read as numbers
+    (comma or dot decimals) to float64; other columns are left as they are.
+    """
+    for col in df.columns:
+        if col in exclude or df[col].dtype != object:
+            continue
+        numbers = pd.to_numeric(df[col].astype(str).str.strip().str.replace(',', '.', regex=False), errors='coerce')
+        if numbers.notna().sum() == df[col].notna().sum():
+            df[col] = numbers
+    return df
+
+
+def load_standardized_chunked(uploaded_file, sheet_name=None, chunksize=CHUNK_ROWS):
+    """
+    Chunked variant of load_standardized for very large CSV files.
+    Each chunk has its numeric-looking columns converted to float64 before the
+    next one is read, so the values of the whole file are never held as Python
+    strings at once. This only lowers the peak while parsing: the chunks are
+    concatenated, and the result is the whole file in one frame like
+    load_standardized. Dates are standardized once on the whole column, as the
+    first chunk alone may not tell day-first from month-first dates.
+    Excel files are loaded whole.
+    """
+    file_name = uploaded_file.name
+    if not file_name.lower().endswith('.csv'):
+        return load_standardized(uploaded_file, sheet_name)
+    chunks = []
+    with pd.read_csv(uploaded_file, delimiter=sniff_delimiter(uploaded_file), chunksize=chunksize) as reader:
+        for chunk in reader:
+            datetime_col = detect_datetime_column(chunk)
+            chunks.append(to_numeric_columns(chunk, exclude=(datetime_col,)))
+    df = pd.concat(chunks, ignore_index=True)
+    df['source_file'] = file_name
+    return standardize_dates(df, datetime_col)
+
+
+def detect_consumption_column(df, sample_rows=DETECT_ROWS):
+    """
+    Try to find the column containing consumption values.
+    Only select columns with numeric-like data, judged on the first
+    sample_rows rows.
+    """
+    head = df.head(sample_rows)
+    for col in df.columns:
+        if any(x in col.lower() for x in ['consumption', 'kwh', 'energy', 'value', 'usage']):
+            # Check if column is numeric-like
+            sample = head[col].astype(str).str.replace(',', '.', regex=False)
+            numeric_sample = pd.to_numeric(sample, errors='coerce')
+            if numeric_sample.notna().sum() > 0:
+                return col
+    # Fallback: try second column if it's numeric
+    if len(df.columns) > 1:
+        sample = head[df.columns[1]].astype(str).str.replace(',', '.', regex=False)
+        numeric_sample = pd.to_numeric(sample, errors='coerce')
+        if numeric_sample.notna().sum() > 0:
+            return df.columns[1]
+    return None
+
+
+def to_float_block(frame):
+    """
+    Convert columns to one float64 array (rows x columns), reading text
+    cells stripped, with decimal commas accepted and empty or non-numeric
+    cells as NaN. Text columns are converted together in one
+    pass over their stacked cells.
+    """
+    block = np.empty(frame.shape, dtype="float64")
+    text_cols = []
+    for j, col in enumerate(frame.columns):
+        series = frame[col]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            block[:, j] = series.to_numpy(dtype="float64", na_value=np.nan)
+        else:
+            text_cols.append(j)
+    if text_cols:
+        cells = pd.Series(frame.iloc[:, text_cols].to_numpy(dtype=object).ravel()).astype(str).str.strip()
+        numbers = pd.to_numeric(cells.str.replace(',', '.', regex=False), errors='coerce')
+        block[:, text_cols] = numbers.to_numpy(dtype="float64").reshape(len(frame), len(text_cols))
+    return block
+
+
+def native_interval(timestamps):
+    """
+    Most common interval between consecutive distinct timestamps (a Timedelta),
+    or None for fewer than two timestamps.
+    """
+    diffs = timestamps.sort_values().diff().dropna()
+    diffs = diffs[diffs > pd.Timedelta(0)]
+    if diffs.empty:
+        return None
+    return diffs.mode()[0]
+
+
+def fixed_step(offset):
+    """
+    Length of a fixed-length offset ('15min', 'h', 'D') as a Timedelta,
+    None for calendar offsets ('MS', 'W', ...).
+    """
+    try:
+        return pd.Timedelta(offset)
+    except (TypeError, ValueError):
+        return None
+
+
+def localize_timestamps(timestamps, tz):
+    """
+    Timestamps as timezone-aware UTC. Naive timestamps are read as local
+    (wall clock) time in tz: the hour repeated when the clocks go back is
+    resolved from the order of the readings, or set to NaT when it cannot be,
+    and times skipped when the clocks go forward are moved forward.
+    Raises ValueError for an unknown timezone.
+    """
+    try:
+        ZoneInfo(tz)
+    except (ValueError, ZoneInfoNotFoundError):
+        raise ValueError(f"Unknown timezone: {tz}")
+    if timestamps.dt.tz is None:
+        try:
+            timestamps = timestamps.dt.tz_localize(tz, ambiguous='infer', nonexistent='shift_forward')
+        except Exception:  # ValueError, or pytz's AmbiguousTimeError with pandas < 3
+            timestamps = timestamps.dt.tz_localize(tz, ambiguous='NaT', nonexistent='shift_forward')
+    return timestamps.dt.tz_convert('UTC')
+
+
+@timed()
+def interval_block(df, interval, consumption_cols, impute_strategy='auto', register_max=None, diagnostics=None):
+    """
+    Consumption per interval of the consumption columns, on a regular grid of
+    the given interval (a Timedelta) from the first to the last timestamp.
+    The frame is sorted, deduplicated (first non-empty value per timestamp and
+    column) and reindexed once for all columns. Cumulative columns are told
+    apart and differenced by analyze_register, rollovers at register_max
+    included: the consumption between two readings is the value of the
+    interval starting at the first one, so every value is labelled by the
+    start of its interval. impute_strategy ('auto', 'distribute', 'zero' or
+    'nan') fills missing values: 'distribute' spreads the rise of a cumulative
+    register over the missing intervals, 'zero' sets them to 0 and 'nan' (or
+    'distribute' on interval data) leaves them empty; 'auto' distributes
+    cumulative columns only.
+    The RegisterAnalysis of each cumulative column is added to the
+    diagnostics dict, when given.
+    Returns (grid DatetimeIndex, values array rows x columns).
+    """
+    df = df[['timestamp'] + list(consumption_cols)].sort_values('timestamp')
+    df = df.groupby('timestamp').first()
+    idx = pd.date_range(df.index.min(), df.index.max(), freq=interval)
+    consumption = to_float_block(df.reindex(idx))
+
+    values = consumption.copy()
+    for j, col in enumerate(consumption_cols):
+        # Cumulative columns: the readings rise, apart from rollovers, resets and spikes
+        register = analyze_register(consumption[:, j], register_max, idx)
+        strategy = impute_strategy
+        if strategy == 'auto':
+            strategy = 'distribute' if register.is_cumulative else 'nan'
+        if register.is_cumulative:
+            differences = register.consumption
+            if strategy != 'distribute':
+                differences = np.where(register.interpolated, np.nan, differences)
+            values[:, j] = np.append(differences[1:], np.nan)
+            if diagnostics is not None:
+                diagnostics[col] = register
+        if strategy == 'zero':
+            values[:, j] = np.nan_to_num(values[:, j], nan=0.0)
+    return idx, values
+
+
+@timed()
+def resample_consumption(df, consumption_cols, freq=None, impute_strategy='auto', tz=None, register_max=None,
+                         diagnostics=None):
+    """
+    Consumption of one standardized file per freq bucket, for each column.
+
+    The readings are regularized on their own interval first (see
+    interval_block). Coarser frequencies ('h', 'D', 'MS', ...) then sum the
+    intervals of each bucket in one resample; finer fixed frequencies split
+    every interval evenly, which needs the interval to be a multiple of freq.
+    Without freq the values stay on the file's own interval.
+    With tz, naive timestamps are local time in tz (see localize_timestamps),
+    buckets follow local days and months across DST changes and the
+    timestamps returned are tz-aware. register_max and diagnostics go to
+    interval_block.
+    Returns (timestamps, values, missing flags), values and flags being
+    rows x columns arrays. A bucket is flagged when one of its intervals has
+    no value or when its total is 0 or less.
+    Raises ValueError when there is no timestamp or freq cannot be reached.
+    """
+    timestamps = df['timestamp']
+    if tz:
+        timestamps = localize_timestamps(timestamps, tz)
+    if timestamps.notna().sum() == 0:
+        raise ValueError("No valid timestamps")
+    target = to_offset(freq) if freq else None
+    step = fixed_step(target) if target is not None else None
+    interval = native_interval(timestamps.dropna()) or step or pd.Timedelta(hours=1)
+
+    frame = pd.DataFrame({'timestamp': timestamps.to_numpy()}, index=df.index)
+    frame[list(consumption_cols)] = df[list(consumption_cols)]
+    index, values = interval_block(frame, interval, consumption_cols, impute_strategy, register_max, diagnostics)
+    if tz:
+        index = index.tz_convert(tz)
+    missing = np.isnan(values)
+
+    if target is None or step == interval:
+        pass
+    elif step is not None and step < interval:
+        ratio = interval / step
+        if ratio != int(ratio):
+            raise ValueError(f"Readings every {interval} cannot be split into {freq} intervals")
+        ratio = int(ratio)
+        index = index.repeat(ratio) + pd.to_timedelta(np.tile(np.arange(ratio), len(index)) * step)
+        values = np.repeat(values / ratio, ratio, axis=0)
+        missing = np.repeat(missing, ratio, axis=0)
+    else:
+        totals = pd.DataFrame(values, index=index).resample(target).sum(min_count=1)
+        gaps = pd.DataFrame(missing, index=index).resample(target).sum()
+        index, values, missing = totals.index, totals.to_numpy(), gaps.to_numpy() > 0
+
+    with np.errstate(invalid='ignore'):
+        missing = missing | np.isnan(values) | (values <= 0)
+    return index, values, missing
+
+
+def clean_consumption(df, consumption_cols=None, freq=None, impute_strategy='auto', tz=None, register_max=None,
+                      diagnostics=None):
+    """
+    Aggregate and impute the consumption column(s) of one standardized file.
+    consumption_cols: columns to process, auto-detected when empty.
+    freq: bucket frequency ('15min', 'h', 'D', 'MS', ...); the file's own
+    interval when empty. tz: timezone of the timestamps, for DST-aware buckets.
+    register_max: value(s) at which cumulative registers roll over, the next
+    power of ten when None; diagnostics: dict receiving the RegisterAnalysis
+    of each cumulative column (see interval_block).
+    All columns are processed together (see resample_consumption).
+    Returns one frame with STANDARD_COLUMNS per consumption column.
+    Raises ValueError when no consumption column can be detected, or when
+    the file cannot be resampled to freq.
+    """
+    consumption_cols = list(dict.fromkeys(consumption_cols or [detect_consumption_column(df)]))
+    if None in consumption_cols:
+        raise ValueError("Could not detect consumption column")
+    index, values, missing = resample_consumption(
+        df, consumption_cols, freq, impute_strategy, tz, register_max, diagnostics
+    )
+    source_file = df['source_file'].iloc[0] if 'source_file' in df.columns else None
+    return [
+        pd.DataFrame({
+            'timestamp': index,
+            'consumption_kWh': values[:, j],
+            'source_file': source_file,
+            'missing_flag': missing[:, j],
+        })
+        for j in range(len(consumption_cols))
+    ]
+
+
+def merge_standardized(frames):
+    """
+    Concatenate cleaned frames into one dataset sorted by timestamp.
+    """
+    if not frames:
+        return pd.DataFrame(columns=STANDARD_COLUMNS)
+    merged = pd.concat(frames, ignore_index=True)
+    return merged.sort_values('timestamp').reset_index(drop=True)
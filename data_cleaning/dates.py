@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Fast timestamp parsing shared by the pages.
+
+An explicit format is inferred from a sample of the values, and the column is
+parsed once with that format. When values repeat a lot (daily dates on
+interval data, merged logger exports), each distinct string is parsed only
+once through pandas' conversion cache; mostly-unique columns in fixed-width
+day/month layouts are parsed with integer arithmetic on their characters.
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from data_cleaning.profiling import timed
+
+try:
+    from pandas.tseries.api import guess_datetime_format
+except ImportError:  # pandas < 2.2
+    from pandas._libs.tslibs.parsing import guess_datetime_format
+
+SAMPLE_SIZE = 500
+# A format parsing less of the sample than this falls back to the original chain
+MIN_FORMAT_SHARE = 0.9
+
+# Tried after pandas' own guess on the sample
+CANDIDATE_FORMATS = [
+    "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d",
+    "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y",
+    "%m/%d/%Y %H:%M:%S", "%m/%d/%Y %H:%M", "%m/%d/%Y",
+    "%d.%m.%Y %H:%M:%S", "%d.%m.%Y %H:%M", "%d.%m.%Y",
+    "%d-%m-%Y %H:%M:%S", "%d-%m-%Y %H:%M", "%d-%m-%Y",
+]
+
+# Zero-padded numeric fields that parse_with_format handles with integer arithmetic
+FIXED_WIDTH_FIELDS = {"%Y": 4, "%m": 2, "%d": 2, "%H": 2, "%M": 2, "%S": 2}
+
+# Plausible Excel serial dates: 1954-10-03 to 2119-01-09
+EXCEL_SERIAL_RANGE = (20000, 80000)
+
+
+def spread_sample(values, size=SAMPLE_SIZE):
+    """
+    Evenly spaced sample, so day-first dates with a day > 12 are likely included.
+    """
+    if len(values) <= size:
+        return values
+    return values[np.linspace(0, len(values) - 1, size).astype(int)]
+
+
+def infer_datetime_format(strings, dayfirst=False):
+    """
+    Return the first format that parses every value of a sample of strings,
+    else the one parsing the largest share (at least MIN_FORMAT_SHARE), else None.
+    """
+    sample = spread_sample(np.asarray(strings, dtype=object))
+    if len(sample) == 0 or not isinstance(sample[0], str):
+        return None
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        guesses = [guess_datetime_format(sample[0], dayfirst=dayfirst),
+                   guess_datetime_format(sample[0], dayfirst=not dayfirst)]
+    best_fmt, best_share = None, MIN_FORMAT_SHARE
+    for fmt in dict.fromkeys(g for g in guesses + CANDIDATE_FORMATS if g):
+        share = pd.to_datetime(pd.Series(sample), format=fmt, errors="coerce").notna().mean()
+        if share == 1:
+            return fmt
+        if share >= best_share:
+            best_fmt, best_share = fmt, share
+    return best_fmt
+
+
+def _fixed_width_layout(fmt):
+    """
+    Return [(directive, offset, width)] and the total width for formats made only
+    of zero-padded numeric fields and literal separators, else None.
+    """
+    layout, literals, offset, i = [], [], 0, 0
+    while i < len(fmt):
+        if fmt[i] == "%":
+            directive = fmt[i:i + 2]
+            if directive not in FIXED_WIDTH_FIELDS:
+                return None
+            width = FIXED_WIDTH_FIELDS[directive]
+            layout.append((directive, offset, width))
+            offset += width
+            i += 2
+        else:
+            literals.append((offset, fmt[i]))
+            offset += 1
+            i += 1
+    return layout, literals, offset
+
+
+def _parse_fixed_width(strings, layout, literals, width):
+    """
+    Parse equal-length strings with integer arithmetic on their code points.
+    Invalid dates become NaT, like errors='coerce'.
+    """
+    raw = np.asarray(strings, dtype=f"U{width}")
+    chars = raw.view(np.uint32).reshape(len(raw), width)
+    valid = np.ones(len(raw), dtype=bool)
+    for offset, char in literals:
+        valid &= chars[:, offset] == ord(char)
+
+    fields = {"%Y": 1970, "%m": 1, "%d": 1, "%H": 0, "%M": 0, "%S": 0}
+    for directive, offset, field_width in layout:
+        digits = chars[:, offset:offset + field_width].astype(np.int64) - ord("0")
+        valid &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+        fields[directive] = digits @ (10 ** np.arange(field_width - 1, -1, -1))
+    year, month, day = (np.broadcast_to(fields[d], len(raw)) for d in ("%Y", "%m", "%d"))
+    hour, minute, second = (np.broadcast_to(fields[d], len(raw)) for d in ("%H", "%M", "%S"))
+    valid &= (month >= 1) & (month <= 12) & (day >= 1) & (hour < 24) & (minute < 60) & (second < 60)
+
+    month_start = (year - 1970).astype("M8[Y]").astype("M8[M]") + np.where(valid, month - 1, 0).astype("m8[M]")
+    days_in_month = ((month_start + 1).astype("M8[D]") - month_start.astype("M8[D]")).astype(np.int64)
+    valid &= day <= days_in_month
+    stamps = (month_start.astype("M8[D]") + np.where(valid, day - 1, 0).astype("m8[D]")).astype("M8[ns]")
+    stamps = stamps + ((hour * 60 + minute) * 60 + second).astype("m8[s]")
+    stamps[~valid] = np.datetime64("NaT")
+    return stamps
+
+
+def parse_with_format(strings, fmt):
+    """
+    pd.to_datetime(strings, format=fmt, errors='coerce'), using integer arithmetic
+    for fixed-width numeric formats such as '%d/%m/%Y %H:%M', which pandas
+    otherwise parses one element at a time.
+    """
+    strings = pd.Series(strings, dtype=object)
+    # ISO 8601 layouts already have a fast C parser in pandas
+    fixed = None if fmt.startswith("%Y-%m-%d") else _fixed_width_layout(fmt)
+    if fixed is None:
+        return pd.to_datetime(strings, format=fmt, errors="coerce")
+    layout, literals, width = fixed
+
+    present = strings.notna().to_numpy()
+    text = strings.to_numpy()[present].astype(str)
+    fits = np.char.str_len(text) == width
+    stamps = _parse_fixed_width(text[fits], layout, literals, width)
+
+    result = np.full(len(strings), np.datetime64("NaT"), dtype="M8[ns]")
+    positions = np.flatnonzero(present)
+    result[positions[fits]] = stamps
+    if not fits.all():
+        # Values of another length (unpadded fields, stray text) go through pandas
+        others = positions[~fits]
+        result[others] = pd.to_datetime(strings.iloc[others], format=fmt, errors="coerce").to_numpy(dtype="M8[ns]")
+    return pd.Series(result, index=strings.index)
+
+
+def _parse_numbers(values):
+    numbers = pd.to_numeric(values, errors="coerce")
+    valid = numbers.dropna()
+    if not valid.empty and valid.between(*EXCEL_SERIAL_RANGE).all():
+        return pd.to_datetime(numbers, unit="D", origin="1899-12-30", errors="coerce"), "excel serial"
+    return pd.to_datetime(numbers, unit="s", errors="coerce"), "unix seconds"
+
+
+def _parse_fallback(values):
+    """
+    The original chain: default parser, dayfirst, Excel serial dates, UNIX seconds,
+    moving on while more than half of the values are NaT.
+    """
+    def mostly_nat(parsed):
+        return parsed.isna().sum() > len(parsed) // 2
+
+    parsed = pd.to_datetime(values, errors="coerce")
+    strategy = "default"
+    if mostly_nat(parsed):
+        parsed = pd.to_datetime(values, errors="coerce", dayfirst=True)
+        strategy = "dayfirst"
+    for unit, origin, name in (("D", "1899-12-30", "excel serial"), ("s", "unix", "unix seconds")):
+        if mostly_nat(parsed):
+            try:
+                parsed = pd.to_datetime(values, unit=unit, origin=origin, errors="coerce")
+                strategy = name
+            except Exception:
+                pass
+    return parsed, strategy
+
+
+@timed()
+def parse_timestamps(values, dayfirst=False, fmt=None):
+    """
+    Parse a column of dates into datetime64 values.
+    fmt forces the format, e.g. one inferred from a sample of a whole file
+    that is parsed chunk by chunk.
+    Returns (Series aligned on the input index, strategy used), where strategy is
+    'datetime' (already parsed), 'format <fmt>', 'excel serial', 'unix seconds',
+    or one of the fallback steps 'default'/'dayfirst'.
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values, "datetime"
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        parsed, strategy = _parse_numbers(values)
+        return pd.Series(parsed, index=values.index), strategy
+
+    raw = values.to_numpy()
+    sample = spread_sample(raw)
+    if fmt is None:
+        fmt = infer_datetime_format(sample[pd.notna(sample)], dayfirst=dayfirst)
+    # When consecutive values repeat a lot, pandas' cache parses each distinct
+    # string once; mostly-unique columns go through the integer fast path instead
+    head = raw[:SAMPLE_SIZE]
+    head = head[pd.notna(head)]
+    repeated = len(set(head)) <= len(head) // 2
+    if fmt is None:
+        parsed, strategy = _parse_fallback(values)
+    elif repeated:
+        parsed, strategy = pd.to_datetime(values, format=fmt, errors="coerce", cache=True), f"format {fmt}"
+    else:
+        parsed, strategy = parse_with_format(values, fmt), f"format {fmt}"
+    return pd.Series(parsed, index=values.index), strategy
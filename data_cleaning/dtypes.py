@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Memory-compact dtypes for the frames the pages keep and export.
+
+- Constant columns such as the Opinum source and variable IDs are stored as
+  one-category categoricals (one byte per row) instead of a full object column.
+- Repeated text (source file names, labels) becomes categorical.
+- float64 values that are decimals of at most FLOAT32_DIGITS significant
+  digits (sensor readings, meter values) are stored as float32.
+  widen_float32 recovers the exact float64 for Excel and, through
+  widen_frame, for CSV exports, where pandas would print float32 values in
+  scientific notation (1e+06). Parquet exports keep the float32 columns.
+- Integers are downcast to the smallest integer type holding them.
+- Timestamps stay datetime64 (int64 nanoseconds) and are only formatted when
+  the file is written.
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+from data_cleaning.cache import frame_nbytes
+
+# float32 stores any decimal of this many significant digits and prints it back (FLT_DIG)
+FLOAT32_DIGITS = 6
+# Text columns with at most this share of distinct values become categorical
+MAX_CATEGORY_SHARE = 0.5
+
+
+def _decimal_rounding(values, digits=FLOAT32_DIGITS):
+    """
+    Nearest float64 to each value rounded to digits significant digits, with
+    a single correctly rounded division or multiplication by a power of ten.
+    """
+    exponent = np.floor(np.log10(np.abs(values)))
+    # log10 can land just below an exact power of ten
+    exponent[np.abs(values) >= 10.0 ** (exponent + 1)] += 1
+    shift = digits - 1 - exponent
+    with np.errstate(over="ignore", invalid="ignore"):
+        scaled = np.round(values * 10.0 ** shift)
+        return np.where(shift >= 0, scaled / 10.0 ** np.abs(shift), scaled * 10.0 ** np.abs(shift))
+
+
+def fits_float32(values):
+    """
+    True when every finite non-zero value is a decimal of at most
+    FLOAT32_DIGITS significant digits, within float32's range.
+    """
+    values = np.asarray(values, dtype="float64")
+    values = values[np.isfinite(values) & (values != 0)]
+    if values.size == 0:
+        return True
+    magnitude = np.abs(values)
+    if magnitude.min() < np.finfo("float32").tiny or magnitude.max() > np.finfo("float32").max:
+        return False
+    return bool(np.array_equal(_decimal_rounding(values), values))
+
+
+def widen_float32(values):
+    """
+    float64 values of a float32 array downcast by compact_series, without
+    the binary noise of a plain cast (97.7 instead of 97.69999694824219).
+    """
+    values = np.asarray(values, dtype="float64")
+    result = values.copy()
+    finite = np.isfinite(values) & (values != 0)
+    result[finite] = _decimal_rounding(values[finite])
+    return result
+
+
+def widen_frame(frame):
+    """
+    frame with its float32 columns widened back to float64 (see
+    widen_float32), for to_csv; frame itself when it has none.
+    """
+    float32 = [col for col in frame.columns if frame[col].dtype == "float32"]
+    if not float32:
+        return frame
+    frame = frame.copy()
+    for col in float32:
+        frame[col] = widen_float32(frame[col].to_numpy())
+    return frame
+
+
+def constant_column(value, n_rows):
+    """
+    A column repeating one value as a single-category categorical.
+    """
+    if value is None or value != value:
+        return pd.Categorical.from_codes(np.full(n_rows, -1, dtype="int8"), categories=[])
+    return pd.Categorical.from_codes(np.zeros(n_rows, dtype="int8"), categories=[value])
+
+
+def compact_series(series):
+    """
+    series with the most compact dtype that keeps its values (widen_float32
+    gets the float64 values back).
+    """
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype) or isinstance(dtype, pd.CategoricalDtype):
+        return series
+    if pd.api.types.is_float_dtype(dtype):
+        if dtype == "float64" and fits_float32(series.to_numpy()):
+            return series.astype("float32")
+        return series
+    if pd.api.types.is_integer_dtype(dtype) and not isinstance(dtype, pd.api.extensions.ExtensionDtype):
+        return pd.Series(pd.to_numeric(series, downcast="integer"), index=series.index, name=series.name)
+    if dtype == object and len(series):
+        values = series.dropna()
+        # Only plain text: mixed numbers and text would print differently once
+        # categorical. The head is checked first, as most mixed columns show it early.
+        if (
+            values.iloc[:1000].map(type).eq(str).all()
+            and series.nunique() <= MAX_CATEGORY_SHARE * len(series)
+            and values.map(type).eq(str).all()
+        ):
+            return series.astype("category")
+    return series
+
+
+def compact_frame(frame):
+    """
+    A copy of frame with compact column dtypes (see compact_series).
+    """
+    compact = pd.DataFrame({col: compact_series(frame[col]) for col in frame.columns}, index=frame.index)
+    compact.attrs = dict(frame.attrs)
+    return compact
+
+
+def bytes_saved(frame):
+    """
+    Bytes a frame saves compared with the same values in pandas' default
+    dtypes: object columns for categoricals, float64 and int64 for numbers.
+    """
+    default = 0
+    for col in frame.columns:
+        series = frame[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            counts = series.value_counts(dropna=False)
+            default += 8 * len(series) + sum(sys.getsizeof(value) * count for value, count in counts.items())
+        elif pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            default += 8 * len(series)
+        else:
+            default += series.memory_usage(deep=True, index=False)
+    return int(default + frame.index.memory_usage(deep=True) - frame_nbytes(frame))
+
+
+def opinum_frame(dates, values, source_id, variable_id):
+    """
+    The (date, value, source_id, variable_id) frame of one Opinum file with
+    compact dtypes: the IDs are one-category columns and float values are
+    stored as float32 when they fit (write it through widen_frame). Dates
+    are kept as given (datetime64 stays unformatted until the frame is written).
+    """
+    n_rows = len(dates)
+    return pd.DataFrame({
+        "date": pd.Series(dates).to_numpy(),
+        "value": compact_series(pd.Series(values).reset_index(drop=True)).to_numpy(),
+        "source_id": constant_column(source_id, n_rows),
+        "variable_id": constant_column(variable_id, n_rows),
+    })
+
+
+def format_saved(frame_name, saved_bytes):
+    return f"{frame_name}: {saved_bytes / 1024 ** 2:.1f} MB saved by compact dtypes"
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Cleaning steps for Energy Box CSV exports, shared by the Energy Box page
+and the streaming (chunked) mode.
+"""
+import re
+
+import pandas as pd
+
+from data_cleaning.dates import parse_timestamps
+from data_cleaning.numeric import parse_numeric_column
+from data_cleaning.occupancy import label_calendar
+from data_cleaning.profiling import stage, timed
+
+# Column layout of the file for the Electricity analysis Excel template
+EXCEL_COLUMNS = [
+    "date", "occupied", "on_peak", "Frequency  [Hz]", "I A  [A]", "I B  [A]", "I C  [A]", "I N  [A]", "I Average  [A]",
+    "Pwr Factor A", "Pwr Factor B", "Pwr Factor C", "Pwr Factor Total",
+    "VA A  [kVA]", "VA B  [kVA]", "VA C  [kVA]", "VA Total  [kVA]",
+    "Volts AN  [V]", "Volts BN  [V]", "Volts CN  [V]", "Volts LN Average  [V]",
+    "Volts AB  [V]", "Volts BC  [V]", "Volts CA  [V]", "Volts LL Average  [V]",
+    "Watt A  [kW]", "Watt B  [kW]", "Watt C  [kW]", "Watt Total  [kW]"
+]
+
+
+def clean_header(df):
+    """
+    Drop the 'No.' and trailing empty column, rename 'Time Stamp' to 'date'
+    and remove '(float)' from all column names.
+    """
+    df_cleaned = df.drop(columns=['No.'])
+    df_cleaned = df_cleaned.iloc[:, :-1]
+    df_cleaned = df_cleaned.rename(columns={"Time Stamp": "date"})
+    df_cleaned.columns = df_cleaned.columns.str.replace('(float)', '', regex=False).str.strip()
+    return df_cleaned
+
+
+@timed()
+def load_energy_box(uploaded_file):
+    """
+    Parse an Energy Box CSV export and clean its header.
+    """
+    return clean_header(pd.read_csv(uploaded_file, skiprows=[0]))
+
+
+def normalize_name(name):
+    """
+    Remove the bracketed unit part, collapse spaces and lowercase a column name.
+    """
+    name_no_unit = re.sub(r"\s*\[.*?\]", "", name).strip()
+    name_no_unit = re.sub(r"\s+", " ", name_no_unit)
+    return name_no_unit.lower()
+
+
+@timed()
+def build_excel_frame(df_cleaned, calendar, date_format=None):
+    """
+    Build the Excel template frame: parsed dates, the 'occupied' and 'on_peak'
+    labels from a compiled calendar, then the EXCEL_COLUMNS converted to numbers
+    (matched on their name without unit) and empty columns for missing ones.
+    date_format forces the date format (see parse_timestamps).
+    Returns (frame, {column: number of cells kept as text}).
+    """
+    # Use the full df (not just selected columns)
+    df_excel = df_cleaned.copy()
+    df_excel['date'], _ = parse_timestamps(df_excel['date'], fmt=date_format)
+    labels = label_calendar(df_excel['date'], calendar)
+    df_excel['is_weekend'] = labels['is_weekend']
+    df_excel['on_peak'] = labels['on_peak']
+    df_excel['occupied'] = labels['occupied']
+
+    existing_map = {normalize_name(c): c for c in df_excel.columns}
+
+    # For each desired column, try to fill from matching existing column (ignoring unit suffix),
+    # and convert values to numeric when appropriate.
+    unparsed_counts = {}
+    with stage("parse_numeric_column", rows=len(df_excel)):
+        for desired in EXCEL_COLUMNS:
+            norm = normalize_name(desired)
+            if desired in df_excel.columns:
+                # exact match exists, try to convert values
+                if df_excel[desired].dtype == object:
+                    df_excel[desired], unparsed_counts[desired] = parse_numeric_column(df_excel[desired])
+            elif norm in existing_map:
+                # create the desired-named column from source column
+                df_excel[desired], unparsed_counts[desired] = parse_numeric_column(df_excel[existing_map[norm]])
+            else:
+                # column missing: create empty column
+                df_excel[desired] = ""
+
+    # Only use the template columns, no extras
+    return df_excel[EXCEL_COLUMNS], {col: n for col, n in unparsed_counts.items() if n}
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Row-streaming Excel writer.
+
+xlsxwriter's constant_memory mode flushes every row to disk once the next one
+is written, so a workbook can be built from DataFrame chunks without holding
+the whole sheet in memory. Each column is converted once per chunk (dates to
+Excel serial numbers with a date format, numbers to floats) and written with
+the matching typed xlsxwriter method, instead of having every cell's type
+checked. Sheets are split at Excel's row limit, and exports too big to be
+practical in Excel can be written as CSV or Parquet instead.
+"""
+import io
+import math
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+from data_cleaning.dtypes import widen_float32, widen_frame
+from data_cleaning.profiling import stage
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+DATETIME_FORMAT = "yyyy-mm-dd hh:mm:ss"
+EXCEL_MAX_ROWS = 1_048_576
+# Data rows per sheet, below the header row
+SHEET_ROWS = EXCEL_MAX_ROWS - 1
+# Above this many cells a workbook takes minutes to write and open:
+# offer CSV/Parquet instead (a year of minute data over 29 columns is ~15M)
+EXCEL_MAX_CELLS = 30_000_000
+EXCEL_EPOCH = pd.Timestamp("1899-12-30")
+
+EXPORT_MIME = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def sheet_count(n_rows):
+    """
+    Number of sheets needed for n_rows data rows.
+    """
+    return max(1, math.ceil(n_rows / SHEET_ROWS))
+
+
+def sheet_title(sheet_name, index):
+    """
+    Name of the index-th (0-based) sheet of a split export, within Excel's 31 characters.
+    """
+    if index == 0:
+        return sheet_name[:31]
+    suffix = f" ({index + 1})"
+    return sheet_name[:31 - len(suffix)] + suffix
+
+
+def too_big_for_excel(n_rows, n_cols):
+    return n_rows * n_cols > EXCEL_MAX_CELLS
+
+
+def export_formats():
+    """
+    Formats a frame can be exported to: xlsx, csv and, with pyarrow, parquet.
+    """
+    return ["xlsx", "csv", "parquet"] if HAS_PYARROW else ["xlsx", "csv"]
+
+
+def _columns(worksheet, chunk, date_format):
+    """
+    (write method, values, cell format) for each column of a chunk, with
+    missing values as None.
+    """
+    columns = []
+    for col in chunk.columns:
+        series = chunk[col]
+        missing = series.isna().to_numpy()
+        if pd.api.types.is_datetime64_any_dtype(series):
+            if getattr(series.dt, "tz", None) is not None:
+                series = series.dt.tz_localize(None)
+            serials = ((series - EXCEL_EPOCH) / pd.Timedelta(days=1)).to_numpy(dtype="float64", na_value=np.nan)
+            values = np.where(missing, None, serials).tolist()
+            columns.append((worksheet.write_number, values, date_format))
+        elif pd.api.types.is_bool_dtype(series):
+            values = series.astype(object).where(~missing, None).tolist()
+            columns.append((worksheet.write_boolean, values, None))
+        elif series.dtype == "float32":
+            # Compact columns (see data_cleaning.dtypes) hold short decimals
+            numbers = widen_float32(series.to_numpy())
+            values = np.where(missing, None, numbers).tolist()
+            columns.append((worksheet.write_number, values, None))
+        elif pd.api.types.is_numeric_dtype(series):
+            numbers = series.to_numpy(dtype="float64", na_value=np.nan)
+            values = np.where(missing, None, numbers).tolist()
+            columns.append((worksheet.write_number, values, None))
+        else:
+            values = series.astype(object).where(~missing, None).tolist()
+            columns.append((worksheet.write, values, None))
+    return columns
+
+
+def write_xlsx_chunks(chunks, sheet_name="Sheet1"):
+    """
+    Write an iterable of DataFrame chunks (same columns) and return the
+    workbook as bytes. Rows beyond Excel's limit continue on new sheets
+    named '<sheet_name> (2)', '<sheet_name> (3)', ... each with the header.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "export.xlsx")
+        workbook = xlsxwriter.Workbook(path, {
+            "constant_memory": True,
+            "tmpdir": tmp_dir,
+            "default_date_format": DATETIME_FORMAT,
+            "nan_inf_to_errors": True,
+        })
+        date_format = workbook.add_format({"num_format": DATETIME_FORMAT})
+        # Same header style as pandas' to_excel
+        header_format = workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+        worksheet = None
+        n_sheets = 0
+        row = 0
+        with stage("write_xlsx_chunks", rows=0) as record:
+            for chunk in chunks:
+                header = [str(col) for col in chunk.columns]
+                start = 0
+                while start < len(chunk) or worksheet is None:
+                    if worksheet is None or row > SHEET_ROWS:
+                        worksheet = workbook.add_worksheet(sheet_title(sheet_name, n_sheets))
+                        worksheet.write_row(0, 0, header, header_format)
+                        n_sheets += 1
+                        row = 1
+                    # Rows of this chunk that still fit on the current sheet
+                    part = chunk.iloc[start:start + SHEET_ROWS + 1 - row]
+                    columns = _columns(worksheet, part, date_format)
+                    for values in zip(*(values for _, values, _ in columns)):
+                        for col, ((write, _, cell_format), value) in enumerate(zip(columns, values)):
+                            if value is not None:
+                                write(row, col, value, cell_format)
+                        row += 1
+                    start += len(part)
+                record.rows += len(chunk)
+            if worksheet is None:
+                workbook.add_worksheet(sheet_title(sheet_name, 0))
+            workbook.close()
+        with open(path, "rb") as f:
+            return f.read()
+
+
+def write_xlsx(frame, sheet_name="Sheet1", chunksize=100_000):
+    """
+    Write one DataFrame as an xlsx workbook (bytes), chunksize rows at a time.
+    """
+    return write_xlsx_chunks(
+        (frame.iloc[start:start + chunksize] for start in range(0, max(len(frame), 1), chunksize)),
+        sheet_name
+    )
+
+
+def export_frame(frame, fmt="xlsx", sheet_name="Sheet1"):
+    """
+    Export a frame as bytes in one of export_formats(). float32 columns are
+    written as their float64 values in CSV, and stay float32 in Parquet.
+    """
+    if fmt == "xlsx":
+        return write_xlsx(frame, sheet_name)
+    if fmt == "csv":
+        return widen_frame(frame).to_csv(index=False).encode("utf-8")
+    if fmt == "parquet":
+        buffer = io.BytesIO()
+        frame.to_parquet(buffer, index=False)
+        return buffer.getvalue()
+    raise ValueError(f"Unsupported export format: {fmt}")
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel ingestion of multi-file uploads.
+
+Files are parsed and cleaned in a concurrent.futures pool: a thread pool when
+pyarrow's GIL-free CSV reader is in use, a process pool otherwise. The
+pyarrow engine infers some dtypes and missing values differently from
+pandas' default C engine, so it is only used when DATA_CLEANING_CSV_ENGINE
+is set to "pyarrow" (and pyarrow is installed).
+Results come back in upload order and a failing file only produces an error
+message for that file instead of stopping the batch.
+"""
+import io
+import multiprocessing
+import os
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import pandas as pd
+
+from data_cleaning.cache import frame_key
+from data_cleaning.excel_reader import read_workbook
+from data_cleaning.profiling import timed
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+# "c" (pandas' default) or "pyarrow"
+CSV_ENGINE = os.environ.get("DATA_CLEANING_CSV_ENGINE", "c")
+USE_PYARROW = HAS_PYARROW and CSV_ENGINE == "pyarrow"
+
+
+@dataclass
+class IngestResult:
+    name: str
+    frame: Any = None
+    error: Optional[str] = None
+
+
+class NamedBytesIO(io.BytesIO):
+    """
+    In-memory copy of an uploaded file that keeps its name, so it can be sent
+    to worker processes and still look like a Streamlit UploadedFile.
+    """
+
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+
+
+def read_csv(source, engine=None, **kwargs):
+    """
+    pd.read_csv with engine, CSV_ENGINE by default. The multithreaded
+    pyarrow engine is only used when asked for, installed and supporting
+    the requested options; the C engine reads the file otherwise.
+    """
+    if (engine or CSV_ENGINE) == "pyarrow" and HAS_PYARROW:
+        start = source.tell() if hasattr(source, "tell") else None
+        try:
+            return pd.read_csv(source, engine="pyarrow", **kwargs)
+        except (ValueError, TypeError):
+            if start is not None:
+                source.seek(start)
+    return pd.read_csv(source, **kwargs)
+
+
+@timed()
+def read_table(uploaded_file, delimiter=",", header_row=0, sheet_name=None, usecols=None):
+    """
+    Read a CSV or Excel file as it is, keeping only the usecols columns when given.
+    CSV files use delimiter and skip the header_row lines above the header
+    (see data_cleaning.schema.probe_file); Excel files are read from
+    sheet_name with data_cleaning.excel_reader.
+    Raises ValueError for other file types.
+    """
+    if uploaded_file.name.endswith('.csv'):
+        return pd.read_csv(uploaded_file, sep=delimiter, skiprows=header_row, usecols=usecols)
+    if uploaded_file.name.endswith(('.xlsx', '.xls')):
+        return read_workbook(uploaded_file, sheet_name, usecols, header_row=header_row)
+    raise ValueError("Unsupported file type.")
+
+
+def _parse_one(parse, name, data, options):
+    try:
+        return IngestResult(name, parse(NamedBytesIO(data, name), *options))
+    except ValueError as exc:
+        # Raised on purpose by the parsers with a user-facing message
+        message = str(exc)
+        return IngestResult(name, error=message if name in message else f"{name}: {message}")
+    except Exception as exc:
+        return IngestResult(name, error=f"Could not read {name}: {type(exc).__name__}: {exc}")
+
+
+def ingest_files(uploaded_files, parse, *options, workers=DEFAULT_WORKERS, cache=None, store=None):
+    """
+    Run parse(file, *options) on every uploaded file and return a list of
+    IngestResult in upload order. parse must be a module-level function so it
+    can be pickled for the process pool. When cache (an IngestCache) and/or
+    store (an on-disk FrameStore) are given, files already parsed with the
+    same options are not parsed again.
+    """
+    results = [None] * len(uploaded_files)
+    keys = [None] * len(uploaded_files)
+    pending = []
+    for i, uploaded_file in enumerate(uploaded_files):
+        if cache is not None or store is not None:
+            keys[i] = frame_key(uploaded_file, parse.__name__, *options)
+        if cache is not None:
+            frame = cache.get(keys[i])
+            if frame is not None:
+                results[i] = IngestResult(uploaded_file.name, frame)
+                continue
+        if store is not None:
+            frame = store.get(keys[i])
+            if frame is not None:
+                if cache is not None:
+                    cache.put(keys[i], frame)
+                    frame = frame.copy()
+                results[i] = IngestResult(uploaded_file.name, frame)
+                continue
+        pending.append(i)
+
+    tasks = [(parse, uploaded_files[i].name, uploaded_files[i].getvalue(), options) for i in pending]
+    if workers <= 1 or len(tasks) <= 1:
+        parsed = [_parse_one(*task) for task in tasks]
+    else:
+        n_workers = min(workers, len(tasks))
+        if USE_PYARROW:
+            executor = ThreadPoolExecutor(max_workers=n_workers)
+        else:
+            # spawn: forking the threaded Streamlit server is not safe
+            executor = ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            with executor:
+                parsed = list(executor.map(_parse_one, *zip(*tasks)))
+        except BrokenExecutor:
+            # Workers could not be started (e.g. no importable __main__): parse in-process
+            parsed = [_parse_one(*task) for task in tasks]
+
+    for i, result in zip(pending, parsed):
+        if store is not None and result.frame is not None:
+            store.put(keys[i], result.frame)
+        if cache is not None and result.frame is not None:
+            cache.put(keys[i], result.frame)
+            result.frame = result.frame.copy()
+        results[i] = result
+    return results
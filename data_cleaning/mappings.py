@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Saved Source ID / Variable ID mappings of the Opinum export pages.
+
+The same Energy Box and meter layouts come back with every new export, and
+typing their IDs again reruns the page after each field. The IDs, selected
+columns and options entered for a layout are saved as a profile, keyed by
+the page and the signature of the file's header (its column names, in
+order), in a small SQLite file next to the watermarks. Uploading a file
+with a known header fills them all back in before the widgets are drawn,
+so the export is built once. Set DATA_CLEANING_MAPPINGS to keep the
+profiles somewhere else than the temporary directory.
+
+Selected columns are saved as their names. Column labels JSON cannot hold
+(Excel date headers, numpy numbers) are saved as {"column": name} and turned
+back into the file's own labels when the profile is read with its columns.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+
+import pandas as pd
+
+DEFAULT_PATH = os.environ.get(
+    "DATA_CLEANING_MAPPINGS", os.path.join(tempfile.gettempdir(), "data_cleaning_mappings.sqlite")
+)
+# Seconds a writer waits for another session to commit
+LOCK_TIMEOUT = 30
+# Session state entry holding the (page, signature) last restored
+RESTORED_KEY = "_mapping_profile"
+# Key of the JSON object standing for a column label that is not plain JSON
+COLUMN_KEY = "column"
+
+
+def header_signature(columns):
+    """
+    Short hash of a file's column names, in order.
+    """
+    text = json.dumps([str(col) for col in columns])
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def encode_label(value):
+    """
+    JSON stand-in for a widget value json cannot write: a column label such
+    as a Timestamp header.
+    """
+    return {COLUMN_KEY: str(value)}
+
+
+def label_decoder(columns):
+    """
+    json object_hook turning encode_label's objects back into the labels of
+    columns (their names when a label is not among them).
+    """
+    labels = {str(col): col for col in columns}
+
+    def decode(value):
+        if set(value) == {COLUMN_KEY}:
+            return labels.get(value[COLUMN_KEY], value[COLUMN_KEY])
+        return value
+    return decode
+
+
+class MappingStore:
+    """
+    Widget values (IDs, selected columns, options) per page and header
+    signature, as JSON in one SQLite file.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS profiles ("
+            "page TEXT NOT NULL, signature TEXT NOT NULL, columns TEXT NOT NULL, "
+            "profile_values TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (page, signature))"
+        )
+        return connection
+
+    def get(self, page, signature, columns=()):
+        """
+        The saved values of a layout, or None when none were saved. columns:
+        the file's column labels, for the selections that are not plain text.
+        """
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT profile_values FROM profiles WHERE page = ? AND signature = ?", (page, signature)
+            ).fetchone()
+        return None if row is None else json.loads(row[0], object_hook=label_decoder(columns))
+
+    def save(self, page, signature, columns, values):
+        """
+        Save (or replace) the values of a layout with the given header columns.
+        """
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?, ?)",
+                (page, signature, json.dumps([str(col) for col in columns]), json.dumps(values, default=encode_label), time.time())
+            )
+
+    def forget(self, page, signature):
+        with closing(self._connect()) as connection, connection:
+            connection.execute("DELETE FROM profiles WHERE page = ? AND signature = ?", (page, signature))
+
+    def frame(self, page):
+        """
+        The saved layouts of a page as a table, most recently updated first.
+        """
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT signature, columns, updated_at FROM profiles WHERE page = ? ORDER BY updated_at DESC",
+                (page,)
+            ).fetchall()
+        return pd.DataFrame({
+            "Layout": [row[0] for row in rows],
+            "Columns": [", ".join(json.loads(row[1])) for row in rows],
+            "Saved": pd.to_datetime([row[2] for row in rows], unit="s").round("s"),
+        })
+
+    def restore(self, state, page, signature, reset=(), columns=()):
+        """
+        Fill state (st.session_state) with the saved values of a layout the
+        first time a file with this header is seen, after dropping the reset
+        keys left by another layout (selections of columns it does not have).
+        columns: the file's column labels (see get). Returns the values filled in, None when the layout is unchanged or
+        has no profile.
+        """
+        if state.get(RESTORED_KEY) == [page, signature]:
+            return None
+        state[RESTORED_KEY] = [page, signature]
+        for key in reset:
+            state.pop(key, None)
+        values = self.get(page, signature, columns)
+        if values:
+            state.update(values)
+        return values
+
+    def remember(self, state, page, signature, columns, keys):
+        """
+        Save the values of keys in state as the profile of a layout, when
+        they differ from the saved ones. Returns whether anything was written.
+        """
+        values = {key: state[key] for key in keys if key in state}
+        if values == self.get(page, signature, columns):
+            return False
+        self.save(page, signature, columns, values)
+        return True
+
+
+# Shared by all pages and sessions of the server process
+mapping_store = MappingStore()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Time-aligned merge of many temperature sensor files.
+
+Each sensor becomes a deduplicated Series indexed by DateTime, and all of
+them are aligned in one concat(axis=1) instead of one outer merge per file.
+"""
+import time
+
+import pandas as pd
+
+from data_cleaning.profiling import timed
+
+DUPLICATE_POLICIES = ("mean", "first", "last")
+
+
+def sensor_series(times, values, name, duplicates="mean"):
+    """
+    Build a sorted, DateTime-indexed Series with one value per timestamp.
+    duplicates: how readings sharing a (rounded) timestamp are combined,
+    one of DUPLICATE_POLICIES.
+    """
+    if duplicates not in DUPLICATE_POLICIES:
+        raise ValueError(f"Unknown duplicate policy: {duplicates}")
+    series = pd.Series(pd.Series(values).to_numpy(), index=pd.DatetimeIndex(times), name=name)
+    if series.index.has_duplicates:
+        if duplicates == "mean":
+            # Only readings that are averaged need to be numbers
+            series = pd.to_numeric(series, errors="coerce")
+        return getattr(series.groupby(level=0), duplicates)()
+    return series.sort_index()
+
+
+def unique_names(names):
+    """
+    names with repeats numbered as '<name> (2)', '<name> (3)', ...
+    """
+    used, unique = set(), []
+    for name in names:
+        candidate, count = name, 1
+        while candidate in used:
+            count += 1
+            candidate = f"{name} ({count})"
+        used.add(candidate)
+        unique.append(candidate)
+    return unique
+
+
+@timed()
+def merge_sensor_series(series_list):
+    """
+    Align all sensor Series on the union of their timestamps. Sensors with
+    the same name (files with the same stem) get numbered columns.
+    Returns (merged DataFrame with a leading 'DateTime' column, elapsed seconds).
+    """
+    start = time.perf_counter()
+    names = unique_names([series.name for series in series_list])
+    series_list = [series.rename(name) for series, name in zip(series_list, names)]
+    merged = pd.concat(series_list, axis=1, sort=True)
+    merged.index.name = "DateTime"
+    merged = merged.reset_index()
+    return merged, time.perf_counter() - start
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Column-level parsing of Energy Box cells that carry their unit, such as
+'235.115 V' or '-1,281 kW'.
+"""
+import numpy as np
+import pandas as pd
+
+# First numeric token of a cell (comma or dot decimals)
+NUMBER_PATTERN = r"([-+]?\d+[\d\.,]*)"
+
+
+def parse_numeric_column(series):
+    """
+    Extract the first numeric token of every cell, vectorized.
+    Returns (parsed series, number of non-empty cells that could not be parsed).
+    Cells without a number, like 'L' (load type), are kept as their stripped text,
+    so the column stays float64 only when every value parsed.
+    Most cells are plain numbers: they are converted at once with pd.to_numeric
+    (which also reads '1e3' and '.5' whole), and the regex only runs on the
+    few cells that are not, such as '235.115 V' or '-1,281'.
+    """
+    if series.dtype != object:
+        return series, 0
+    present = series.notna().to_numpy()
+    numbers = pd.to_numeric(series, errors="coerce").to_numpy(dtype="float64", copy=True)
+    # The other cells as stripped text: decimal commas, then the first token;
+    # 'inf' and 'nan' are text here, not numbers
+    retry = present & ~np.isfinite(numbers)
+    text = series[retry].astype(str).str.strip()
+    if len(text):
+        comma = pd.to_numeric(text.str.replace(",", ".", regex=False), errors="coerce")
+        token = text[~np.isfinite(comma)].str.extract(NUMBER_PATTERN, expand=False)
+        comma[token.index] = pd.to_numeric(token.str.replace(",", ".", regex=False), errors="coerce")
+        numbers[retry] = comma.to_numpy(dtype="float64")
+    unparsed = present & np.isnan(numbers)
+    n_unparsed = int(unparsed.sum())
+    numbers = pd.Series(numbers, index=series.index, name=series.name)
+    if n_unparsed == 0:
+        return numbers, 0
+    result = numbers.astype(object)
+    result[unparsed] = text[unparsed[retry]].to_numpy()
+    return result, n_unparsed
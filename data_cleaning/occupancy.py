@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Occupancy / tariff calendar for the Energy Box Excel export.
+
+The weekly occupancy profiles and the on-peak window are compiled once into
+a 7x1440 minute-of-week lookup table, so a whole timestamp column can be
+labelled with a single NumPy indexing operation instead of a row-wise apply.
+"""
+import numpy as np
+import pandas as pd
+
+from data_cleaning.profiling import timed
+
+WEEK_DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+MINUTES_PER_DAY = 24 * 60
+NS_PER_MINUTE = 60 * 1_000_000_000
+NS_PER_DAY = MINUTES_PER_DAY * NS_PER_MINUTE
+
+# Table codes: the closing minute only counts at hh:mm:00, because the
+# original check `open <= time <= close` is inclusive on both ends.
+OFF = 0
+ON = 1
+ON_AT_START = 2
+
+
+def _minute_of_day(t):
+    return t.hour * 60 + t.minute
+
+
+def _mark_window(table, day_idx, start, end):
+    """
+    Mark [start, end] (datetime.time, inclusive) on one row of the table.
+    Times are expected at minute resolution, as given by st.time_input.
+    A window where start > end never matches, as before.
+    """
+    if start > end:
+        return
+    start_min = _minute_of_day(start)
+    end_min = _minute_of_day(end)
+    table[day_idx, start_min:end_min] = ON
+    if table[day_idx, end_min] != ON:
+        table[day_idx, end_min] = ON_AT_START
+
+
+def compile_week_table(windows):
+    """
+    Build a 7x1440 uint8 table from an iterable of (days, start, end) tuples,
+    where days are names from WEEK_DAYS and start/end are datetime.time.
+    """
+    table = np.zeros((7, MINUTES_PER_DAY), dtype=np.uint8)
+    for days, start, end in windows:
+        for day in days:
+            _mark_window(table, WEEK_DAYS.index(day), start, end)
+    return table
+
+
+def _week_positions(dates):
+    """
+    Return (weekday, minute of day, is start of minute, valid) arrays for a datetime Series.
+    Timezone-aware timestamps are labelled on their local wall-clock time.
+    """
+    dates = pd.to_datetime(pd.Series(dates), errors="coerce")
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    valid = dates.notna().to_numpy()
+    ns = dates.to_numpy(dtype="datetime64[ns]").view("int64")
+    days, ns_of_day = np.divmod(ns, NS_PER_DAY)
+    weekday = (days + 3) % 7  # 1970-01-01 was a Thursday
+    minute = ns_of_day // NS_PER_MINUTE
+    at_start = ns_of_day % NS_PER_MINUTE == 0
+    weekday[~valid] = 0
+    minute[~valid] = 0
+    return weekday, minute, at_start, valid
+
+
+def lookup(table, weekday, minute, at_start, valid):
+    """
+    Label timestamps with one fancy-indexing pass over the compiled table.
+    """
+    codes = table[weekday, minute]
+    return ((codes == ON) | ((codes == ON_AT_START) & at_start)) & valid
+
+
+def compile_calendar(occupancy_profiles, on_peak_start, on_peak_end, weekends_on_peak=False):
+    """
+    Compile the occupancy profiles (list of {"days", "open", "close"}) and the
+    on-peak window into the lookup tables used by label_calendar.
+    """
+    occupied = compile_week_table(
+        (prof["days"], prof["open"], prof["close"]) for prof in occupancy_profiles
+    )
+    peak_days = WEEK_DAYS if weekends_on_peak else WEEK_DAYS[:5]
+    on_peak = compile_week_table([(peak_days, on_peak_start, on_peak_end)])
+    return {"occupied": occupied, "on_peak": on_peak}
+
+
+@timed()
+def label_calendar(dates, calendar):
+    """
+    Return a DataFrame with the 'occupied', 'on_peak' and 'is_weekend'
+    columns for a datetime Series, aligned on its index.
+    """
+    weekday, minute, at_start, valid = _week_positions(dates)
+    index = dates.index if isinstance(dates, pd.Series) else None
+    return pd.DataFrame({
+        "is_weekend": (weekday >= 5) & valid,
+        "on_peak": lookup(calendar["on_peak"], weekday, minute, at_start, valid),
+        "occupied": lookup(calendar["occupied"], weekday, minute, at_start, valid),
+    }, index=index)
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Opinum standard data file writer.
+
+Rows (date, value, source_id, variable_id) are serialized chunk by chunk
+straight into the output stream, so a column is never held as one big
+DataFrame plus its full CSV string at the same time. Dates are formatted
+with integer arithmetic (format_datetimes), once per column shared by all
+the variables of a file. Several variables can also go to one long-format
+file (write_long_opinum_csv), with their IDs taken from a mapping table.
+"""
+import csv
+import io
+import itertools
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from data_cleaning.dates import parse_timestamps
+from data_cleaning.dtypes import widen_float32
+from data_cleaning.profiling import stage, timed
+
+OPINUM_COLUMNS = ["date", "value", "source_id", "variable_id"]
+CHUNK_ROWS = 100_000
+# Rows per file of a long-format export; more rows are split over several files
+SHARD_ROWS = 1_000_000
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _civil_from_days(days):
+    """
+    (year, month, day) arrays of day counts since 1970-01-01, in the proleptic
+    Gregorian calendar (Howard Hinnant's civil_from_days, vectorized).
+    """
+    z = days + 719468
+    era = z // 146097
+    day_of_era = z - era * 146097
+    year_of_era = (day_of_era - day_of_era // 1460 + day_of_era // 36524 - day_of_era // 146096) // 365
+    day_of_year = day_of_era - (365 * year_of_era + year_of_era // 4 - year_of_era // 100)
+    shifted_month = (5 * day_of_year + 2) // 153
+    day = day_of_year - (153 * shifted_month + 2) // 5 + 1
+    month = np.where(shifted_month < 10, shifted_month + 3, shifted_month - 9)
+    year = year_of_era + era * 400 + (month <= 2)
+    return year, month, day
+
+
+def format_datetimes(values):
+    """
+    Format datetime64 values as DATE_FORMAT without a Python call per value:
+    the fields are computed with integer arithmetic on the nanosecond counts
+    and their digits written into a fixed-width byte matrix. Timezone-aware
+    values are formatted in their own local time, NaT becomes None.
+    Returns an object array of str.
+    """
+    values = pd.Series(values)
+    if getattr(values.dt, "tz", None) is not None:
+        values = values.dt.tz_localize(None)
+    nanoseconds = values.to_numpy(dtype="datetime64[ns]").view("int64")
+    missing = nanoseconds == np.iinfo("int64").min
+    seconds = nanoseconds // 1_000_000_000
+    days = seconds // 86400
+    second_of_day = seconds - days * 86400
+    year, month, day = _civil_from_days(days)
+
+    text = np.empty((len(values), 19), dtype=np.uint8)
+    text[:] = np.frombuffer(b"0000-00-00 00:00:00", dtype=np.uint8)
+    fields = (
+        (0, 4, year), (5, 2, month), (8, 2, day),
+        (11, 2, second_of_day // 3600), (14, 2, second_of_day // 60 % 60), (17, 2, second_of_day % 60),
+    )
+    for position, width, field in fields:
+        for digit in range(width):
+            text[:, position + width - 1 - digit] += (field // 10 ** digit % 10).astype(np.uint8)
+    formatted = np.array(text.view("S19").ravel().astype("U19").tolist(), dtype=object)
+    formatted[missing] = None
+    return formatted
+
+
+def format_kept(values, masks):
+    """
+    format_datetimes on the rows of values that some boolean mask keeps,
+    None on the others.
+    """
+    values = np.asarray(values, dtype="M8[ns]")
+    kept = np.logical_or.reduce(masks) if masks else np.zeros(len(values), dtype=bool)
+    formatted = np.full(len(values), None, dtype=object)
+    formatted[kept] = format_datetimes(values[kept])
+    return formatted
+
+
+@timed()
+def format_opinum_dates(values):
+    """
+    Parse a date column once and format it as Opinum expects (YYYY-MM-DD HH:MM:SS).
+    Returns (formatted strings, parsing strategy).
+    """
+    parsed_dates, strategy = parse_timestamps(values)
+    return pd.Series(format_datetimes(parsed_dates), index=parsed_dates.index), strategy
+
+
+def opinum_dates(values, cache=None, key=None):
+    """
+    format_opinum_dates(values)[0], kept in cache (an IngestCache) under key
+    when given, so a date column shared by several variables and page reruns
+    is formatted once.
+    """
+    if cache is not None:
+        dates = cache.get(key)
+        if dates is not None:
+            return dates
+    dates, _ = format_opinum_dates(values)
+    if cache is not None:
+        cache.put(key, dates)
+    return dates
+
+
+def _csv_cells(values):
+    """
+    Values as cells for csv.writer, printed the way DataFrame.to_csv prints
+    them: floats in their shortest form, missing values as empty cells.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind == "M":
+        return format_datetimes(values)
+    if values.dtype == "float32":
+        values = widen_float32(values)
+    if values.dtype.kind == "f":
+        return np.where(np.isnan(values), None, values).tolist()
+    if values.dtype.kind in "iub":
+        return values.tolist()
+    return np.where(pd.isna(values), None, values).tolist()
+
+
+def write_opinum_csv(stream, dates, values, source_id, variable_id, chunksize=CHUNK_ROWS, header=True):
+    """
+    Write one variable in the Opinum format to a binary stream, chunksize rows at a time.
+    Rows go straight through csv.writer, with the quoting and line ending
+    of DataFrame.to_csv; datetime64 dates are formatted as DATE_FORMAT (pass
+    dates formatted once with opinum_dates when several variables share them).
+    header=False appends rows to a file started by an earlier call.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    writer = csv.writer(text, lineterminator=os.linesep)
+    if header:
+        writer.writerow(OPINUM_COLUMNS)
+    for start in range(0, len(dates), chunksize):
+        stop = start + chunksize
+        date_cells = _csv_cells(dates[start:stop])
+        writer.writerows(zip(
+            date_cells, _csv_cells(values[start:stop]),
+            itertools.repeat(source_id), itertools.repeat(variable_id)
+        ))
+    text.flush()
+    text.detach()
+
+
+def build_opinum_zip(dates, entries, chunksize=CHUNK_ROWS, masks=None):
+    """
+    Serialize every variable once into its own ZIP entry and return the ZIP buffer.
+    entries: iterable of (file name, values, source_id, variable_id).
+    masks: optional boolean mask per entry of the rows it writes (incremental
+    exports, see data_cleaning.watermark); only rows some entry keeps are formatted.
+    Entries are stored uncompressed so single files can be read back cheaply
+    with read_opinum_entry.
+    """
+    entries = list(entries)
+    dates = pd.Series(dates).to_numpy()
+    if dates.dtype.kind == "M":
+        # Formatted once for every entry
+        if masks:
+            dates = format_kept(dates, masks)
+        else:
+            dates = format_datetimes(dates)
+    if masks is None:
+        masks = [None] * len(entries)
+    zip_buffer = io.BytesIO()
+    with stage("build_opinum_zip") as record, zipfile.ZipFile(zip_buffer, "w") as zip_file:
+        record.rows = 0
+        for (entry_name, values, source_id, variable_id), mask in zip(entries, masks):
+            values = pd.Series(values).to_numpy()
+            entry_dates = dates
+            if mask is not None:
+                entry_dates, values = dates[mask], values[mask]
+            with zip_file.open(entry_name, "w") as entry:
+                write_opinum_csv(entry, entry_dates, values, source_id, variable_id, chunksize)
+            record.rows += len(entry_dates)
+    zip_buffer.seek(0)
+    return zip_buffer
+
+
+def opinum_id_table(entries):
+    """
+    Column-to-ID mapping table of a long export from (column, source_id,
+    variable_id) entries, one row per variable.
+    """
+    return pd.DataFrame(list(entries), columns=["column", "source_id", "variable_id"], dtype=object)
+
+
+def write_long_opinum_csv(stream, dates, frame, mapping, masks=None, chunksize=CHUNK_ROWS, header=True):
+    """
+    Write every variable of mapping (see opinum_id_table) to one Opinum file,
+    in long format: one (date, value, source_id, variable_id) row per
+    timestamp and variable, sorted by timestamp then mapping order. Each
+    chunk of timestamps is reshaped at once: dates are repeated, the
+    (timestamps x variables) block of values is flattened row-major and the
+    IDs are tiled, then serialized in one pass.
+    masks: optional boolean mask per variable of the rows to write (see
+    data_cleaning.watermark). Returns the number of rows written.
+    """
+    dates = pd.Series(dates).to_numpy()
+    columns = [frame[col].to_numpy() for col in mapping["column"]]
+    source_ids = mapping["source_id"].to_numpy(dtype=object)
+    variable_ids = mapping["variable_id"].to_numpy(dtype=object)
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    writer = csv.writer(text, lineterminator=os.linesep)
+    if header:
+        writer.writerow(OPINUM_COLUMNS)
+    n_rows = 0
+    for start in range(0, len(dates) if columns else 0, chunksize):
+        stop = start + chunksize
+        date_cells = np.asarray(_csv_cells(dates[start:stop]), dtype=object)
+        cells = np.empty((len(date_cells), len(columns)), dtype=object)
+        for j, values in enumerate(columns):
+            cells[:, j] = _csv_cells(values[start:stop])
+        long_dates = np.repeat(date_cells, len(columns))
+        long_values = cells.ravel()
+        long_sources = np.tile(source_ids, len(date_cells))
+        long_variables = np.tile(variable_ids, len(date_cells))
+        if masks is not None:
+            kept = np.column_stack([mask[start:stop] for mask in masks]).ravel()
+            long_dates, long_values = long_dates[kept], long_values[kept]
+            long_sources, long_variables = long_sources[kept], long_variables[kept]
+        writer.writerows(zip(long_dates, long_values, long_sources, long_variables))
+        n_rows += len(long_dates)
+    text.flush()
+    text.detach()
+    return n_rows
+
+
+@timed()
+def build_long_opinum(dates, frame, mapping, masks=None, shard_rows=SHARD_ROWS, chunksize=CHUNK_ROWS):
+    """
+    The long-format Opinum file(s) of every variable of mapping, as a list
+    of CSV bytes: one file, or shards of at most shard_rows rows (None: no
+    limit) split on timestamps when there are more rows. datetime64 dates
+    are formatted once (only on the rows some variable writes when masks
+    are given).
+    """
+    dates = pd.Series(dates).to_numpy()
+    if dates.dtype.kind == "M":
+        dates = format_kept(dates, masks) if masks else format_datetimes(dates)
+    step = max(1, len(dates) if shard_rows is None else shard_rows // max(1, len(mapping)))
+    shards = []
+    for start in range(0, max(len(dates), 1), step):
+        stop = start + step
+        buffer = io.BytesIO()
+        n_rows = write_long_opinum_csv(
+            buffer, dates[start:stop], frame.iloc[start:stop], mapping,
+            None if masks is None else [mask[start:stop] for mask in masks], chunksize
+        )
+        # Timestamps no variable writes (incremental exports) do not make empty files
+        if n_rows or not shards and stop >= len(dates):
+            shards.append(buffer.getvalue())
+    return shards
+
+
+def long_opinum_names(base_name, n_files):
+    """
+    File names of a long export split over n_files files.
+    """
+    if n_files == 1:
+        return [f"OpisenseStandardDataFile_{base_name}.csv"]
+    return [f"OpisenseStandardDataFile_{base_name}_part{i + 1}.csv" for i in range(n_files)]
+
+
+def zip_files(files):
+    """
+    ZIP buffer of (file name, bytes) pairs, stored uncompressed like build_opinum_zip.
+    """
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, "w") as zip_file:
+        for name, data in files:
+            zip_file.writestr(name, data)
+    zip_buffer.seek(0)
+    return zip_buffer
+
+
+def read_opinum_entry(zip_buffer, entry_name):
+    """
+    Return the CSV bytes of one entry of a ZIP built by build_opinum_zip
+    (the buffer or its bytes) or written to disk (its path), reading only
+    that entry.
+    """
+    if isinstance(zip_buffer, bytes):
+        zip_buffer = io.BytesIO(zip_buffer)
+    with zipfile.ZipFile(zip_buffer) as zip_file:
+        data = zip_file.read(entry_name)
+    if hasattr(zip_buffer, "seek"):
+        zip_buffer.seek(0)
+    return data
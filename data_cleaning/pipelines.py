@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+The cleaning pipelines of the Streamlit pages as plain functions, used by the
+batch command line (data_cleaning.batch).
+
+Each run_* function processes one input file (an uploaded file or a
+NamedBytesIO) with the settings of its pipeline from the config file, writes
+the files the page offers for download to output_dir and returns a
+PipelineResult. Pipelines whose page merges all uploads (temperature,
+consumption) return their frame instead, and write_merged writes the merged
+workbook once every file is done.
+
+With "incremental": true, the Energy Box and Import Any File pipelines only
+write the rows after the last timestamp exported for each source/variable
+pair (see data_cleaning.watermark), kept in the SQLite file of "watermarks"
+or the default one. With "long": true they write every mapped column to
+one long-format Opinum file instead (OpisenseStandardDataFile_<name>.csv,
+split into _part<n> files past "shard_rows" rows).
+"""
+import os
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+
+import pandas as pd
+
+from data_cleaning.consumption import clean_consumption, load_standardized, load_standardized_chunked, merge_standardized
+from data_cleaning.energy_box import build_excel_frame, load_energy_box
+from data_cleaning.excel import write_xlsx
+from data_cleaning.ingest import read_table
+from data_cleaning.merge import merge_sensor_series
+from data_cleaning.occupancy import compile_calendar
+from data_cleaning.opinum import (
+    SHARD_ROWS,
+    build_long_opinum,
+    format_kept,
+    format_opinum_dates,
+    long_opinum_names,
+    opinum_id_table,
+    write_opinum_csv,
+)
+from data_cleaning.schema import probe_file
+from data_cleaning.temperature import read_sensor_file, read_sensor_opinum
+from data_cleaning.watermark import WatermarkStore, latest, parse_delta, watermark_store
+
+# Input file extensions picked up when a directory is given
+EXTENSIONS = {
+    "energy_box": (".csv",),
+    "temperature": (".csv", ".txt"),
+    "consumption": (".csv", ".xls", ".xlsx"),
+    "any_file": (".csv", ".xls", ".xlsx"),
+}
+PIPELINES = tuple(EXTENSIONS)
+
+
+@dataclass
+class PipelineResult:
+    name: str
+    rows: int = 0
+    outputs: List[str] = field(default_factory=list)
+    frame: Any = None
+    error: Optional[str] = None
+
+
+def file_stem(name):
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+def file_settings(settings, name):
+    """
+    Settings for one input file: the pipeline settings, overridden by the
+    entry of settings["files"] for the file name (without extension), if any.
+    """
+    merged = {key: value for key, value in settings.items() if key != "files"}
+    merged.update(settings.get("files", {}).get(file_stem(name), {}))
+    return merged
+
+
+def opinum_file_name(name):
+    return f"OpisenseStandardDataFile_{name}.csv"
+
+
+def write_opinum_file(output_dir, name, dates, values, source_id, variable_id):
+    """
+    Write one Opinum CSV to output_dir and return its path.
+    """
+    path = os.path.join(output_dir, opinum_file_name(name))
+    with open(path, "wb") as f:
+        write_opinum_csv(f, pd.Series(dates).to_numpy(), pd.Series(values).to_numpy(), source_id, variable_id)
+    return path
+
+
+def incremental_store(settings):
+    """
+    The WatermarkStore of an incremental run (settings["incremental"]): the
+    SQLite file of settings["watermarks"], else the default one. None otherwise.
+    """
+    if not settings.get("incremental"):
+        return None
+    return WatermarkStore(settings["watermarks"]) if settings.get("watermarks") else watermark_store
+
+
+def write_opinum_files(output_dir, dates, outputs, store=None):
+    """
+    Write the Opinum CSV of each output, (name, values, source_id, variable_id),
+    with the shared date column formatted once, and return their paths.
+    With a WatermarkStore only the rows after each output's watermark are
+    written, outputs without new rows are skipped, and the watermarks move
+    to the last row written.
+    """
+    if not outputs:
+        return []
+    if store is None:
+        formatted_dates, _ = format_opinum_dates(dates)
+        return [
+            write_opinum_file(output_dir, name, formatted_dates, values, source_id, variable_id)
+            for name, values, source_id, variable_id in outputs
+        ]
+    watermarks = [store.get(source_id, variable_id) for _, _, source_id, variable_id in outputs]
+    stamps, masks = parse_delta(dates, watermarks)
+    formatted_dates = format_kept(stamps, masks)
+    paths = []
+    for (name, values, source_id, variable_id), mask in zip(outputs, masks):
+        if not mask.any():
+            continue
+        paths.append(write_opinum_file(
+            output_dir, name, formatted_dates[mask], pd.Series(values).to_numpy()[mask], source_id, variable_id
+        ))
+        store.advance(source_id, variable_id, latest(stamps, mask))
+    return paths
+
+
+def write_long_opinum_files(output_dir, base_name, dates, frame, ids, store=None, shard_rows=SHARD_ROWS):
+    """
+    Write the columns of frame mapped by ids ({column: (source_id, variable_id)})
+    to one long-format Opinum file, or shards of it, and return their paths.
+    With a WatermarkStore only the rows after each pair's watermark are
+    written, nothing when no pair has new rows, and the watermarks move on.
+    """
+    if not ids:
+        return []
+    mapping = opinum_id_table([(col, source_id, variable_id) for col, (source_id, variable_id) in ids.items()])
+    masks = None
+    if store is not None:
+        dates, masks = parse_delta(dates, [store.get(*pair) for pair in ids.values()])
+        if not any(mask.any() for mask in masks):
+            return []
+    files = build_long_opinum(dates, frame, mapping, masks, shard_rows)
+    paths = []
+    for name, data in zip(long_opinum_names(base_name, len(files)), files):
+        path = os.path.join(output_dir, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        paths.append(path)
+    if store is not None:
+        for pair, mask in zip(ids.values(), masks):
+            store.advance(*pair, latest(dates, mask))
+    return paths
+
+
+def write_xlsx_file(output_dir, file_name, frame, sheet_name="Sheet1"):
+    """
+    Write a frame to output_dir as an Excel workbook and return its path.
+    """
+    path = os.path.join(output_dir, file_name)
+    with open(path, "wb") as f:
+        f.write(write_xlsx(frame, sheet_name))
+    return path
+
+
+def column_ids(settings):
+    """
+    The {column: (source_id, variable_id)} mapping of the settings; columns
+    without both IDs are skipped, as the pages disable their download.
+    """
+    ids = {}
+    for col, entry in settings.get("columns", {}).items():
+        if entry.get("source_id") and entry.get("variable_id"):
+            ids[col] = (entry["source_id"], entry["variable_id"])
+    return ids
+
+
+def _time(value):
+    return pd.to_datetime(value).time()
+
+
+def excel_calendar(excel_settings):
+    """
+    Compile the occupancy/on-peak calendar from the "excel" settings, with the
+    defaults of the Energy Box page (on-peak 07:00-22:00, weekends off-peak).
+    """
+    profiles = [
+        {"days": profile["days"], "open": _time(profile["open"]), "close": _time(profile["close"])}
+        for profile in excel_settings.get("occupancy", [])
+    ]
+    on_peak_start, on_peak_end = excel_settings.get("on_peak", ("07:00", "22:00"))
+    return compile_calendar(
+        profiles, _time(on_peak_start), _time(on_peak_end), excel_settings.get("weekends_on_peak", False)
+    )
+
+
+def run_energy_box(uploaded_file, output_dir, settings):
+    """
+    Energy Box page: one Opinum CSV per mapped column (or one long-format
+    file with settings["long"]) and, when settings has
+    an "excel" entry, the workbook for the Electricity analysis template.
+    """
+    settings = file_settings(settings, uploaded_file.name)
+    base_name = settings.get("file_name") or file_stem(uploaded_file.name)
+    df_cleaned = load_energy_box(uploaded_file)
+    result = PipelineResult(uploaded_file.name, rows=len(df_cleaned))
+
+    ids = column_ids(settings)
+    for col in ids:
+        if col not in df_cleaned.columns:
+            raise ValueError(f"Column '{col}' not found in {uploaded_file.name}")
+    if settings.get("long"):
+        result.outputs.extend(write_long_opinum_files(
+            output_dir, base_name, df_cleaned["date"], df_cleaned, ids, incremental_store(settings),
+            settings.get("shard_rows", SHARD_ROWS)
+        ))
+    else:
+        outputs = [(f"{base_name}_{col}", df_cleaned[col], *pair) for col, pair in ids.items()]
+        result.outputs.extend(write_opinum_files(output_dir, df_cleaned["date"], outputs, incremental_store(settings)))
+
+    if "excel" in settings:
+        df_excel, _ = build_excel_frame(df_cleaned, excel_calendar(settings["excel"]))
+        result.outputs.append(write_xlsx_file(output_dir, f"{base_name}.xlsx", df_excel))
+    return result
+
+
+def run_temperature(uploaded_file, output_dir, settings):
+    """
+    Temperature Sensors page: the sensor Series for the merged workbook and,
+    when the file has a source_id and variable_id, its Opinum CSV.
+    """
+    settings = file_settings(settings, uploaded_file.name)
+    series = read_sensor_file(uploaded_file, settings.get("round_time", True), settings.get("duplicates", "mean"))
+    result = PipelineResult(uploaded_file.name, rows=len(series), frame=series)
+
+    if settings.get("source_id") and settings.get("variable_id"):
+        df_cleaned = read_sensor_opinum(uploaded_file)
+        result.outputs.append(write_opinum_file(
+            output_dir, settings.get("file_name") or file_stem(uploaded_file.name),
+            df_cleaned.iloc[:, 0], df_cleaned.iloc[:, 1], settings["source_id"], settings["variable_id"]
+        ))
+    return result
+
+
+def run_consumption(uploaded_file, output_dir, settings):
+    """
+    Consumption Data page: the standardized frame of one file, aggregated
+    to settings["freq"] ('15min', 'h', 'D', 'MS'; null keeps the file's own
+    interval) in the optional settings["timezone"]. Excel files are read
+    from settings["sheet_name"], else their largest visible sheet.
+    Cumulative registers roll over at settings["register_max"], else the
+    next power of ten.
+    """
+    settings = file_settings(settings, uploaded_file.name)
+    load = load_standardized_chunked if settings.get("streaming") else load_standardized
+    df = load(uploaded_file, settings.get("sheet_name"))
+    frames = clean_consumption(
+        df, settings.get("consumption_columns"), settings.get("freq", "h"), settings.get("impute_strategy", "auto"),
+        settings.get("timezone"), settings.get("register_max")
+    )
+    return PipelineResult(uploaded_file.name, rows=len(df), frame=merge_standardized(frames))
+
+
+def run_any_file(uploaded_file, output_dir, settings):
+    """
+    Import Any File page: one Opinum CSV per mapped column (or one
+    long-format file with settings["long"]), with the dates of
+    settings["date_column"]. Only these columns are read, from
+    settings["sheet_name"] for Excel files.
+    """
+    settings = file_settings(settings, uploaded_file.name)
+    probe = probe_file(uploaded_file, sheet_name=settings.get("sheet_name"))
+    date_col = settings.get("date_column")
+    if date_col not in probe.columns:
+        raise ValueError(f"Date column '{date_col}' not found in {uploaded_file.name}")
+    ids = column_ids(settings)
+    for var in ids:
+        if var not in probe.columns:
+            raise ValueError(f"Column '{var}' not found in {uploaded_file.name}")
+    usecols = list(dict.fromkeys([date_col, *ids]))
+    df = read_table(uploaded_file, probe.delimiter, probe.header_row, probe.sheet_name, usecols)
+    result = PipelineResult(uploaded_file.name, rows=len(df))
+
+    if settings.get("long"):
+        result.outputs.extend(write_long_opinum_files(
+            output_dir, settings.get("file_name") or file_stem(uploaded_file.name), df[date_col], df, ids,
+            incremental_store(settings), settings.get("shard_rows", SHARD_ROWS)
+        ))
+        return result
+    outputs = []
+    for var, (source_id, variable_id) in ids.items():
+        file_name = settings["columns"][var].get("file_name") or f"{file_stem(uploaded_file.name)}_{var}"
+        outputs.append((file_name, df[var], source_id, variable_id))
+    result.outputs.extend(write_opinum_files(output_dir, df[date_col], outputs, incremental_store(settings)))
+    return result
+
+
+RUNNERS = {
+    "energy_box": run_energy_box,
+    "temperature": run_temperature,
+    "consumption": run_consumption,
+    "any_file": run_any_file,
+}
+
+
+def write_merged(pipeline, results, output_dir):
+    """
+    Write the workbook merging the frames of every file, for the pipelines
+    that return one. Returns the list of written paths.
+    """
+    frames = [result.frame for result in results if result.frame is not None]
+    if not frames:
+        return []
+    if pipeline == "temperature":
+        merged_df, _ = merge_sensor_series(frames)
+        return [write_xlsx_file(output_dir, "Merged_Temperature_Data.xlsx", merged_df, "MergedData")]
+    if pipeline == "consumption":
+        merged = merge_standardized(frames)
+        return [write_xlsx_file(output_dir, "Standardized_Energy_Data.xlsx", merged, "Standardized")]
+    return []
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Per-stage timing and memory instrumentation.
+
+Pipeline steps are wrapped with the stage() context manager or the timed()
+decorator. They record wall time, rows processed and (optionally) the
+tracemalloc peak into the StageRecorder activated for the current Streamlit
+script run, and do nothing when no recorder is active (batch CLI, tools,
+worker threads). Each page shows its records in the sidebar "Performance"
+panel; setting DATA_CLEANING_PERF_LOG also appends them to a JSON-lines file.
+
+Download payloads are built when their button is clicked, outside the page
+run and its recorder (see ExportCache.deferred). record_deferred gives them
+a recorder of their own whose records go to the session's list of download
+stages, shown under the page's stages from the next run on.
+
+tracemalloc is process-wide: its peak would mix the allocations of every
+session, and one session stopping it would break another's. Memory peaks are
+therefore traced by one page run at a time; runs starting while another one
+traces leave their peaks empty.
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import List, Optional
+
+import pandas as pd
+
+PERF_LOG = os.environ.get("DATA_CLEANING_PERF_LOG")
+
+_current = contextvars.ContextVar("stage_recorder", default=None)
+_log_lock = threading.Lock()
+# Held by the recorder tracing memory, from its first top-level stage to its end
+_tracing_lock = threading.Lock()
+# Download stages kept per session and page
+MAX_DOWNLOAD_RECORDS = 100
+
+
+@dataclass
+class StageRecord:
+    stage: str
+    depth: int = 0
+    seconds: float = 0.0
+    rows: Optional[int] = None
+    peak_bytes: Optional[int] = None
+
+    @property
+    def rows_per_second(self):
+        if not self.rows or not self.seconds:
+            return None
+        return self.rows / self.seconds
+
+
+def count_rows(result):
+    """
+    Rows of a stage result: a DataFrame/Series, or the first item of a tuple.
+    """
+    if isinstance(result, tuple) and result:
+        result = result[0]
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return len(result)
+    return None
+
+
+class StageRecorder:
+    """
+    Records of the stages run during one page run.
+    memory=True traces allocations with tracemalloc, which slows Python code
+    down, unless another recorder is tracing (peak_bytes stays None).
+    """
+
+    def __init__(self, page, memory=False, log_path=PERF_LOG, records=None):
+        self.page = page
+        self.memory = memory
+        self.log_path = log_path
+        self.records: List[StageRecord] = [] if records is None else records
+        # Stages of the download payloads built after a run (see record_deferred)
+        self.downloads: List[StageRecord] = []
+        self._stack = []
+        self._started_tracing = False
+        self._tracing = False
+
+    def activate(self, state=None):
+        """
+        Make this recorder the one stage() and timed() record into for the
+        current run. state (st.session_state) keeps the download stages of
+        the session's earlier runs of the page.
+        """
+        if state is not None:
+            self.downloads = state.setdefault(f"_perf_downloads_{self.page}", [])
+        _current.set(self)
+        return self
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        record = StageRecord(name, depth=len(self._stack), rows=rows)
+        self.records.append(record)
+        if self.memory and not self._stack:
+            self._tracing = _tracing_lock.acquire(blocking=False)
+            if self._tracing and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+        if self._tracing:
+            tracemalloc.reset_peak()
+        # Peak of the nested stages, as each of them resets tracemalloc's peak
+        self._stack.append([record, 0])
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.seconds = time.perf_counter() - start
+            _, nested_peak = self._stack.pop()
+            if self._tracing:
+                record.peak_bytes = max(tracemalloc.get_traced_memory()[1], nested_peak)
+                if self._stack:
+                    self._stack[-1][1] = max(self._stack[-1][1], record.peak_bytes)
+                else:
+                    if self._started_tracing:
+                        tracemalloc.stop()
+                        self._started_tracing = False
+                    self._tracing = False
+                    _tracing_lock.release()
+            self._log(record)
+
+    def _log(self, record):
+        if not self.log_path:
+            return
+        line = dict(asdict(record), page=self.page, time=time.time(), rows_per_second=record.rows_per_second)
+        with _log_lock, open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(line) + "\n")
+
+    def frame(self):
+        """
+        The records as a table for the Performance panel; nested stages are indented.
+        """
+        records = self.records + list(self.downloads)
+        return pd.DataFrame({
+            "Stage": ["  " * r.depth + r.stage for r in records],
+            "Seconds": [round(r.seconds, 3) for r in records],
+            "Rows": [r.rows for r in records],
+            "Rows/s": [None if r.rows_per_second is None else round(r.rows_per_second) for r in records],
+            "Peak MB": [None if r.peak_bytes is None else round(r.peak_bytes / 1024 ** 2, 1) for r in records],
+        })
+
+
+@contextmanager
+def stage(name, rows=None):
+    """
+    Record a stage into the active recorder, if any. The yielded record's
+    rows can be set inside the block once they are known.
+    """
+    recorder = _current.get()
+    if recorder is None:
+        yield StageRecord(name, rows=rows)
+        return
+    with recorder.stage(name, rows) as record:
+        yield record
+
+
+def record_deferred(function, name):
+    """
+    function, recording its stages under a "download: name" stage into the
+    download stages of the recorder active now, whenever it is called later
+    (st.download_button calls its data when the button is clicked, on
+    another thread). function itself when no recorder is active.
+    """
+    parent = _current.get()
+    if parent is None:
+        return function
+
+    def wrapper(*args, **kwargs):
+        # A recorder per call: the page run or another download may be recording too
+        recorder = StageRecorder(parent.page, parent.memory, parent.log_path, parent.downloads)
+        token = _current.set(recorder)
+        try:
+            with recorder.stage(f"download: {name}"):
+                return function(*args, **kwargs)
+        finally:
+            _current.reset(token)
+            del parent.downloads[:-MAX_DOWNLOAD_RECORDS]
+    return wrapper
+
+
+def timed(name=None):
+    """
+    Decorator recording every call of a function as a stage, with the rows of
+    its result (see count_rows).
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name or function.__name__) as record:
+                result = function(*args, **kwargs)
+                if record.rows is None:
+                    record.rows = count_rows(result)
+            return result
+        return wrapper
+    return decorate
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Cumulative meter registers: rollovers, resets and spikes.
+
+Meter exports often hold the register reading rather than the consumption
+of each interval. A single drop in a multi-year file used to make the whole
+column look non-cumulative. analyze_register works on the steps between
+consecutive readings (np.diff over the non-empty ones) and sorts every
+anomaly out in one vectorized pass:
+
+- spikes: one reading far off the trend that the next one comes back from
+  (a glitch, or a 0 read between two readings of the same level); the
+  reading is dropped and its intervals are filled like any gap;
+- rollovers: a drop from near the register's maximum to a small value, the
+  register wrapping around; the step is corrected by the register value at
+  which it wraps (given, or the next power of ten);
+- resets: any other drop (meter replaced or reset); the consumption of that
+  step is unknown and left empty.
+
+A column is cumulative when almost all of its steps rise. The readings are
+split into segments at rollovers and resets, with a table of diagnostics
+per segment.
+"""
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from data_cleaning.profiling import timed
+
+# A step this many times the median rise per interval is an outlier
+SPIKE_FACTOR = 100
+# A rollover starts from at least this share of the register's maximum
+ROLLOVER_SHARE = 0.9
+# Share of the changing steps that may be resets, or rollovers, in a cumulative column
+MAX_DROP_SHARE = 0.05
+
+SEGMENT_COLUMNS = [
+    'segment', 'start', 'end', 'starts_with', 'readings', 'first_reading', 'last_reading',
+    'consumption', 'spikes', 'missing',
+]
+
+
+@dataclass
+class RegisterAnalysis:
+    """
+    consumption: value per position of the interval ending there (NaN on
+    the first reading, after a reset and outside the readings; the readings
+    themselves for columns that are not cumulative). interpolated: positions
+    whose value was distributed over a gap of several intervals.
+    """
+    consumption: np.ndarray
+    is_cumulative: bool
+    interpolated: np.ndarray
+    segments: pd.DataFrame = field(default_factory=lambda: pd.DataFrame(columns=SEGMENT_COLUMNS))
+    rollovers: int = 0
+    resets: int = 0
+    spikes: int = 0
+
+    def summary(self):
+        return f"{len(self.segments)} segments: {self.rollovers} rollovers, {self.resets} resets, {self.spikes} spikes"
+
+
+def wrap_values(previous, register_max=None):
+    """
+    Value at which a register showing each previous reading wraps to zero:
+    the smallest of register_max (one value or several) above the reading,
+    else the next power of ten. NaN when no given maximum is above it.
+    """
+    previous = np.asarray(previous, dtype="float64")
+    if register_max is None:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return 10.0 ** (np.floor(np.log10(np.maximum(previous, 1.0))) + 1)
+    maxima = np.sort(np.atleast_1d(np.asarray(register_max, dtype="float64")))
+    positions = np.searchsorted(maxima, previous, side="right")
+    return np.where(positions < len(maxima), maxima[np.minimum(positions, len(maxima) - 1)], np.nan)
+
+
+def _spikes(values, steps, limits):
+    """
+    Readings (1 .. len(steps) - 1) reached by an outlier step and left by an
+    opposite one that brings the register back near its trend. A 0 read
+    between two readings of the same level is a spike too: on registers
+    showing small values its drop stays under the limits and would
+    otherwise be taken for a reset, and the return for a huge rise.
+    """
+    before, after = steps[:-1], steps[1:]
+    back = before + after
+    outlier = (
+        (np.abs(before) > limits[:-1]) & (np.abs(after) > limits[1:])
+        & (np.sign(before) != np.sign(after))
+        & (np.abs(back) <= limits[:-1] + limits[1:])
+    )
+    zero_read = (values[1:-1] == 0) & (before < 0) & (back >= 0) & (back <= limits[:-1] + limits[1:])
+    return outlier | zero_read
+
+
+@timed()
+def analyze_register(readings, register_max=None, index=None, spike_factor=SPIKE_FACTOR):
+    """
+    Analyze one column of readings on a regular grid (NaN where missing).
+    register_max: value(s) at which the register wraps to zero, e.g. 100000
+    for five digits; None tries the next power of ten above each reading.
+    index: timestamps of the grid, for the segment table (positions otherwise).
+    Returns a RegisterAnalysis.
+    """
+    readings = np.asarray(readings, dtype="float64")
+    n = len(readings)
+    positions = np.flatnonzero(~np.isnan(readings))
+    not_cumulative = RegisterAnalysis(readings.copy(), False, np.zeros(n, dtype=bool))
+    if len(positions) < 3:
+        return not_cumulative
+    values = readings[positions]
+    steps = np.diff(values)
+    gaps = np.diff(positions)
+
+    rises = steps[steps > 0] / gaps[steps > 0]
+    if len(rises) == 0:
+        return not_cumulative
+    # Typical consumption of one interval, from the rises only
+    limits = spike_factor * np.median(rises) * gaps
+
+    # Spikes first: their two outlier steps would otherwise read as a reset
+    spike = np.zeros(len(positions), dtype=bool)
+    spike[1:-1] = _spikes(values, steps, limits)
+    spike_positions = positions[spike]
+    if spike.any():
+        positions, values = positions[~spike], values[~spike]
+        steps, gaps = np.diff(values), np.diff(positions)
+        limits = spike_factor * np.median(rises) * gaps
+
+    drops = steps < 0
+    wrap = wrap_values(values[:-1], register_max)
+    wrapped = steps + wrap
+    with np.errstate(invalid="ignore"):
+        rollover = drops & (values[:-1] >= ROLLOVER_SHARE * wrap) & (wrapped >= 0) & (wrapped <= limits)
+    reset = drops & ~rollover
+    # Interval values fall about every other step, as resets or look-alike rollovers
+    allowed = MAX_DROP_SHARE * np.count_nonzero(steps)
+    if reset.sum() > allowed or rollover.sum() > allowed:
+        return not_cumulative
+    corrected = np.where(rollover, wrapped, steps)
+    corrected[reset] = np.nan
+
+    # Each position gets the step ending at the next reading, spread over its gap
+    consumption = np.full(n, np.nan)
+    interpolated = np.zeros(n, dtype=bool)
+    inside = np.arange(positions[0] + 1, positions[-1] + 1)
+    step_of = np.searchsorted(positions, inside, side="left") - 1
+    consumption[inside] = corrected[step_of] / gaps[step_of]
+    interpolated[inside] = gaps[step_of] > 1
+
+    segments = segment_table(positions, values, corrected, rollover, reset, spike_positions, index)
+    return RegisterAnalysis(
+        consumption, True, interpolated, segments,
+        int(rollover.sum()), int(reset.sum()), len(spike_positions)
+    )
+
+
+def segment_table(positions, values, corrected, rollover, reset, spike_positions, index=None):
+    """
+    One row per stretch of readings between rollovers and resets: its span,
+    first and last readings, corrected consumption, dropped spikes and
+    missing readings.
+    """
+    boundary = rollover | reset
+    segment = np.concatenate([[0], np.cumsum(boundary)])
+    n_segments = segment[-1] + 1
+    first = np.flatnonzero(np.concatenate([[True], boundary]))
+    last = np.concatenate([first[1:] - 1, [len(positions) - 1]])
+    # A rollover step belongs to the segment it starts; a reset step is unknown
+    consumption = np.bincount(segment[1:], weights=np.nan_to_num(corrected), minlength=n_segments)
+    spikes = np.bincount(
+        segment[np.searchsorted(positions, spike_positions, side="right") - 1], minlength=n_segments
+    )
+    span = positions[last] - positions[first] + 1
+    readings = last - first + 1
+    starts_with = np.where(rollover[first[1:] - 1], "rollover", "reset") if n_segments > 1 else []
+    bounds = positions if index is None else np.asarray(index)[positions]
+    return pd.DataFrame({
+        'segment': np.arange(n_segments),
+        'start': bounds[first],
+        'end': bounds[last],
+        'starts_with': np.concatenate([["start"], starts_with]),
+        'readings': readings,
+        'first_reading': values[first],
+        'last_reading': values[last],
+        'consumption': consumption,
+        'spikes': spikes,
+        'missing': span - readings,
+    }, columns=SEGMENT_COLUMNS)
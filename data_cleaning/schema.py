@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Lazy schema probe of uploaded files.
+
+The column pickers of the pages only need the column names and a few rows,
+so the probe reads the head of a file instead of parsing all of it: the first
+PROBE_BYTES of a CSV, from which the delimiter and the header row (after any
+title lines) are sniffed, or the first rows of an Excel sheet, read by
+data_cleaning.excel_reader, which stops after nrows without calamine.
+The date and value columns are guessed from that sample; the full parse is
+left to the step that needs every row.
+"""
+import csv
+import io
+import warnings
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import pandas as pd
+
+from data_cleaning.dates import parse_timestamps
+from data_cleaning.excel_reader import read_workbook
+from data_cleaning.profiling import timed
+
+PROBE_ROWS = 200
+PROBE_BYTES = 64 * 1024
+DELIMITERS = ";,\t|"
+# Share of the non-empty sample cells that must read as dates or numbers
+MIN_PARSED_SHARE = 0.9
+DATE_KEYWORDS = ("date", "time", "timestamp")
+
+
+@dataclass
+class SchemaProbe:
+    name: str
+    sample: pd.DataFrame
+    delimiter: Optional[str] = None
+    header_row: int = 0
+    date_column: Optional[str] = None
+    value_columns: List[str] = field(default_factory=list)
+    sheet_name: Optional[str] = None
+
+    @property
+    def columns(self):
+        return list(self.sample.columns)
+
+
+def head_text(uploaded_file, n_bytes=PROBE_BYTES):
+    """
+    The first n_bytes of a file as text, cut after the last complete line
+    when the file is longer. Returns (text, whether the whole file was read).
+    The file position is left at the start.
+    """
+    data = uploaded_file.read(n_bytes + 1)
+    uploaded_file.seek(0)
+    complete = len(data) <= n_bytes
+    if not complete:
+        data = data[:data.rfind(b"\n", 0, n_bytes) + 1] or data[:n_bytes]
+    try:
+        return data.decode("utf-8-sig"), complete
+    except UnicodeDecodeError:
+        return data.decode("latin1"), complete
+
+
+def _widths(lines, delimiter):
+    return [len(next(csv.reader([line], delimiter=delimiter))) if line.strip() else 0 for line in lines]
+
+
+def sniff_layout(lines, delimiter=None, default=","):
+    """
+    (delimiter, header row) of CSV lines. For each candidate delimiter, the
+    data width is the number of fields most of the last lines share, and the
+    header is the first non-blank line with that width, so title lines above
+    it are skipped; nearly all lines from the header on must have that
+    width. The delimiter giving the earliest header wins, then the first of
+    DELIMITERS: decimal commas split ';' files on ',' as well, but not their
+    header line.
+    """
+    best = None
+    for candidate in (delimiter,) if delimiter else DELIMITERS:
+        widths = _widths(lines, candidate)
+        tail = [width for width in widths if width][-20:]
+        if not tail:
+            continue
+        width = Counter(tail).most_common(1)[0][0]
+        header_row = widths.index(width)
+        table = [w for w in widths[header_row:] if w]
+        if width < 2 and not delimiter or table.count(width) < MIN_PARSED_SHARE * len(table):
+            continue
+        if best is None or header_row < best[1]:
+            best = (candidate, header_row)
+    return best or (delimiter or default, 0)
+
+
+def parsed_share(values, parse):
+    """
+    Share of the non-empty values that parse() does not turn into NaN/NaT.
+    """
+    values = values.dropna()
+    if values.dtype == object:
+        values = values[values.astype(str).str.strip() != ""]
+    if values.empty:
+        return 0.0
+    return parse(values).notna().mean()
+
+
+def _numbers(values):
+    if pd.api.types.is_numeric_dtype(values):
+        return values
+    return pd.to_numeric(values.astype(str).str.strip().str.replace(",", ".", regex=False), errors="coerce")
+
+
+def _dates(values):
+    with warnings.catch_warnings():
+        # Text columns that are not dates fall back to dateutil, which warns
+        warnings.simplefilter("ignore", UserWarning)
+        return parse_timestamps(values)[0]
+
+
+def detect_date_column(sample):
+    """
+    First column named like a date/time, else the first datetime or text
+    column whose sample values parse as dates.
+    """
+    for col in sample.columns:
+        if any(keyword in str(col).lower() for keyword in DATE_KEYWORDS):
+            return col
+    for col in sample.columns:
+        if pd.api.types.is_datetime64_any_dtype(sample[col]):
+            return col
+    for col in sample.columns:
+        if sample[col].dtype == object and parsed_share(sample[col], _dates) >= MIN_PARSED_SHARE:
+            return col
+    return None
+
+
+def detect_value_columns(sample, exclude=()):
+    """
+    Columns whose sample values read as numbers (decimal commas accepted).
+    """
+    return [
+        col for col in sample.columns
+        if col not in exclude
+        and not pd.api.types.is_bool_dtype(sample[col])
+        and not pd.api.types.is_datetime64_any_dtype(sample[col])
+        and parsed_share(sample[col], _numbers) >= MIN_PARSED_SHARE
+    ]
+
+
+@timed()
+def probe_file(uploaded_file, nrows=PROBE_ROWS, delimiter=None, header_row=None, sheet_name=None):
+    """
+    SchemaProbe of the first nrows rows of a CSV or Excel file.
+    delimiter and header_row are sniffed from the head of CSV files unless
+    given, e.g. to match a parser that does not skip title lines.
+    Excel files are read from sheet_name, else their largest visible sheet.
+    Raises ValueError for other file types.
+    """
+    name = uploaded_file.name
+    if name.lower().endswith(".csv"):
+        text, _ = head_text(uploaded_file)
+        sniffed_delimiter, sniffed_header_row = sniff_layout(text.splitlines(), delimiter)
+        delimiter = delimiter or sniffed_delimiter
+        header_row = sniffed_header_row if header_row is None else header_row
+        sample = pd.read_csv(io.StringIO(text), sep=delimiter, skiprows=header_row, nrows=nrows)
+    elif name.lower().endswith((".xlsx", ".xls")):
+        sample = read_workbook(uploaded_file, sheet_name, nrows=nrows)
+        sheet_name = sample.attrs["excel_sheet"]
+        header_row = 0
+    else:
+        raise ValueError(f"Unsupported file type: {name}")
+    date_column = detect_date_column(sample)
+    return SchemaProbe(
+        name, sample, delimiter, header_row, date_column,
+        detect_value_columns(sample, exclude=(date_column,)), sheet_name
+    )
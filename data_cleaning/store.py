@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk columnar store of cleaned frames.
+
+The in-process IngestCache is lost when the server restarts and only holds
+what fits in memory, while the same client file is typically reopened many
+times. Cleaned frames are therefore also written as uncompressed Arrow IPC
+(Feather) files, keyed by the same (content hash, stage, options) key plus
+PIPELINE_VERSION, and read back memory-mapped instead of parsing the CSV or
+Excel file again. The oldest files are deleted once the size budget is full.
+Without pyarrow the store is disabled and every lookup is a miss.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# Bump when a cleaning step changes its output, so older files are not reused
+PIPELINE_VERSION = 2
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+DEFAULT_DIRECTORY = os.environ.get(
+    "DATA_CLEANING_STORE", os.path.join(tempfile.gettempdir(), "data_cleaning_store")
+)
+SUFFIX = ".arrow"
+
+
+class FrameStore:
+    """
+    Arrow files of cleaned DataFrames in one directory, evicted oldest-used first.
+    """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES, version=PIPELINE_VERSION):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = version
+        self.enabled = HAS_PYARROW
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        digest = hashlib.sha1(repr((self.version, key)).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest + SUFFIX)
+
+    def get(self, key):
+        """
+        Return the stored frame for key (read memory-mapped), or None.
+        """
+        path = self.path(key)
+        if not self.enabled or not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            frame = feather.read_table(path, memory_map=True).to_pandas()
+        except (OSError, pa.ArrowException):
+            # Removed by another session's eviction or a partial file: parse again
+            self.misses += 1
+            return None
+        # Reading counts as a use for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return frame
+
+    def put(self, key, frame):
+        """
+        Write a frame for key, then evict the oldest files to stay within budget.
+        Frames Arrow cannot represent (e.g. duplicated or mixed-type columns) are skipped.
+        """
+        if not self.enabled or not isinstance(frame, pd.DataFrame):
+            return
+        try:
+            table = pa.Table.from_pandas(frame)
+        except (pa.ArrowException, ValueError, TypeError):
+            return
+        path = self.path(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write under a temporary name so readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+            os.close(fd)
+            feather.write_feather(table, tmp_path, compression="uncompressed")
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        self.evict()
+
+    def _files(self):
+        files = []
+        if not os.path.isdir(self.directory):
+            return files
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(SUFFIX):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def evict(self):
+        """
+        Delete the least recently used files until the store fits in max_bytes.
+        """
+        with self._lock:
+            files = sorted(self._files())
+            total = sum(size for _, size, _ in files)
+            for _, size, path in files:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self._files():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        files = self._files()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "files": len(files),
+            "bytes": sum(size for _, size, _ in files),
+            "max_bytes": self.max_bytes,
+        }
+
+    def summary(self):
+        if not self.enabled:
+            return "On-disk store: disabled (pyarrow is not installed)"
+        stats = self.stats()
+        return (
+            f"On-disk store: {stats['hits']} hits, {stats['misses']} misses, "
+            f"{stats['files']} files, {stats['bytes'] / 1024 ** 2:.1f} / "
+            f"{self.max_bytes / 1024 ** 2:.0f} MB"
+        )
+
+
+# Shared by all pages and sessions of the server process
+frame_store = FrameStore()
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Chunked (streaming) processing of very large Energy Box exports.
+
+The CSV is read with pd.read_csv(chunksize=...) and every chunk goes through
+the usual cleaning steps before being written straight to the Opinum CSVs or
+the Excel workbook, so peak memory depends on the chunk size, not the file size.
+The Opinum ZIP is compressed into a temporary file on disk, from which single
+entries are read back; only a downloaded file is held in memory, as
+st.download_button needs its bytes.
+"""
+import os
+import shutil
+import tempfile
+import weakref
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from data_cleaning.dates import infer_datetime_format, spread_sample
+from data_cleaning.energy_box import build_excel_frame, clean_header
+from data_cleaning.excel import write_xlsx_chunks
+from data_cleaning.opinum import format_kept, write_opinum_csv
+from data_cleaning.profiling import timed
+from data_cleaning.watermark import latest, parse_delta
+
+CHUNK_ROWS = 200_000
+SAMPLES_PER_CHUNK = 50
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class SpilledFile(os.PathLike):
+    """
+    Temporary file on disk, removed once nothing references it any more (an
+    export evicted from the cache, say). Usable as a path, e.g. by zipfile.
+    """
+
+    def __init__(self, suffix=""):
+        handle, self.path = tempfile.mkstemp(suffix=suffix)
+        os.close(handle)
+        weakref.finalize(self, _remove, self.path)
+
+    def __fspath__(self):
+        return self.path
+
+    def getvalue(self):
+        """
+        The whole file as bytes.
+        """
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+def energy_box_columns(uploaded_file):
+    """
+    Cleaned column names of an Energy Box export, read from its header only.
+    """
+    uploaded_file.seek(0)
+    header = pd.read_csv(uploaded_file, skiprows=[0], nrows=0)
+    uploaded_file.seek(0)
+    return list(clean_header(header).columns)
+
+
+def iter_energy_box_chunks(uploaded_file, chunksize=CHUNK_ROWS):
+    """
+    Yield the export as header-cleaned DataFrame chunks.
+    """
+    uploaded_file.seek(0)
+    with pd.read_csv(uploaded_file, skiprows=[0], chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield clean_header(chunk)
+
+
+def sample_date_format(uploaded_file, chunksize=CHUNK_ROWS):
+    """
+    Infer the date format from values spread over the whole file, reading only
+    the date column, so every chunk is parsed with the same format.
+    """
+    samples = []
+    uploaded_file.seek(0)
+    with pd.read_csv(uploaded_file, skiprows=[0], usecols=["Time Stamp"], chunksize=chunksize) as reader:
+        for chunk in reader:
+            samples.append(spread_sample(chunk["Time Stamp"].dropna().to_numpy(), SAMPLES_PER_CHUNK))
+    return infer_datetime_format(np.concatenate(samples)) if samples else None
+
+
+@timed()
+def stream_delta(uploaded_file, watermarks, chunksize=CHUNK_ROWS):
+    """
+    Rows and last timestamp of each watermark's incremental export, read from
+    the date column only, so they are known before the Opinum files are written.
+    Returns (rows for each watermark, last timestamp for each watermark or None).
+    """
+    rows = [0] * len(watermarks)
+    last = [None] * len(watermarks)
+    date_format = sample_date_format(uploaded_file, chunksize)
+    uploaded_file.seek(0)
+    with pd.read_csv(uploaded_file, skiprows=[0], usecols=["Time Stamp"], chunksize=chunksize) as reader:
+        for chunk in reader:
+            stamps, masks = parse_delta(chunk["Time Stamp"], watermarks, date_format)
+            for i, mask in enumerate(masks):
+                rows[i] += int(mask.sum())
+                stamp = latest(stamps, mask)
+                if stamp is not None and (last[i] is None or stamp > last[i]):
+                    last[i] = stamp
+    return rows, last
+
+
+@timed()
+def stream_energy_box_opinum(uploaded_file, entries, chunksize=CHUNK_ROWS, watermarks=None):
+    """
+    Write one Opinum CSV per column in a single pass over the file into a
+    compressed ZIP on disk. entries: iterable of (column, file name, source_id, variable_id).
+    Each column is appended to its own temporary file chunk by chunk, then
+    compressed into its ZIP entry. The dates of each chunk are parsed with the
+    format sampled over the whole file and formatted once for every column.
+    watermarks: optional last exported timestamp of each entry (None when it
+    has none); only the rows after it are written, and chunks entirely before
+    every watermark are skipped after a binary search (see data_cleaning.watermark).
+    Returns (ZIP as a SpilledFile, rows written for each entry, last timestamp
+    written for each entry or None).
+    """
+    entries = list(entries)
+    if watermarks is None:
+        watermarks = [None] * len(entries)
+    rows = [0] * len(entries)
+    written = [None] * len(entries)
+    date_format = sample_date_format(uploaded_file, chunksize)
+    spilled = SpilledFile(suffix=".zip")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = [os.path.join(tmp_dir, f"{i}.csv") for i in range(len(entries))]
+        files = [open(path, "wb") for path in paths]
+        try:
+            first = True
+            for chunk in iter_energy_box_chunks(uploaded_file, chunksize) if entries else ():
+                stamps, masks = parse_delta(chunk["date"], watermarks, date_format)
+                # Formatted once for every column, only on the rows some column writes
+                dates = format_kept(stamps, masks)
+                for i, (f, (col, _, source_id, variable_id), mask) in enumerate(zip(files, entries, masks)):
+                    write_opinum_csv(
+                        f, dates[mask], chunk[col].to_numpy()[mask], source_id, variable_id, chunksize, header=first
+                    )
+                    rows[i] += int(mask.sum())
+                    last = latest(stamps, mask)
+                    if last is not None and (written[i] is None or last > written[i]):
+                        written[i] = last
+                first = False
+        finally:
+            for f in files:
+                f.close()
+        with zipfile.ZipFile(spilled, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+            for path, (_, entry_name, _, _) in zip(paths, entries):
+                with open(path, "rb") as src, zip_file.open(entry_name, "w") as dst:
+                    shutil.copyfileobj(src, dst)
+    return spilled, rows, written
+
+
+@timed()
+def stream_energy_box_excel(uploaded_file, calendar, chunksize=CHUNK_ROWS):
+    """
+    Build the Excel template workbook chunk by chunk.
+    Returns (workbook bytes, {column: number of cells kept as text}).
+    """
+    unparsed_counts = {}
+    date_format = sample_date_format(uploaded_file, chunksize)
+
+    def frames():
+        for chunk in iter_energy_box_chunks(uploaded_file, chunksize):
+            df_excel, counts = build_excel_frame(chunk, calendar, date_format)
+            for col, n in counts.items():
+                unparsed_counts[col] = unparsed_counts.get(col, 0) + n
+            yield df_excel
+
+    return write_xlsx_chunks(frames()), unparsed_counts
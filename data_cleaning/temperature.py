@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Parsing of temperature logger exports (CSV or TXT) for the Temperature Sensors page.
+"""
+import pandas as pd
+
+from data_cleaning.dates import parse_timestamps
+from data_cleaning.ingest import read_csv
+from data_cleaning.merge import sensor_series
+from data_cleaning.profiling import timed
+
+
+def read_sensor_file(uploaded_file, round_time=True, duplicates="mean"):
+    """
+    Load one logger file and return its readings as a DateTime-indexed Series
+    named after the file (without extension).
+    Raises ValueError for unsupported files or when no time/temperature column is found.
+    """
+    file_name = uploaded_file.name
+    file_name_lower = file_name.lower()
+    if file_name_lower.endswith('.csv'):
+        uploaded_file.seek(0)
+        df = read_csv(uploaded_file)
+    elif file_name_lower.endswith('.txt'):
+        uploaded_file.seek(0)
+        df = read_csv(uploaded_file, delimiter=",", encoding="latin1")
+    else:
+        raise ValueError(f"Unsupported file type: {file_name}")
+
+    # Try to find the date/time and temperature columns
+    possible_time_cols = [col for col in df.columns if "time" in col.lower() or "date" in col.lower()]
+    possible_temp_cols = [col for col in df.columns if "temp" in col.lower() or "celsius" in col.lower() or "°c" in col.lower()]
+    if not possible_time_cols or not possible_temp_cols:
+        raise ValueError(f"Could not find time or temperature columns in {file_name}")
+
+    time_col = possible_time_cols[0]
+    temp_col = possible_temp_cols[0]
+
+    # Prepare the sensor for merging
+    times, _ = parse_timestamps(df[time_col])
+    valid = times.notna()
+    times = times[valid]
+
+    # Round to nearest 15 minutes if requested
+    if round_time:
+        times = times.dt.round('15min')
+
+    # Remove file extension from the column name
+    col_name = file_name.rsplit('.', 1)[0]
+    return sensor_series(times, df.loc[valid, temp_col], col_name, duplicates)
+
+
+@timed()
+def read_sensor_opinum(uploaded_file):
+    """
+    Load one logger file for the Opinum upload and return its readings as a
+    DataFrame with a time and a temperature column. Rows whose time cannot
+    be parsed are dropped (CSV files only; TXT times are kept as they are).
+    Raises ValueError for unsupported files.
+    """
+    file_name_lower = uploaded_file.name.lower()
+    if file_name_lower.endswith('.csv'):
+        # CSV-specific logic
+        uploaded_file.seek(0)
+        df = pd.read_csv(uploaded_file, header=None, names=["Time", "Temp/°C"], skiprows=1)
+
+        # Parse once with an inferred format; non-parsable dates become NaT (Not a Time)
+        df["Time"], _ = parse_timestamps(df["Time"])
+
+        # Drop rows where parsing failed
+        return df.dropna(subset=["Time"])
+    if file_name_lower.endswith('.txt'):
+        # TXT-specific logic
+        uploaded_file.seek(0)
+        dataframe = pd.read_csv(uploaded_file, delimiter=",", encoding="latin1", index_col=0)
+        return dataframe.reset_index()[["Time", "Celsius(°C)"]]
+    raise ValueError(f"Unsupported file type: {uploaded_file.name}")
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental exports of rolling Energy Box and meter files.
+
+Each new export of a logger or meter overlaps the previous one by weeks. In
+incremental mode the last timestamp written to Opinum for each
+(source_id, variable_id), its watermark, is kept in a small SQLite database
+shared by the pages and the batch command line, and only the rows after it
+are exported.
+
+The first row past the watermarks is found by a binary search on the raw
+date column of files in time order: only the stamps it probes are parsed,
+then only the rows from there on. Files whose dates turn out not to be in
+ascending order, or that no single format parses, are parsed in full and
+filtered instead. Set DATA_CLEANING_WATERMARKS to keep the database
+somewhere else than the temporary directory.
+"""
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+from data_cleaning.dates import infer_datetime_format, parse_timestamps, parse_with_format, spread_sample
+from data_cleaning.profiling import timed
+
+DEFAULT_PATH = os.environ.get(
+    "DATA_CLEANING_WATERMARKS", os.path.join(tempfile.gettempdir(), "data_cleaning_watermarks.sqlite")
+)
+# Seconds a writer waits for another session or batch worker to commit
+LOCK_TIMEOUT = 30
+
+
+class WatermarkStore:
+    """
+    Last exported timestamp per (source_id, variable_id), in one SQLite file.
+    Timestamps are the wall-clock times written to the Opinum files.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS watermarks ("
+            "source_id TEXT NOT NULL, variable_id TEXT NOT NULL, "
+            "last_timestamp INTEGER NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (source_id, variable_id))"
+        )
+        return connection
+
+    def get(self, source_id, variable_id):
+        """
+        The watermark of a source/variable pair as a Timestamp, or None when
+        nothing was exported for it yet.
+        """
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT last_timestamp FROM watermarks WHERE source_id = ? AND variable_id = ?",
+                (str(source_id), str(variable_id))
+            ).fetchone()
+        return None if row is None else pd.Timestamp(row[0])
+
+    def advance(self, source_id, variable_id, timestamp):
+        """
+        Move a watermark forward to timestamp. An earlier timestamp (an older
+        export processed late) leaves it where it is; None or NaT does nothing.
+        """
+        if timestamp is None or pd.isna(timestamp):
+            return
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT INTO watermarks VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (source_id, variable_id) DO UPDATE SET "
+                "last_timestamp = MAX(last_timestamp, excluded.last_timestamp), updated_at = excluded.updated_at",
+                (str(source_id), str(variable_id), pd.Timestamp(timestamp).value, time.time())
+            )
+
+    def reset(self, source_id, variable_id):
+        """
+        Forget a watermark, so the next export of the pair is complete again.
+        """
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "DELETE FROM watermarks WHERE source_id = ? AND variable_id = ?", (str(source_id), str(variable_id))
+            )
+
+    def frame(self):
+        """
+        Every watermark as a table, most recently updated first.
+        """
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT source_id, variable_id, last_timestamp, updated_at FROM watermarks ORDER BY updated_at DESC"
+            ).fetchall()
+        return pd.DataFrame({
+            "Source ID": [row[0] for row in rows],
+            "Variable ID": [row[1] for row in rows],
+            "Last exported": pd.to_datetime([row[2] for row in rows]),
+            "Updated": pd.to_datetime([row[3] for row in rows], unit="s").round("s"),
+        })
+
+
+def wall_time(stamps):
+    """
+    datetime64[ns] array of parsed dates, timezone-aware ones in their own
+    local time as format_datetimes writes them.
+    """
+    stamps = pd.Series(stamps)
+    if getattr(stamps.dt, "tz", None) is not None:
+        stamps = stamps.dt.tz_localize(None)
+    return stamps.to_numpy(dtype="M8[ns]")
+
+
+def _ascending(stamps):
+    stamps = stamps[~np.isnat(stamps)]
+    return bool(np.all(stamps[1:] >= stamps[:-1]))
+
+
+def first_row_after(dates, watermark, fmt):
+    """
+    Position of the first row later than watermark in a text date column in
+    ascending order, by binary search: only the probed values are parsed,
+    with fmt. The first and last non-empty values are probed too. None when
+    a probed value does not parse or the probed values are not in ascending
+    order (a newest-first file, say).
+    """
+    watermark = pd.Timestamp(watermark).to_datetime64()
+    present = np.flatnonzero(dates.notna().to_numpy())
+    if len(present) == 0:
+        return None
+    probed = {}
+
+    def probe(position):
+        probed[position] = wall_time(parse_with_format(dates.iloc[position:position + 1], fmt))[0]
+        return probed[position]
+
+    first, last = probe(present[0]), probe(present[-1])
+    if np.isnat(first) or np.isnat(last) or first > last:
+        return None
+    low, high = 0, len(dates)
+    while low < high:
+        middle = (low + high) // 2
+        stamp = probe(middle)
+        if np.isnat(stamp):
+            return None
+        if stamp <= watermark:
+            low = middle + 1
+        else:
+            high = middle
+    if not _ascending(np.array([probed[position] for position in sorted(probed)], dtype="M8[ns]")):
+        return None
+    return low
+
+
+@timed()
+def parse_delta(dates, watermarks, fmt=None):
+    """
+    Parse the rows of a date column that outputs with the given watermarks
+    (None: nothing exported yet, every row is kept) still need.
+    Returns (timestamps, masks): the datetime64[ns] wall times of the whole
+    column, NaT on the leading rows no output needs (they are not parsed),
+    and for each watermark the boolean mask of the rows to export.
+    """
+    dates = pd.Series(dates).reset_index(drop=True)
+    start = 0
+    if watermarks and all(watermark is not None for watermark in watermarks) and dates.dtype == object:
+        if fmt is None:
+            sample = spread_sample(dates.to_numpy())
+            fmt = infer_datetime_format(sample[pd.notna(sample)])
+        if fmt is not None:
+            start = first_row_after(dates, min(watermarks), fmt) or 0
+
+    timestamps = np.full(len(dates), np.datetime64("NaT"), dtype="M8[ns]")
+    timestamps[start:] = wall_time(parse_timestamps(dates.iloc[start:], fmt=fmt)[0])
+    if start and not _ascending(timestamps[start:]):
+        # Not in time order after all: the skipped rows may hold new data too
+        timestamps = wall_time(parse_timestamps(dates, fmt=fmt)[0])
+
+    masks = []
+    for watermark in watermarks:
+        if watermark is None:
+            masks.append(np.ones(len(dates), dtype=bool))
+        else:
+            masks.append(timestamps > pd.Timestamp(watermark).to_datetime64())
+    return timestamps, masks
+
+
+def latest(timestamps, mask=None):
+    """
+    Last timestamp of the (masked) rows as a Timestamp, or None when there is none.
+    """
+    stamps = np.asarray(timestamps, dtype="M8[ns]")
+    if mask is not None:
+        stamps = stamps[mask]
+    stamps = stamps[~np.isnat(stamps)]
+    return pd.Timestamp(stamps.max()) if len(stamps) else None
+
+
+def distinct_watermarks(watermarks):
+    """
+    The different watermarks of a list, None first then in time order, and
+    the position of each watermark among them. Deltas depend on the file and
+    these alone, so they are computed and cached once per distinct watermark.
+    """
+    distinct = sorted(set(watermarks), key=lambda w: (w is not None, pd.Timestamp(w) if w is not None else 0))
+    return tuple(distinct), [distinct.index(watermark) for watermark in watermarks]
+
+
+def delta_summary(dates, watermarks, fmt=None):
+    """
+    parse_delta, plus for each watermark the number of rows to export and
+    their last timestamp: (timestamps, masks, rows, last).
+    """
+    timestamps, masks = parse_delta(dates, watermarks, fmt)
+    return timestamps, masks, [int(mask.sum()) for mask in masks], [latest(timestamps, mask) for mask in masks]
+
+
+def describe_delta(watermark, n_rows):
+    """
+    One line on what an incremental export of a source/variable pair holds.
+    """
+    if watermark is None:
+        return f"No earlier export: all {n_rows:,} rows"
+    return f"{n_rows:,} new rows after {watermark:%Y-%m-%d %H:%M:%S}"
+
+
+# Shared by all pages and sessions of the server process
+watermark_store = WatermarkStore()
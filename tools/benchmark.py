@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the cleaning stages on synthetic inputs (see tools/synthetic_data.py).
+
+Every stage (parse, date standardization, occupancy, numeric extraction,
+merge, gap fill, export) is timed at each dataset size, then run once more
+under tracemalloc to record its memory peak. Results can be saved as JSON and
+compared with an earlier run, so regressions show up as flagged stages.
+
+Run from the repository root:
+    python tools/benchmark.py [--sizes 10k,1m,10m] [--datasets energy_box,temperature,meter]
+                              [--json results.json] [--compare baseline.json]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_cleaning.consumption import clean_consumption, detect_datetime_column, load_file, standardize_dates  # noqa: E402
+from data_cleaning.dates import parse_timestamps  # noqa: E402
+from data_cleaning.energy_box import build_excel_frame, load_energy_box  # noqa: E402
+from data_cleaning.excel import write_xlsx  # noqa: E402
+from data_cleaning.ingest import NamedBytesIO  # noqa: E402
+from data_cleaning.merge import merge_sensor_series  # noqa: E402
+from data_cleaning.numeric import parse_numeric_column  # noqa: E402
+from data_cleaning.occupancy import compile_calendar, label_calendar  # noqa: E402
+from data_cleaning.opinum import build_opinum_zip  # noqa: E402
+from data_cleaning.temperature import read_sensor_file  # noqa: E402
+
+from synthetic_data import dataset  # noqa: E402
+
+DEFAULT_SIZES = "10k,1m"
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), "data_cleaning_bench")
+# The xlsx export writes every cell through xlsxwriter; skip it above this many cells
+DEFAULT_MAX_XLSX_CELLS = 5_000_000
+REGRESSION_THRESHOLD = 1.2
+LOGGER_FILES = 4
+
+OCCUPANCY = [{
+    "days": ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"],
+    "open": pd.to_datetime("08:00").time(),
+    "close": pd.to_datetime("18:00").time(),
+}]
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    for suffix, factor in (("k", 1_000), ("m", 1_000_000)):
+        if text.endswith(suffix):
+            return int(float(text[:-1]) * factor)
+    return int(text)
+
+
+def open_file(path):
+    with open(path, "rb") as f:
+        return NamedBytesIO(f.read(), os.path.basename(path))
+
+
+def energy_box_stages(n_rows, data_dir, max_xlsx_cells):
+    """
+    (stage name, function) pairs; each function takes and updates a shared state dict.
+    """
+    path = dataset("energy_box", n_rows, data_dir)
+    calendar = compile_calendar(OCCUPANCY, pd.to_datetime("07:00").time(), pd.to_datetime("22:00").time())
+
+    def parse(state):
+        state["df"] = load_energy_box(open_file(path))
+
+    def dates(state):
+        state["dates"], state["strategy"] = parse_timestamps(state["df"]["date"])
+
+    def occupancy(state):
+        label_calendar(state["dates"], calendar)
+
+    def numeric(state):
+        for col in state["df"].columns[1:]:
+            parse_numeric_column(state["df"][col])
+
+    def export_opinum(state):
+        df = state["df"]
+        build_opinum_zip(df["date"], [(f"{col}.csv", df[col], "1", "2") for col in df.columns[1:4]])
+
+    def export_xlsx(state):
+        df_excel, _ = build_excel_frame(state["df"], calendar)
+        write_xlsx(df_excel)
+
+    stages = [("parse", parse), ("dates", dates), ("occupancy", occupancy), ("numeric", numeric),
+              ("export_opinum", export_opinum)]
+    if n_rows * 29 <= max_xlsx_cells:
+        stages.append(("export_xlsx", export_xlsx))
+    return stages
+
+
+def temperature_stages(n_rows, data_dir, max_xlsx_cells):
+    per_file = max(1, n_rows // LOGGER_FILES)
+    paths = [
+        dataset("logger_csv" if i % 2 == 0 else "logger_txt", per_file, data_dir, seed=i)
+        for i in range(LOGGER_FILES)
+    ]
+
+    def parse(state):
+        state["sensors"] = [read_sensor_file(open_file(path)) for path in paths]
+
+    def merge(state):
+        state["merged"], _ = merge_sensor_series(state["sensors"])
+
+    def export_xlsx(state):
+        write_xlsx(state["merged"], "MergedData")
+
+    stages = [("parse", parse), ("merge", merge)]
+    if per_file * (LOGGER_FILES + 1) <= max_xlsx_cells:
+        stages.append(("export_xlsx", export_xlsx))
+    return stages
+
+
+def meter_stages(n_rows, data_dir, max_xlsx_cells):
+    path = dataset("meter", n_rows, data_dir)
+
+    def parse(state):
+        state["df"] = load_file(open_file(path))
+
+    def dates(state):
+        df = state["df"].copy()
+        state["standardized"] = standardize_dates(df, detect_datetime_column(df))
+
+    def gap_fill(state):
+        state["cleaned"] = clean_consumption(state["standardized"], freq="15min")[0]
+
+    def export_xlsx(state):
+        write_xlsx(state["cleaned"], "Standardized")
+
+    stages = [("parse", parse), ("dates", dates), ("gap_fill", gap_fill)]
+    if n_rows * 4 <= max_xlsx_cells:
+        stages.append(("export_xlsx", export_xlsx))
+    return stages
+
+
+DATASETS = {
+    "energy_box": energy_box_stages,
+    "temperature": temperature_stages,
+    "meter": meter_stages,
+}
+
+
+def measure(function, state, memory=True):
+    """
+    Return (seconds, peak traced bytes or None) for one call of function(state).
+    The memory pass runs separately, as tracemalloc slows Python code down.
+    """
+    gc.collect()
+    start = time.perf_counter()
+    function(state)
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            function(state)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return seconds, peak
+
+
+def run(datasets, sizes, data_dir, memory=True, max_xlsx_cells=DEFAULT_MAX_XLSX_CELLS, log=print):
+    results = []
+    for name in datasets:
+        for n_rows in sizes:
+            state = {}
+            for stage, function in DATASETS[name](n_rows, data_dir, max_xlsx_cells):
+                seconds, peak = measure(function, state, memory)
+                result = {"dataset": name, "rows": n_rows, "stage": stage, "seconds": seconds, "peak_bytes": peak}
+                results.append(result)
+                log(format_result(result))
+    return results
+
+
+def format_result(result, note=""):
+    peak = "" if result["peak_bytes"] is None else f"{result['peak_bytes'] / 1024 ** 2:10.1f} MB"
+    return (
+        f"{result['dataset']:<12} {result['rows']:>12,} {result['stage']:<14} "
+        f"{result['seconds']:9.3f} s {peak}{note}"
+    )
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD, log=print):
+    """
+    Flag stages slower (or with a higher memory peak) than threshold x the baseline.
+    Returns the number of regressions.
+    """
+    previous = {(r["dataset"], r["rows"], r["stage"]): r for r in baseline}
+    regressions = 0
+    for result in results:
+        old = previous.get((result["dataset"], result["rows"], result["stage"]))
+        if old is None:
+            continue
+        notes = []
+        if result["seconds"] > old["seconds"] * threshold:
+            notes.append(f"time x{result['seconds'] / old['seconds']:.2f}")
+        if result["peak_bytes"] and old.get("peak_bytes") and result["peak_bytes"] > old["peak_bytes"] * threshold:
+            notes.append(f"memory x{result['peak_bytes'] / old['peak_bytes']:.2f}")
+        if notes:
+            regressions += 1
+            log(format_result(result, "  REGRESSION: " + ", ".join(notes)))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time and profile the cleaning stages on synthetic data.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated row counts, e.g. 10k,1m,10m")
+    parser.add_argument("--datasets", default=",".join(DATASETS), help="comma-separated: " + ", ".join(DATASETS))
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="where generated inputs are kept between runs")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--max-xlsx-cells", type=int, default=DEFAULT_MAX_XLSX_CELLS,
+                        help="skip the xlsx export stage above this many cells")
+    parser.add_argument("--json", help="save the results to this file")
+    parser.add_argument("--compare", help="results file of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="ratio to the baseline above which a stage is flagged")
+    args = parser.parse_args(argv)
+
+    datasets = [name.strip() for name in args.datasets.split(",") if name.strip()]
+    unknown = [name for name in datasets if name not in DATASETS]
+    if unknown:
+        parser.error(f"unknown datasets: {', '.join(unknown)}")
+    sizes = [parse_size(size) for size in args.sizes.split(",") if size.strip()]
+
+    results = run(datasets, sizes, args.data_dir, not args.no_memory, args.max_xlsx_cells)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        print(f"{regressions} regression(s) against {args.compare}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
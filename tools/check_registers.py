@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Checks of analyze_register on small hand-made registers: a 0 read on a
+register showing small values, a real reset to 0, a glitch far above the
+trend, a rollover, and interval values that are not cumulative.
+
+Run from the repository root:
+    python tools/check_registers.py
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_cleaning.registers import analyze_register  # noqa: E402
+
+
+def rising(start, n, step=0.1):
+    """
+    n readings of a register rising by step per interval from start.
+    """
+    return start + step * np.arange(n)
+
+
+def check_zero_read():
+    """
+    A 0 read between two readings of the same level is a spike, and the
+    register's rise is spread over the two intervals around it.
+    """
+    readings = np.concatenate([rising(5.0, 3), [0.0], rising(5.3, 3)])
+    register = analyze_register(readings)
+    expected = np.array([np.nan, 0.1, 0.1, 0.05, 0.05, 0.1, 0.1])
+    assert register.is_cumulative
+    assert (register.spikes, register.resets, register.rollovers) == (1, 0, 0), register.summary()
+    assert np.allclose(register.consumption, expected, equal_nan=True), register.consumption
+
+
+def check_reset():
+    """
+    A drop to 0 the register keeps rising from is a reset: the consumption
+    of that step is unknown.
+    """
+    readings = np.concatenate([rising(5.0, 30), rising(0.0, 30)])
+    register = analyze_register(readings)
+    assert register.is_cumulative
+    assert (register.spikes, register.resets, register.rollovers) == (0, 1, 0), register.summary()
+    assert np.isnan(register.consumption[30])
+    assert np.allclose(register.consumption[31:], 0.1)
+
+
+def check_glitch():
+    """
+    One reading far above the trend is a spike, not a reset after it.
+    """
+    readings = rising(1000.0, 40, step=1.0)
+    readings[20] = 1e6
+    register = analyze_register(readings)
+    assert (register.spikes, register.resets, register.rollovers) == (1, 0, 0), register.summary()
+    assert np.allclose(register.consumption[1:], 1.0)
+
+
+def check_rollover():
+    """
+    A drop from near register_max to a small value is a rollover, corrected
+    by register_max.
+    """
+    readings = np.concatenate([rising(970.0, 30, step=1.0), rising(0.0, 30, step=1.0)])
+    register = analyze_register(readings, register_max=1000)
+    assert (register.spikes, register.resets, register.rollovers) == (0, 0, 1), register.summary()
+    assert np.allclose(register.consumption[1:], 1.0)
+
+
+def check_interval_values():
+    """
+    Values that fall about every other step are not a register.
+    """
+    rng = np.random.default_rng(0)
+    register = analyze_register(rng.random(200))
+    assert not register.is_cumulative
+
+
+CHECKS = [check_zero_read, check_reset, check_glitch, check_rollover, check_interval_values]
+
+
+def main():
+    for check in CHECKS:
+        check()
+    print(f"{len(CHECKS)} register checks passed.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
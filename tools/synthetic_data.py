@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Generators of realistic synthetic inputs for the benchmarks (tools/benchmark.py).
+
+- Energy Box CSV exports: a title line, then 'No.', 'Time Stamp' and
+  '<name>  [unit](float)' columns ending with an empty column; some cells
+  carry their unit ("97.7 A") and some are text.
+- Temperature logger exports: CSV ('Time', 'Celsius(°C)') and TXT (latin1,
+  with an index column) with irregular ~15 minute readings.
+- Meter exports: day-first dates, ';' separator, decimal commas, a cumulative
+  register with missing rows and empty readings.
+
+Files are written chunk by chunk, so large sizes do not need the whole
+dataset in memory.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = 200_000
+
+ENERGY_BOX_COLUMNS = [
+    ("Frequency  [Hz]", "Hz", 50, 0.05), ("I A  [A]", "A", 120, 40), ("I B  [A]", "A", 118, 40),
+    ("I C  [A]", "A", 121, 40), ("I N  [A]", "A", 8, 3), ("I Average  [A]", "A", 120, 35),
+    ("Pwr Factor A", "", 0.92, 0.04), ("Pwr Factor B", "", 0.91, 0.04), ("Pwr Factor C", "", 0.93, 0.04),
+    ("Pwr Factor Total", "", 0.92, 0.03), ("VA A  [kVA]", "kVA", 27, 9), ("VA B  [kVA]", "kVA", 26, 9),
+    ("VA C  [kVA]", "kVA", 27, 9), ("VA Total  [kVA]", "kVA", 80, 25), ("Volts AN  [V]", "V", 230, 2),
+    ("Volts BN  [V]", "V", 231, 2), ("Volts CN  [V]", "V", 229, 2), ("Volts LN Average  [V]", "V", 230, 1.5),
+    ("Volts AB  [V]", "V", 399, 3), ("Volts BC  [V]", "V", 400, 3), ("Volts CA  [V]", "V", 398, 3),
+    ("Volts LL Average  [V]", "V", 399, 2), ("Watt A  [kW]", "kW", 25, 8), ("Watt B  [kW]", "kW", 24, 8),
+    ("Watt C  [kW]", "kW", 25, 8), ("Watt Total  [kW]", "kW", 74, 24),
+]
+
+
+def _chunks(n_rows, chunksize=CHUNK_ROWS):
+    for start in range(0, n_rows, chunksize):
+        yield start, min(start + chunksize, n_rows)
+
+
+def _daily_profile(times, base, amplitude, rng):
+    """
+    Values following a day/night cycle with noise.
+    """
+    hours = times.hour.to_numpy() + times.minute.to_numpy() / 60
+    cycle = np.sin((hours - 6) / 24 * 2 * np.pi).clip(0)
+    return base + amplitude * (cycle - 0.5) + rng.normal(0, amplitude * 0.1, len(times))
+
+
+def write_energy_box_csv(path, n_rows, unit_share=0.05, text_share=0.001, seed=0):
+    """
+    Energy Box export with one reading per minute.
+    """
+    rng = np.random.default_rng(seed)
+    header = ["No.", "Time Stamp"] + [f"{name}(float)" for name, _, _, _ in ENERGY_BOX_COLUMNS] + [""]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("Energy Box export\n")
+        f.write(",".join(header) + "\n")
+        for start, stop in _chunks(n_rows):
+            times = pd.date_range("2024-01-01", periods=stop - start, freq="min") + pd.Timedelta(minutes=start)
+            chunk = {"No.": np.arange(start, stop), "Time Stamp": times.strftime("%d/%m/%Y %H:%M:%S")}
+            for name, unit, base, amplitude in ENERGY_BOX_COLUMNS:
+                values = pd.Series(_daily_profile(times, base, amplitude, rng).round(3)).astype(str)
+                if unit:
+                    with_unit = rng.random(len(values)) < unit_share
+                    values[with_unit] = values[with_unit] + f" {unit}"
+                values[rng.random(len(values)) < text_share] = "L"
+                chunk[f"{name}(float)"] = values
+            chunk[""] = ""
+            pd.DataFrame(chunk, columns=header).to_csv(f, index=False, header=False)
+    return path
+
+
+def write_logger_csv(path, n_rows, seed=0):
+    """
+    Temperature logger CSV with readings every ~15 minutes (with jitter).
+    """
+    rng = np.random.default_rng(seed)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("Time,Celsius(°C)\n")
+        for start, stop in _chunks(n_rows):
+            seconds = np.arange(start, stop) * 900 + rng.integers(-60, 60, stop - start)
+            times = pd.Timestamp("2024-01-01") + pd.to_timedelta(seconds, unit="s")
+            values = _daily_profile(times, 20, 4, rng).round(2)
+            pd.DataFrame({"Time": times.strftime("%Y-%m-%d %H:%M:%S"), "Celsius(°C)": values}).to_csv(
+                f, index=False, header=False
+            )
+    return path
+
+
+def write_logger_txt(path, n_rows, seed=0):
+    """
+    Temperature logger TXT export (latin1, index column first).
+    """
+    rng = np.random.default_rng(seed)
+    with open(path, "w", encoding="latin1", newline="") as f:
+        f.write("No.,Time,Celsius(°C)\n")
+        for start, stop in _chunks(n_rows):
+            seconds = np.arange(start, stop) * 900 + rng.integers(-60, 60, stop - start)
+            times = pd.Timestamp("2024-01-01") + pd.to_timedelta(seconds, unit="s")
+            values = _daily_profile(times, 20, 4, rng).round(2)
+            pd.DataFrame({
+                "No.": np.arange(start, stop) + 1,
+                "Time": times.strftime("%Y-%m-%d %H:%M:%S"),
+                "Celsius(°C)": values,
+            }).to_csv(f, index=False, header=False)
+    return path
+
+
+def write_meter_csv(path, n_rows, gap_share=0.01, empty_share=0.005, seed=0):
+    """
+    Cumulative meter export at 15 minute intervals, with dropped rows and empty readings.
+    """
+    rng = np.random.default_rng(seed)
+    total = 10_000.0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("Date;Consumption kWh\n")
+        for start, stop in _chunks(n_rows):
+            times = pd.Timestamp("2024-01-01") + pd.to_timedelta(np.arange(start, stop) * 15, unit="min")
+            usage = np.abs(_daily_profile(times, 2, 3, rng))
+            register = total + np.cumsum(usage)
+            total = register[-1]
+            values = pd.Series(register.round(3)).astype(str).str.replace(".", ",", regex=False)
+            values[rng.random(len(values)) < empty_share] = ""
+            keep = rng.random(len(values)) >= gap_share
+            pd.DataFrame({"Date": times.strftime("%d/%m/%Y %H:%M")[keep], "Consumption kWh": values[keep]}).to_csv(
+                f, sep=";", index=False, header=False
+            )
+    return path
+
+
+GENERATORS = {
+    "energy_box": (write_energy_box_csv, "csv"),
+    "logger_csv": (write_logger_csv, "csv"),
+    "logger_txt": (write_logger_txt, "txt"),
+    "meter": (write_meter_csv, "csv"),
+}
+
+
+def dataset(kind, n_rows, data_dir, seed=0):
+    """
+    Path of a generated dataset, created on first use and reused afterwards.
+    """
+    write, extension = GENERATORS[kind]
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"{kind}_{n_rows}_{seed}.{extension}")
+    if not os.path.exists(path):
+        tmp_path = path + ".tmp"
+        write(tmp_path, n_rows, seed=seed)
+        os.replace(tmp_path, path)
+    return path